@@ -1,16 +1,27 @@
-import google.generativeai as genai
-from django.conf import settings
+from . import llm_cache
+from .llm_backends import get_backend
 
-# Configure the Gemini API
-genai.configure(api_key=settings.GEMINI_API_KEY)
 
-def get_ai_response(prompt):
+def get_ai_response(prompt, backend=None, timeout=None):
     """
-    Send a text prompt to Google Gemini and return the model's response.
+    Send a text prompt to the configured LLM backend (Gemini by default) and
+    return the model's response. Raises LLMError on failure.
     """
-    try:
-        model = genai.GenerativeModel("gemini-2.5-flash")  # Fast, free, text model
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"⚠️ Error: {e}"
+    backend = backend or get_backend()
+    return backend.generate(prompt, timeout=timeout)
+
+
+def get_cached_ai_response(prompt, template_version, backend=None):
+    """
+    Like get_ai_response, but served from the content-addressed LLM cache when
+    the same normalized prompt was already answered for this model and
+    prompt-template version. Only successful responses are cached.
+    """
+    backend = backend or get_backend()
+    key = llm_cache.cache_key(prompt, backend.model_name, template_version)
+    cached = llm_cache.lookup(key)
+    if cached is not None:
+        return cached
+    text = get_ai_response(prompt, backend=backend)
+    llm_cache.store(key, text, backend.model_name, template_version)
+    return text
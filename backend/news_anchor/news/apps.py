@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from .render_queue import dispatch_pending, is_serving_process
+
+        # Resume queued and retrying jobs after a restart without waiting for a new request
+        if is_serving_process():
+            dispatch_pending()
@@ -0,0 +1,210 @@
+"""
+Content-addressed store for synthesized audio.
+
+Each MP3 is stored once under news_audios/blobs/ keyed by a hash of
+(script text, voice, model, speed); ArticleAudio maps articles to blobs, so
+identical text rendered for several articles is synthesized once and a
+regenerated script gets a new key instead of stale audio. The store keeps
+its total size under TTS_AUDIO_CACHE_MAX_BYTES by evicting the least
+recently accessed blobs.
+"""
+import hashlib
+import logging
+import os
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from . import media_probe
+from .models import ArticleAudio, AudioBlob, RenderJob, RenderLease
+from .utils import write_atomic
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = Path(settings.BASE_DIR) / "news_audios" / "blobs"
+
+
+def audio_digest(text: str, voice: str, model_name: str, speed: float) -> str:
+    payload = "\x1f".join([model_name, voice, f"{speed:.3f}", text.strip()])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def blob_path(digest: str) -> Path:
+    return BLOB_DIR / digest[:2] / f"{digest}.mp3"
+
+
+class AudioStoreStats:
+    """Process-wide counters; lifetime totals come from AudioBlob.hits."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.bytes_saved = self.evictions = 0
+
+    def record_hit(self, size):
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += size
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def record_evictions(self, count):
+        with self.lock:
+            self.evictions += count
+
+    def as_dict(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
+
+
+stats = AudioStoreStats()
+
+
+def lookup(digest: str):
+    """
+    Return the AudioBlob for a digest if its file is still on disk (recording
+    a hit), else None. Rows whose file disappeared are dropped.
+    """
+    blob = AudioBlob.objects.filter(digest=digest).first()
+    if blob is None:
+        return None
+    if not Path(blob.path).exists():
+        blob.delete()
+        return None
+    AudioBlob.objects.filter(pk=blob.pk).update(hits=F("hits") + 1, last_accessed_at=timezone.now())
+    stats.record_hit(blob.size_bytes)
+    return blob
+
+
+def register_blob(digest: str, size: int, voice: str, model_name: str, speed: float) -> AudioBlob:
+    """
+    Create/refresh the AudioBlob row for a file already written to
+    blob_path(digest), and record its duration/format while it is fresh.
+    """
+    blob, _ = AudioBlob.objects.update_or_create(
+        digest=digest,
+        defaults={
+            "path": str(blob_path(digest)), "size_bytes": size, "voice": voice,
+            "model_name": model_name, "speed": speed, "last_accessed_at": timezone.now(),
+        },
+    )
+    media_probe.probe(blob.path)
+    return blob
+
+
+def save(digest: str, audio_bytes: bytes, voice: str, model_name: str, speed: float) -> AudioBlob:
+    """Write audio bytes atomically into the store and register the blob."""
+    write_atomic(blob_path(digest), audio_bytes)
+    return register_blob(digest, len(audio_bytes), voice, model_name, speed)
+
+
+def register_file(digest: str, source: Path, voice: str, model_name: str, speed: float) -> AudioBlob:
+    """
+    Adopt an already rendered MP3 (e.g. a legacy script_<id>.mp3) into the
+    store. The file is moved, not copied, so its bytes are counted against the
+    quota once instead of living on outside it.
+    """
+    target = blob_path(digest)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(source, target)
+    except OSError:
+        # Different filesystem: copy into place, then drop the original
+        write_atomic(target, Path(source).read_bytes())
+        Path(source).unlink(missing_ok=True)
+    return register_blob(digest, target.stat().st_size, voice, model_name, speed)
+
+
+def assign(news_id: int, blob: AudioBlob):
+    ArticleAudio.objects.update_or_create(news_id=news_id, defaults={"blob": blob})
+
+
+def current_digests(news_ids):
+    """{news_id: digest} for articles that have audio whose file is on disk."""
+    rows = ArticleAudio.objects.filter(news_id__in=list(news_ids)).values_list("news_id", "blob__digest", "blob__path")
+    return {news_id: digest for news_id, digest, path in rows if Path(path).exists()}
+
+
+def protected_digests() -> set:
+    """
+    Digests in use right now: texts another request is synthesizing (live
+    "tts:" leases) and the audio of articles whose avatar video is being
+    rendered (live "avatar:" leases or running jobs), which the lip-sync step
+    reads long after the audio was looked up.
+    """
+    leases = RenderLease.objects.filter(expires_at__gt=timezone.now()).filter(
+        Q(key__startswith="tts:") | Q(key__startswith="avatar:")
+    ).values_list("key", flat=True)
+    digests, rendering = set(), set()
+    for key in leases:
+        kind, _, value = key.partition(":")
+        if kind == "tts":
+            digests.add(value)
+        elif value.isdigit():
+            rendering.add(int(value))
+    rendering.update(RenderJob.objects.filter(state=RenderJob.RUNNING).values_list("news_id", flat=True))
+    if rendering:
+        digests.update(ArticleAudio.objects.filter(news_id__in=rendering).values_list("blob__digest", flat=True))
+    return digests
+
+
+def enforce_quota(keep=()):
+    """
+    Evict least-recently-accessed blobs until the store fits the byte quota.
+    Never evicted: digests in `keep`, blobs accessed within the last
+    TTS_AUDIO_EVICT_GRACE seconds (a concurrent render may have saved one
+    and not yet linked or served it) and protected_digests().
+    Returns bytes freed.
+    """
+    max_bytes = getattr(settings, "TTS_AUDIO_CACHE_MAX_BYTES", 2 * 1024 ** 3)
+    total = AudioBlob.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+    if total <= max_bytes:
+        return 0
+
+    grace = timezone.now() - timedelta(seconds=getattr(settings, "TTS_AUDIO_EVICT_GRACE", 300))
+    candidates = (
+        AudioBlob.objects.exclude(digest__in=set(keep) | protected_digests())
+        .filter(last_accessed_at__lt=grace)
+        .order_by("last_accessed_at")
+    )
+    freed = 0
+    evicted = 0
+    for blob in candidates.iterator():
+        if total - freed <= max_bytes:
+            break
+        Path(blob.path).unlink(missing_ok=True)
+        blob.delete()  # cascades to ArticleAudio; the article re-renders on next request
+        freed += blob.size_bytes
+        evicted += 1
+
+    stats.record_evictions(evicted)
+    logger.info("Audio store evicted %d blobs (%d bytes) to stay under %d bytes", evicted, freed, max_bytes)
+    return freed
+
+
+def store_stats() -> dict:
+    totals = AudioBlob.objects.aggregate(
+        blobs_bytes=Sum("size_bytes"),
+        lifetime_hits=Sum("hits"),
+        lifetime_bytes_saved=Sum(F("hits") * F("size_bytes")),
+    )
+    return {
+        "process": stats.as_dict(),
+        "blobs": AudioBlob.objects.count(),
+        "bytes_used": totals["blobs_bytes"] or 0,
+        "quota_bytes": getattr(settings, "TTS_AUDIO_CACHE_MAX_BYTES", 2 * 1024 ** 3),
+        "lifetime_hits": totals["lifetime_hits"] or 0,
+        "lifetime_bytes_saved": totals["lifetime_bytes_saved"] or 0,
+    }
@@ -0,0 +1,369 @@
+"""
+The avatar video pipeline: script -> TTS -> lip-synced video -> audio
+verification/merge -> validation, for one article.
+
+run_avatar_pipeline() is used both by the render job queue
+(news/render_queue.py) and by the synchronous /api/avatar/<id>/?sync=1 path.
+Progress is reported through a StepTracker, which the job queue uses to
+persist per-step timings and to stop the pipeline when a job is cancelled.
+"""
+import logging
+import math
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from .compositor import normalize_rendered_clip
+from .dedup import get_canonical
+from .face_cache import generator_kwargs
+from .hls import package_after_render, package_reused
+from .media_merge import merge_audio_video
+from .media_probe import probe as probe_media
+from .models import NewsArticle
+from .script_generation import generate_or_get_script
+from .scheduler import CPUSlots, threads_per_job
+from .segmented_render import (
+    SegmentedRenderError, render_segmented, segment_workers, segmented_mode_enabled,
+)
+from .tts import tts_generate_for_article
+from .single_flight import SingleFlightTimeout, run_single_flight
+from .utils import atomic_output, link_or_copy
+
+logger = logging.getLogger(__name__)
+
+VIDEO_DIR = Path(settings.BASE_DIR) / "news_videos"
+VIDEO_DIR.mkdir(parents=True, exist_ok=True)
+
+PIPELINE_STEPS = [
+    "Initial Setup",
+    "Script Generation",
+    "Audio Generation",
+    "Module Check",
+    "Video Generation",
+    "Audio Verification",
+    "Final Validation",
+]
+
+
+class PipelineError(Exception):
+    """A pipeline step failed; `status` is the HTTP status to report."""
+
+    def __init__(self, message, status=500, retryable=True):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class JobCancelled(Exception):
+    """The job was cancelled between pipeline steps."""
+
+
+class StepTracker:
+    """
+    Logs step start/end with timings. Subclasses persist progress
+    (see render_queue.JobStepTracker) and may raise JobCancelled from
+    check_cancelled(), which the pipeline calls before every step.
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.current_step = None
+
+    def check_cancelled(self):
+        pass
+
+    def start_step(self, name):
+        self.check_cancelled()
+        self.current_step = name
+        self.steps[name] = {"status": "running", "started_at": time.time()}
+        logger.info("STEP STARTED: %s", name)
+        self.on_change()
+
+    def end_step(self, name, success=True, info=None):
+        step = self.steps.get(name)
+        if step is None:
+            return
+        duration = time.time() - step["started_at"]
+        step.update({"status": "success" if success else "failed", "seconds": round(duration, 3)})
+        if info:
+            step["info"] = str(info)
+        logger.info("%s STEP %s (%.2fs) %s", "✅" if success else "❌", name, duration, f"- {info}" if info else "")
+        self.on_change()
+
+    def progress(self) -> float:
+        done = sum(1 for s in self.steps.values() if s["status"] != "running")
+        return round(min(done / len(PIPELINE_STEPS), 1.0), 3)
+
+    def on_change(self):
+        pass
+
+
+# ---------------------------
+# FFmpeg / media utilities
+# ---------------------------
+def get_audio_duration(audio_path: str) -> float:
+    """Get media duration (cached ffprobe, see news/media_probe.py)"""
+    info = probe_media(audio_path)
+    if info is None:
+        logger.warning("Could not get audio duration for %s", audio_path)
+        return 0.0
+    return info.duration
+
+
+def verify_video_has_audio(video_path: str) -> bool:
+    """Return True if ffprobe finds an audio stream."""
+    info = probe_media(video_path)
+    return bool(info and info.has_audio)
+
+
+# ---------------------------
+# Avatar module
+# ---------------------------
+# Try to import avatar generation module at runtime; if not present mark unavailable.
+try:
+    # adjust path if your module is stored outside Python path
+    AVATAR_MODULE_PATH = os.path.join(os.path.expanduser("~"), "OneDrive", "Desktop",
+                                      "personalized-news-anchor", "ai_models", "AI-Commentator-Avatar", "modules")
+    if AVATAR_MODULE_PATH not in os.sys.path:
+        os.sys.path.append(AVATAR_MODULE_PATH)
+    from avatar_generation import generate_lip_synced_video, generate_lip_synced_video_simple  # type: ignore
+    AVATAR_GENERATION_AVAILABLE = True
+    logger.info("Avatar generation module loaded")
+except Exception as e:
+    logger.warning("Avatar generation module not available: %s", e)
+    AVATAR_GENERATION_AVAILABLE = False
+
+    def generate_lip_synced_video(*args, **kwargs):
+        return None
+
+    def generate_lip_synced_video_simple(*args, **kwargs):
+        return None
+
+
+def run_avatar_pipeline(news_id, tracker: Optional[StepTracker] = None) -> dict:
+    """
+    Full automatic pipeline: ensure script -> TTS -> avatar lip-synced video -> verify/merge audio if needed.
+    Returns the result metadata; raises PipelineError (or JobCancelled) on failure.
+    Every step is safe to re-run, so a failed or interrupted job can simply be retried.
+
+    Renders of the same article are single-flight across processes: a call
+    that finds one in progress waits for it and returns its video.
+    """
+    tracker = tracker or StepTracker()
+    started = time.time()
+    output_path = VIDEO_DIR / f"{news_id}.mp4"
+
+    def reuse():
+        # A video (re)written after this call started came from a concurrent render
+        try:
+            stat = output_path.stat()
+        except OSError:
+            return None
+        if max(stat.st_mtime, stat.st_ctime) < started:
+            return None
+        info = probe_media(output_path)
+        article = NewsArticle.objects.filter(id=news_id).only("title").first()
+        return {
+            "status": "success",
+            "news_id": str(news_id),
+            "execution_time": f"{time.time() - started:.2f}s",
+            "has_audio": bool(info and info.has_audio),
+            "video_path": str(output_path),
+            "file_size_mb": round(stat.st_size / (1024 * 1024), 2),
+            "duration_seconds": round(info.duration, 2) if info else 0.0,
+            "title": article.title if article else "",
+            "shared_render": True,
+        }
+
+    try:
+        result, _ = run_single_flight(
+            f"avatar:{news_id}", lambda: _render_avatar(news_id, tracker, output_path), reuse,
+            wait_timeout=getattr(settings, "AVATAR_SINGLE_FLIGHT_WAIT", 1800),
+        )
+    except SingleFlightTimeout as e:
+        # No CPU slot, or a concurrent render of the article, within the wait limit
+        raise PipelineError(f"Render timed out waiting: {e}", status=503, retryable=True) from e
+    return result
+
+
+def _produced(path) -> bool:
+    # The temp output exists (empty) before the generator runs, so check the size too
+    return bool(path) and os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def _render_avatar(news_id, tracker: StepTracker, output_path: Path) -> dict:
+    start_step, end_step = tracker.start_step, tracker.end_step
+    start_time = time.time()
+
+    start_step("Initial Setup")
+    article = NewsArticle.objects.filter(id=news_id).first()
+    if not article:
+        end_step("Initial Setup", False, f"No article id={news_id}")
+        raise PipelineError(f"No article found with ID {news_id}", status=404, retryable=False)
+    end_step("Initial Setup", True, f"Processing: {article.title}")
+
+    # Near-duplicate of an already rendered story: reuse its video
+    canonical = get_canonical(article)
+    canonical_video = VIDEO_DIR / f"{canonical.id}.mp4" if canonical else None
+    if canonical_video and canonical_video.exists() and not output_path.exists():
+        start_step("Canonical Reuse")
+        if link_or_copy(canonical_video, output_path):
+            end_step("Canonical Reuse", True, f"Reused video of article {canonical.id}")
+            hls = None
+            if getattr(settings, "HLS_ENABLED", True):
+                # Usually just hard links to the canonical's ladder; packages otherwise
+                with CPUSlots(1, check_cancelled=tracker.check_cancelled):
+                    hls = package_reused(news_id, canonical.id, output_path)
+            return {
+                "status": "success",
+                "news_id": str(news_id),
+                "execution_time": f"{time.time() - start_time:.2f}s",
+                "has_audio": verify_video_has_audio(str(output_path)),
+                "video_path": str(output_path),
+                "file_size_mb": round(os.path.getsize(output_path) / (1024 * 1024), 2),
+                "reused_from": canonical.id,
+                "hls": hls,
+                "title": article.title
+            }
+        end_step("Canonical Reuse", False, "Falling back to a full render")
+
+    # Script generation / retrieval
+    start_step("Script Generation")
+    script_obj, created = generate_or_get_script(article)
+    if not script_obj:
+        end_step("Script Generation", False, "Script generation failed")
+        raise PipelineError("Script generation failed")
+    end_step("Script Generation", True, f"{'Created' if created else 'Existing'} script")
+
+    # Audio generation (use helper)
+    start_step("Audio Generation")
+    audio_path, audio_err = tts_generate_for_article(int(news_id))
+    if audio_err:
+        end_step("Audio Generation", False, audio_err)
+        raise PipelineError(f"Audio generation failed: {audio_err}")
+    end_step("Audio Generation", True, f"Audio at {audio_path}")
+
+    # Check avatar module
+    start_step("Module Check")
+    if not AVATAR_GENERATION_AVAILABLE:
+        end_step("Module Check", False, "Avatar generation module missing")
+        raise PipelineError("Avatar generation module not available", retryable=False)
+    end_step("Module Check", True, "Avatar module ready")
+
+    # Prepare output path and call avatar generator (primary then simplified).
+    # Everything is rendered into a temp file that replaces <id>.mp4 only once
+    # it is complete, so readers never see a partial or half-merged video.
+    start_step("Video Generation")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Lip-sync and encodes are CPU-heavy: wait for enough CPU slots (news/scheduler.py)
+    slots_needed = math.ceil(segment_workers() / threads_per_job()) if segmented_mode_enabled() else 1
+    with CPUSlots(slots_needed, check_cancelled=tracker.check_cancelled) as cpu_slots:
+        segmented = None
+        with atomic_output(output_path) as tmp_video:
+            result_video = None
+            if segmented_mode_enabled():
+                # Render pieces of the audio on several cores; falls back to a single pass
+                try:
+                    segmented = render_segmented(
+                        audio_path, tmp_video, news_id, check_cancelled=tracker.check_cancelled
+                    )
+                    result_video = str(tmp_video)
+                except SegmentedRenderError as e:
+                    logger.warning("Segmented render failed (%s); rendering in a single pass", e)
+
+            if not _produced(result_video):
+                # Call generator
+                result_video = generate_lip_synced_video(
+                    audio_path=str(audio_path),
+                    output_path=str(tmp_video),
+                    news_id=news_id,
+                    **generator_kwargs(generate_lip_synced_video)  # face_path + cached face template (news/face_cache.py)
+                )
+
+            if not _produced(result_video):
+                logger.warning("Primary avatar generation failed, trying simplified method")
+                tracker.check_cancelled()
+                result_video = generate_lip_synced_video_simple(
+                    audio_path=str(audio_path),
+                    output_path=str(tmp_video),
+                    news_id=news_id,
+                    **generator_kwargs(generate_lip_synced_video_simple)  # face_path + cached face template (news/face_cache.py)
+                )
+
+            if not _produced(result_video):
+                end_step("Video Generation", False, "No output produced by avatar generators")
+                raise PipelineError("Video generation failed - no output created")
+            if Path(result_video).resolve() != tmp_video.resolve():
+                # Generator wrote somewhere else; bring it into our temp file
+                os.replace(result_video, tmp_video)
+            end_step("Video Generation", True, f"Video created: {output_path}"
+                     + (f" ({len(segmented['segments'])} segments)" if segmented else ""))
+
+            # Verify audio, attempt emergency merge if missing
+            start_step("Audio Verification")
+            final_has_audio = verify_video_has_audio(str(tmp_video))
+            merge_info = None
+            if not final_has_audio:
+                logger.warning("Generated video missing audio; attempting emergency merge")
+                emergency_output = tmp_video.with_suffix(".emergency.mp4")
+                try:
+                    merge = merge_audio_video(tmp_video, audio_path, emergency_output)
+                    if merge.ok:
+                        os.replace(emergency_output, tmp_video)
+                finally:
+                    emergency_output.unlink(missing_ok=True)
+                emergency_merged = merge.ok
+                merge_info = merge.to_dict()
+
+                if emergency_merged:
+                    final_has_audio = verify_video_has_audio(str(tmp_video))
+                    end_step("Audio Verification", True, f"Audio restored by emergency merge ({merge.strategy})")
+                else:
+                    end_step("Audio Verification", False, "Audio not restored after merges")
+                    # Continue but mark as missing
+            else:
+                end_step("Audio Verification", True, "Audio present in generated video")
+
+    # Final validation and metadata
+    start_step("Final Validation")
+    if not os.path.exists(output_path):
+        end_step("Final Validation", False, "Final file missing")
+        raise PipelineError("Final output file not found")
+
+    file_size = os.path.getsize(output_path) / (1024 * 1024)
+    final_duration = 0.0
+    if final_has_audio:
+        final_duration = get_audio_duration(str(output_path)) or get_audio_duration(str(audio_path))
+
+    end_step("Final Validation", True,
+             f"Size: {file_size:.1f}MB Duration: {final_duration:.2f}s Audio: {final_has_audio}")
+
+    # Pre-normalize for the bulletin compositor so daily assembly is copy-only
+    if getattr(settings, "BULLETIN_NORMALIZE_ON_RENDER", True):
+        with CPUSlots(1, check_cancelled=tracker.check_cancelled):
+            normalize_rendered_clip(output_path)
+
+    # Adaptive-bitrate HLS ladder next to the mp4 (news/hls.py)
+    hls = None
+    if getattr(settings, "HLS_ENABLED", True):
+        with CPUSlots(1, check_cancelled=tracker.check_cancelled):
+            hls = package_after_render(news_id, output_path)
+
+    logger.info("AVATAR GENERATION COMPLETED for %s", news_id)
+    return {
+        "status": "success",
+        "news_id": str(news_id),
+        "execution_time": f"{time.time() - start_time:.2f}s",
+        "has_audio": bool(final_has_audio),
+        "video_path": str(output_path),
+        "file_size_mb": round(file_size, 2),
+        "duration_seconds": round(final_duration, 2),
+        "merge": merge_info,
+        "segmented": segmented,
+        "cpu_slot_wait_seconds": round(cpu_slots.wait_seconds, 2),
+        "hls": hls,
+        "title": article.title
+    }
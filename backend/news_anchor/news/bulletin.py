@@ -0,0 +1,217 @@
+"""
+Batch bulletin builder: script -> TTS -> avatar render for a set of articles.
+
+The stages run as a pipeline with one queue and one worker pool per stage,
+so the network-bound stages (Gemini, TTS) for article k+1 run while article
+k is rendering on the CPU. Each stage has its own concurrency limit
+(BULLETIN_*_WORKERS); the render stage defaults to the number of CPU slots
+(news/scheduler.py). Per-stage busy time, queue wait and throughput are
+recorded for the report printed by `manage.py build_bulletin`.
+"""
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from .avatar_pipeline import VIDEO_DIR, PipelineError, run_avatar_pipeline
+from .models import NewsArticle
+from .scheduler import slot_count
+from .script_generation import generate_or_get_script
+from .tts import tts_generate_for_article
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class BulletinItem:
+    news_id: int
+    title: str
+    position: int
+    script_id: Optional[int] = None
+    audio_path: Optional[str] = None
+    video_path: Optional[str] = None
+    error: Optional[str] = None
+    failed_stage: Optional[str] = None
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    enqueued_at: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class StageStats:
+    def __init__(self, workers):
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.processed = self.failed = 0
+        self.busy_seconds = self.queue_wait_seconds = 0.0
+        self.first_start = self.last_end = None
+
+    def record(self, started, ended, waited, ok):
+        with self.lock:
+            self.processed += 1
+            self.failed += 0 if ok else 1
+            self.busy_seconds += ended - started
+            self.queue_wait_seconds += waited
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    def as_dict(self, wall_seconds):
+        with self.lock:
+            active = (self.last_end - self.first_start) if self.processed else 0.0
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 2),
+                "active_seconds": round(active, 2),
+                # Items per minute while the stage had work
+                "throughput_per_min": round(self.processed / active * 60, 2) if active else 0.0,
+                # Share of the stage's worker time spent working over the whole run
+                "utilization": round(self.busy_seconds / (wall_seconds * self.workers), 3) if wall_seconds else 0.0,
+                "avg_queue_wait_seconds": round(self.queue_wait_seconds / self.processed, 2) if self.processed else 0.0,
+            }
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[BulletinItem], None], workers: int):
+        self.name = name
+        self.func = func
+        self.workers = max(workers, 1)
+        self.queue = queue.Queue()
+        self.stats = StageStats(self.workers)
+
+
+class StagedPipeline:
+    """
+    Runs items through `stages` in order. A stage function updates the item
+    in place and raises to fail it; failed items skip the remaining stages.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.finished = []
+        self.finished_lock = threading.Lock()
+        self.wall_seconds = 0.0
+
+    def _forward(self, index, item):
+        if item.ok and index + 1 < len(self.stages):
+            item.enqueued_at = time.monotonic()
+            self.stages[index + 1].queue.put(item)
+        else:
+            with self.finished_lock:
+                self.finished.append(item)
+
+    def _worker(self, index, remaining, remaining_lock):
+        stage = self.stages[index]
+        try:
+            while True:
+                item = stage.queue.get()
+                if item is _DONE:
+                    break
+                started = time.monotonic()
+                try:
+                    stage.func(item)
+                except Exception as e:
+                    if not isinstance(e, PipelineError):
+                        logger.exception("Bulletin stage %s failed for article %s", stage.name, item.news_id)
+                    item.error = str(e)
+                    item.failed_stage = stage.name
+                ended = time.monotonic()
+                item.stage_seconds[stage.name] = round(ended - started, 2)
+                stage.stats.record(started, ended, started - item.enqueued_at, item.ok)
+                self._forward(index, item)
+        finally:
+            # The last worker of a stage to finish closes the next stage's queue
+            with remaining_lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    self.stages[index + 1].queue.put(_DONE)
+            connection.close()
+
+    def run(self, items: List[BulletinItem]) -> List[BulletinItem]:
+        started = time.monotonic()
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index, remaining, remaining_lock),
+                    name=f"bulletin-{stage.name}-{n}", daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            item.enqueued_at = time.monotonic()
+            first.queue.put(item)
+        for _ in range(first.workers):
+            first.queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.monotonic() - started
+        return sorted(self.finished, key=lambda item: item.position)
+
+    def report(self) -> dict:
+        return {stage.name: stage.stats.as_dict(self.wall_seconds) for stage in self.stages}
+
+
+def script_stage(item: BulletinItem):
+    article = NewsArticle.objects.get(id=item.news_id)
+    script_obj, _ = generate_or_get_script(article)
+    if not script_obj:
+        raise PipelineError("Script generation failed")
+    item.script_id = script_obj.id
+
+
+def tts_stage(item: BulletinItem):
+    audio_path, error = tts_generate_for_article(item.news_id)
+    if error:
+        raise PipelineError(f"Audio generation failed: {error}")
+    item.audio_path = str(audio_path)
+
+
+def make_render_stage(rerender=False):
+    def render_stage(item: BulletinItem):
+        existing = VIDEO_DIR / f"{item.news_id}.mp4"
+        if existing.exists() and not rerender:
+            item.video_path = str(existing)
+            return
+        result = run_avatar_pipeline(item.news_id)
+        item.video_path = result["video_path"]
+    return render_stage
+
+
+def select_articles(category=None, limit=10):
+    articles = NewsArticle.objects.order_by("-published_at")
+    if category:
+        articles = articles.filter(category__iexact=category)
+    return list(articles.only("id", "title")[:limit])
+
+
+def build_pipeline(script_workers=None, tts_workers=None, render_workers=None, rerender=False) -> StagedPipeline:
+    return StagedPipeline([
+        Stage("script", script_stage, script_workers or getattr(settings, "BULLETIN_SCRIPT_WORKERS", 2)),
+        Stage("tts", tts_stage, tts_workers or getattr(settings, "BULLETIN_TTS_WORKERS", 2)),
+        Stage("render", make_render_stage(rerender),
+              render_workers or getattr(settings, "BULLETIN_RENDER_WORKERS", 0) or slot_count()),
+    ])
+
+
+def build_bulletin(articles, **pipeline_options):
+    """Run the staged pipeline over `articles`. Returns (items, pipeline)."""
+    items = [BulletinItem(news_id=a.id, title=a.title, position=i) for i, a in enumerate(articles)]
+    pipeline = build_pipeline(**pipeline_options)
+    return pipeline.run(items), pipeline
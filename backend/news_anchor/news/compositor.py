@@ -0,0 +1,264 @@
+"""
+Bulletin compositor: joins per-article clips into one video (or podcast
+MP3) without re-encoding at assembly time.
+
+Every clip is normalized once to a single encoding profile (resolution,
+frame rate, pixel format, codecs, sample rate, timebase) - right after the
+avatar render (BULLETIN_NORMALIZE_ON_RENDER) or, failing that, the first
+time it is used. Normalized copies live in news_videos/normalized/ (and
+news_audios/normalized/) and are keyed by the source's size/mtime and the
+profile, so an edited clip or a profile change is normalized again. MP3s
+end up without tags or a Xing/LAME info frame (one that already matches
+the profile is only stripped, not re-encoded), so none of those land in
+the middle of a podcast episode. Assembly is then just ffmpeg's concat
+demuxer with `-c copy`.
+
+Optional pre-rendered intro/outro/transition clips go through the same
+normalization. The output is cached under a hash of the ordered inputs
+and is only rebuilt when that ordered set changes.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+
+from .media_merge import run_ffmpeg
+from .media_probe import probe
+from .utils import atomic_output, write_atomic
+
+logger = logging.getLogger(__name__)
+
+VIDEO_DIR = Path(settings.BASE_DIR) / "news_videos"
+AUDIO_DIR = Path(settings.BASE_DIR) / "news_audios"
+BULLETIN_DIR = VIDEO_DIR / "bulletins"
+
+
+class CompositorError(Exception):
+    """A clip could not be normalized or the bulletin could not be assembled."""
+
+
+def video_profile() -> dict:
+    return {
+        "width": getattr(settings, "BULLETIN_VIDEO_WIDTH", 1280),
+        "height": getattr(settings, "BULLETIN_VIDEO_HEIGHT", 720),
+        "fps": getattr(settings, "BULLETIN_VIDEO_FPS", 25),
+        "pix_fmt": "yuv420p",
+        "video_codec": "h264",
+        "crf": getattr(settings, "MEDIA_ENCODE_CRF", 23),
+        "preset": getattr(settings, "MEDIA_ENCODE_PRESET", "veryfast"),
+        "audio_codec": "aac",
+        "sample_rate": getattr(settings, "BULLETIN_AUDIO_SAMPLE_RATE", 48000),
+        "channels": 2,
+        "audio_bitrate": getattr(settings, "BULLETIN_AUDIO_BITRATE", "128k"),
+    }
+
+
+def audio_profile() -> dict:
+    return {
+        "audio_codec": "mp3",
+        "sample_rate": getattr(settings, "BULLETIN_PODCAST_SAMPLE_RATE", 44100),
+        "channels": 1,
+        "audio_bitrate": getattr(settings, "BULLETIN_PODCAST_BITRATE", "128k"),
+    }
+
+
+def _profile_key(profile) -> str:
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+
+def usable_as_is(info, profile, kind="video") -> bool:
+    """
+    True if the clip's frames can be concatenated with stream copy without
+    re-encoding. Only MP3s qualify, and they still get a copy with their
+    tags and Xing/LAME info frame stripped (see ensure_normalized): for
+    video, matching codec/size/rate doesn't prove the timebase and H.264
+    profile match, so every video clip gets its own normalized copy.
+    """
+    return bool(
+        kind == "audio" and info and info.has_audio and not info.has_video
+        and info.audio_codec == profile["audio_codec"]
+        and info.sample_rate == profile["sample_rate"]
+        and info.channels == profile["channels"]
+    )
+
+
+def _normalize_args(source, output, profile, kind, has_audio):
+    if kind == "audio":
+        return [
+            "-i", source, "-vn", "-c:a", "libmp3lame", "-b:a", profile["audio_bitrate"],
+            "-ar", str(profile["sample_rate"]), "-ac", str(profile["channels"]),
+            # No info frame or ID3 tag: these copies are only ever concatenated
+            "-write_xing", "0", "-id3v2_version", "0", "-write_id3v1", "0", output,
+        ]
+    w, h, fps = profile["width"], profile["height"], profile["fps"]
+    args = ["-i", source]
+    if not has_audio:
+        # Silent intro/transition clips still need an audio stream for concat
+        args += ["-f", "lavfi", "-i",
+                 f"anullsrc=channel_layout=stereo:sample_rate={profile['sample_rate']}", "-shortest"]
+    args += [
+        "-map", "0:v:0", "-map", "0:a:0" if has_audio else "1:a:0",
+        "-vf", f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,"
+               f"setsar=1,fps={fps}",
+        "-c:v", "libx264", "-preset", profile["preset"], "-crf", str(profile["crf"]),
+        "-profile:v", "high", "-pix_fmt", profile["pix_fmt"], "-g", str(fps * 2),
+        "-c:a", "aac", "-b:a", profile["audio_bitrate"],
+        "-ar", str(profile["sample_rate"]), "-ac", str(profile["channels"]),
+        # Same timebase in every clip, so concatenated timestamps line up
+        "-video_track_timescale", "90000",
+        "-movflags", "+faststart", output,
+    ]
+    return args
+
+
+def _source_tag(source: Path) -> str:
+    # Tells apart clips with the same file name in different directories
+    return hashlib.sha1(str(source.resolve()).encode("utf-8")).hexdigest()[:8]
+
+
+def normalized_path(source, kind="video") -> Path:
+    """<stem>.<source path hash>.<version hash>.mp4|mp3 under the normalized/ directory."""
+    source = Path(source)
+    profile = video_profile() if kind == "video" else audio_profile()
+    stat = source.stat()
+    identity = f"{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{_profile_key(profile)}"
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+    directory = (VIDEO_DIR if kind == "video" else AUDIO_DIR) / "normalized"
+    return directory / f"{source.stem}.{_source_tag(source)}.{digest}{'.mp4' if kind == 'video' else '.mp3'}"
+
+
+def ensure_normalized(source, kind="video") -> Path:
+    """
+    Path of a copy of `source` in the bulletin profile, encoding it if this
+    version of the file has not been normalized yet.
+    """
+    source = Path(source)
+    if not source.exists():
+        raise CompositorError(f"Clip not found: {source}")
+    profile = video_profile() if kind == "video" else audio_profile()
+    info = probe(source)
+    if info is None:
+        raise CompositorError(f"Unreadable clip: {source}")
+    target = normalized_path(source, kind)
+    if target.exists():
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if usable_as_is(info, profile, kind):
+        # Already in the podcast profile: keep the frames, but drop the tags and
+        # the Xing/LAME info frame, which would otherwise land mid-episode and
+        # make players report the first clip's length for the whole episode
+        from .tts import mp3_audio_frames  # tts pulls in the whole TTS stack
+
+        write_atomic(target, mp3_audio_frames(source.read_bytes()))
+    else:
+        with atomic_output(target) as tmp:
+            run = run_ffmpeg(_normalize_args(source, tmp, profile, kind, info.has_audio), tmp,
+                             label=f"bulletin:normalize-{kind}")
+            if not run.ok:
+                raise CompositorError(f"Normalizing {source.name} failed: {run.error}")
+    # Older normalized versions of the same clip are no longer needed
+    for stale in target.parent.glob(f"{source.stem}.{_source_tag(source)}.*{target.suffix}"):
+        if stale != target:
+            stale.unlink(missing_ok=True)
+    logger.info("Normalized %s -> %s", source, target)
+    return target
+
+
+def arrange(clips, intro=None, outro=None, transition=None) -> List[Path]:
+    """intro, clip1, transition, clip2, ..., outro"""
+    ordered = [Path(intro)] if intro else []
+    for index, clip in enumerate(clips):
+        if index and transition:
+            ordered.append(Path(transition))
+        ordered.append(Path(clip))
+    if outro:
+        ordered.append(Path(outro))
+    return ordered
+
+
+def bulletin_key(inputs, kind) -> str:
+    """Hash of the ordered, normalized inputs (path + size + mtime) and the profile."""
+    profile = video_profile() if kind == "video" else audio_profile()
+    h = hashlib.sha256(_profile_key(profile).encode("utf-8"))
+    for path in inputs:
+        stat = Path(path).stat()
+        h.update(f"\0{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()[:20]
+
+
+def concat_copy(inputs, output_path) -> None:
+    with tempfile.TemporaryDirectory(prefix=".concat-", dir=Path(output_path).parent) as directory:
+        list_file = Path(directory) / "inputs.txt"
+        with open(list_file, "w", encoding="utf-8") as f:
+            for path in inputs:
+                escaped = str(Path(path).resolve()).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        args = ["-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy"]
+        if Path(output_path).suffix == ".mp4":
+            args += ["-movflags", "+faststart"]
+        run = run_ffmpeg(args + [output_path], output_path, label="bulletin:concat")
+    if not run.ok:
+        raise CompositorError(f"Concatenating bulletin failed: {run.error}")
+
+
+def compose_bulletin(clips, kind="video", intro=None, outro=None, transition=None, name=None) -> dict:
+    """
+    Join `clips` (paths, in bulletin order) into one file. kind="video" for
+    the per-article mp4s, "audio" for a podcast episode from the MP3s.
+    intro/outro/transition default to the BULLETIN_*_CLIP settings for video.
+    Returns the output path and whether it came from the cache.
+    """
+    if not clips:
+        raise CompositorError("No clips to compose")
+    if kind == "video":
+        intro = intro or getattr(settings, "BULLETIN_INTRO_CLIP", "") or None
+        outro = outro or getattr(settings, "BULLETIN_OUTRO_CLIP", "") or None
+        transition = transition or getattr(settings, "BULLETIN_TRANSITION_CLIP", "") or None
+
+    inputs = [ensure_normalized(path, kind) for path in arrange(clips, intro, outro, transition)]
+    key = bulletin_key(inputs, kind)
+    suffix = ".mp4" if kind == "video" else ".mp3"
+    output = BULLETIN_DIR / f"{name or 'bulletin'}-{key}{suffix}"
+    cached = output.exists()
+    if not cached:
+        BULLETIN_DIR.mkdir(parents=True, exist_ok=True)
+        with atomic_output(output) as tmp:
+            concat_copy(inputs, tmp)
+        _prune(name or "bulletin", suffix)
+
+    info = probe(output)
+    return {
+        "path": str(output),
+        "cached": cached,
+        "key": key,
+        "kind": kind,
+        "clips": len(clips),
+        "inputs": [str(p) for p in inputs],
+        "duration_seconds": round(info.duration, 2) if info else None,
+        "size_mb": round(output.stat().st_size / (1024 * 1024), 2),
+    }
+
+
+def _prune(name, suffix):
+    keep = getattr(settings, "BULLETIN_KEEP", 10)
+    # name-<20 hex key>, so "bulletin" doesn't match "bulletin-sports" outputs
+    pattern = f"{name}-{'?' * 20}{suffix}"
+    outputs = sorted(BULLETIN_DIR.glob(pattern), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in outputs[keep:]:
+        old.unlink(missing_ok=True)
+
+
+def normalize_rendered_clip(video_path) -> Optional[Path]:
+    """
+    Best-effort normalization right after a render, so assembly later is
+    copy-only. The pipeline calls it when BULLETIN_NORMALIZE_ON_RENDER is set.
+    """
+    try:
+        return ensure_normalized(video_path, "video")
+    except Exception:
+        logger.exception("Normalizing %s for bulletins failed; it will be retried at assembly", video_path)
+        return None
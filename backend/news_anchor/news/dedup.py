@@ -0,0 +1,131 @@
+"""
+Near-duplicate detection for news articles.
+
+Each article gets a 64-bit SimHash over word shingles of its title and
+description. The hash is split into LSH_BANDS bands stored in
+NearDuplicateBucket; two articles within MAX_HAMMING bits of each other are
+guaranteed to share at least one band as long as MAX_HAMMING < LSH_BANDS, so
+candidate lookup is a single indexed query instead of a table scan.
+"""
+import hashlib
+import logging
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import NewsArticle, NearDuplicateBucket
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+LSH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // LSH_BANDS
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Agency/outlet suffixes like "- BBC News" would otherwise dominate short titles
+_SOURCE_SUFFIX_RE = re.compile(r"\s+[-|–]\s+[^-|–]{1,40}$")
+
+
+def article_text(title, description) -> str:
+    title = _SOURCE_SUFFIX_RE.sub("", title or "")
+    return f"{title} {description or ''}".lower()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE):
+    words = _WORD_RE.findall(text)
+    if len(words) < size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the text's word shingles (0 for empty text)."""
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles(text):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+def lsh_bands(value: int):
+    """Split a SimHash into (band, bucket) pairs."""
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (value >> (band * BAND_BITS)) & mask) for band in range(LSH_BANDS)]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def index_articles(articles, max_hamming=None):
+    """
+    Compute SimHashes for the given NewsArticle objects, link each one to the
+    canonical article of its nearest existing (or earlier in-batch) duplicate,
+    and add them to the LSH buckets.
+
+    Articles should be passed oldest first so the first-seen story becomes
+    canonical. Returns the number of articles marked as duplicates.
+    """
+    if max_hamming is None:
+        max_hamming = getattr(settings, "NEWS_DEDUP_MAX_HAMMING", 3)
+    articles = [a for a in articles if a.pk and shingles(article_text(a.title, a.description))]
+    if not articles:
+        return 0
+
+    hashes = {a.pk: simhash(article_text(a.title, a.description)) for a in articles}
+
+    # One query for every existing article sharing a band with the batch
+    keys = {key for value in hashes.values() for key in lsh_bands(value)}
+    index = {}  # (band, bucket) -> [(article_id, simhash, canonical_id)]
+    candidates = (
+        NearDuplicateBucket.objects
+        .filter(bucket__in={bucket for _, bucket in keys})
+        .exclude(article_id__in=list(hashes))
+        .values_list("band", "bucket", "article_id", "article__simhash", "article__canonical_id")
+    )
+    for band, bucket, article_id, hex_hash, canonical_id in candidates:
+        if (band, bucket) in keys and hex_hash:
+            index.setdefault((band, bucket), []).append((article_id, int(hex_hash, 16), canonical_id))
+
+    duplicates = 0
+    new_buckets = []
+    for article in articles:
+        value = hashes[article.pk]
+        best = None
+        for key in lsh_bands(value):
+            for other_id, other_hash, other_canonical in index.get(key, []):
+                distance = hamming(value, other_hash)
+                if distance <= max_hamming and (best is None or distance < best[0]):
+                    best = (distance, other_canonical or other_id)
+
+        article.simhash = f"{value:016x}"
+        article.canonical_id = best[1] if best else None
+        if best:
+            duplicates += 1
+
+        for band, bucket in lsh_bands(value):
+            new_buckets.append(NearDuplicateBucket(article_id=article.pk, band=band, bucket=bucket))
+            index.setdefault((band, bucket), []).append((article.pk, value, article.canonical_id))
+
+    with transaction.atomic():
+        NewsArticle.objects.bulk_update(articles, ["simhash", "canonical"])
+        NearDuplicateBucket.objects.filter(article_id__in=list(hashes)).delete()
+        NearDuplicateBucket.objects.bulk_create(new_buckets)
+
+    if duplicates:
+        logger.info("Near-duplicate index: %d of %d articles linked to a canonical story", duplicates, len(articles))
+    return duplicates
+
+
+def get_canonical(article):
+    """Return the canonical article for a duplicate, or None."""
+    if not getattr(article, "canonical_id", None):
+        return None
+    return NewsArticle.objects.filter(id=article.canonical_id).first()
@@ -0,0 +1,213 @@
+"""
+Cached avatar face preprocessing.
+
+Every render used to redo face detection, cropping and landmark/embedding
+extraction for the same anchor face. When the avatar module offers a
+preprocessing hook, its output (the "face template") is computed once per
+(face image hash, model version) and stored under face_cache/<key>/: one
+.npy file per array plus a manifest.json for scalar values. Later renders,
+in this or any other worker process, load the arrays memory-mapped, so the
+frame data is shared through the page cache instead of copied per process.
+
+Hook contract for the external avatar_generation module (all optional):
+- preprocess_face(face_path) -> dict of numpy arrays / JSON-able values
+- generate_lip_synced_video(..., face_template=...) accepting the result
+- MODEL_VERSION: string bumped whenever preprocessing output changes
+  (otherwise the module file's size/mtime is used)
+- DEFAULT_FACE_PATH: the face used when face_path is None
+
+Without the hook, or without numpy, generator_kwargs() simply returns the
+old arguments and renders behave exactly as before.
+"""
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from .single_flight import run_single_flight
+
+try:
+    import numpy as np
+except ImportError:  # numpy comes with the avatar module's dependencies
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(settings.BASE_DIR) / "face_cache"
+MANIFEST = "manifest.json"
+
+
+class FaceCacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.memory_hits = self.disk_hits = self.computed = 0
+        self.last_setup_seconds = None
+
+    def incr(self, field, seconds):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+            self.last_setup_seconds = seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "computed": self.computed,
+                "last_setup_seconds": round(self.last_setup_seconds, 4) if self.last_setup_seconds is not None else None,
+            }
+
+
+stats = FaceCacheStats()
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+def avatar_module():
+    """The avatar_generation module (its path is set up by avatar_pipeline), or None."""
+    try:
+        return importlib.import_module("avatar_generation")
+    except Exception:
+        return None
+
+
+def supports_templates(module) -> bool:
+    return np is not None and module is not None and callable(getattr(module, "preprocess_face", None))
+
+
+def face_image_path(module) -> Optional[Path]:
+    configured = getattr(settings, "AVATAR_FACE_PATH", "") or getattr(module, "DEFAULT_FACE_PATH", None)
+    if not configured:
+        return None
+    path = Path(configured)
+    return path if path.exists() else None
+
+
+def model_version(module) -> str:
+    version = getattr(module, "MODEL_VERSION", None)
+    if version:
+        return str(version)
+    stat = Path(module.__file__).stat()
+    return f"module:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def file_digest(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(face_path, version) -> str:
+    return hashlib.sha256(f"{file_digest(face_path)}:{version}".encode("utf-8")).hexdigest()[:24]
+
+
+def store_template(directory: Path, template: dict):
+    """Write the template to `directory` atomically (built in a temp dir, then renamed)."""
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{directory.name}.", dir=directory.parent))
+    try:
+        manifest = {"arrays": [], "values": {}}
+        for name, value in template.items():
+            if isinstance(value, np.ndarray):
+                np.save(tmp / f"{name}.npy", np.ascontiguousarray(value))
+                manifest["arrays"].append(name)
+            else:
+                manifest["values"][name] = value
+        with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        try:
+            os.replace(tmp, directory)
+        except OSError:
+            # Another process stored the same template first; keep theirs
+            if not (directory / MANIFEST).exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_template(directory: Path) -> Optional[dict]:
+    """Load a stored template with arrays memory-mapped read-only; None if absent or damaged."""
+    try:
+        with open(directory / MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+        template = dict(manifest.get("values") or {})
+        for name in manifest.get("arrays") or []:
+            template[name] = np.load(directory / f"{name}.npy", mmap_mode="r")
+        return template
+    except (OSError, ValueError) as e:
+        if directory.exists():
+            logger.warning("Face template cache %s unreadable (%s); recomputing", directory, e)
+        return None
+
+
+def get_face_template(module=None) -> Optional[dict]:
+    """
+    The cached face template for the current face and model, computing it
+    (once across processes) if needed. None when templates aren't supported.
+    """
+    module = module or avatar_module()
+    if not supports_templates(module):
+        return None
+    face = face_image_path(module)
+    if face is None:
+        return None
+
+    started = time.monotonic()
+    key = cache_key(face, model_version(module))
+    with _memory_lock:
+        template = _memory.get(key)
+    if template is not None:
+        stats.incr("memory_hits", time.monotonic() - started)
+        return template
+
+    directory = CACHE_DIR / key
+
+    def compute():
+        template = module.preprocess_face(str(face))
+        store_template(directory, template)
+        return load_template(directory)
+
+    template, computed = run_single_flight(f"face:{key}", compute, lambda: load_template(directory))
+    if template is None:
+        return None
+    with _memory_lock:
+        _memory[key] = template
+    stats.incr("computed" if computed else "disk_hits", time.monotonic() - started)
+    if computed:
+        logger.info("Computed face template %s for %s in %.2fs", key, face, time.monotonic() - started)
+    return template
+
+
+def clear_memory():
+    with _memory_lock:
+        _memory.clear()
+
+
+def generator_kwargs(generator) -> dict:
+    """
+    Extra keyword arguments for an avatar generator call: face_path as
+    configured, plus the cached face_template when the generator accepts it.
+    """
+    kwargs = {"face_path": getattr(settings, "AVATAR_FACE_PATH", "") or None}
+    try:
+        if "face_template" not in inspect.signature(generator).parameters:
+            return kwargs
+        template = get_face_template()
+    except Exception:
+        logger.exception("Face template cache failed; rendering without it")
+        return kwargs
+    if template is not None:
+        kwargs["face_template"] = template
+    return kwargs
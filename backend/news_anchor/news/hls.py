@@ -0,0 +1,279 @@
+"""
+HLS (adaptive streaming) output for rendered news videos.
+
+package_hls() turns news_videos/<id>.mp4 into a multi-bitrate fMP4 HLS
+ladder in one ffmpeg run:
+
+    news_videos/hls/<id>/master.m3u8
+    news_videos/hls/<id>/<rendition>/index.m3u8, init.mp4, seg_00000.m4s ...
+
+Renditions come from HLS_RENDITIONS (height:video bitrate); ones taller
+than the source are skipped. Keyframes are forced every HLS_SEGMENT_SECONDS
+so all renditions cut at the same points and players can switch between
+them at every segment. The ladder is built in a temp directory and swapped
+in whole, and source.json records which version of the mp4 it was made
+from, so a re-rendered video is reported as stale until it is packaged
+again. Players fetch only the segments they actually play, which starts
+playback sooner and saves egress for viewers who stop early.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+from django.urls import reverse
+
+from .media_merge import run_ffmpeg
+from .media_probe import probe
+from .scheduler import threads_per_job
+
+logger = logging.getLogger(__name__)
+
+VIDEO_DIR = Path(settings.BASE_DIR) / "news_videos"
+HLS_DIR = VIDEO_DIR / "hls"
+MASTER = "master.m3u8"
+SOURCE_MARKER = "source.json"
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+_STREAM_INF_RE = re.compile(r"#EXT-X-STREAM-INF:(.*)")
+
+
+class HLSError(Exception):
+    """Packaging a video as HLS failed."""
+
+
+def renditions() -> List[dict]:
+    """HLS_RENDITIONS, e.g. "720:2500k,480:1200k,360:600k", tallest first."""
+    ladder = []
+    for spec in getattr(settings, "HLS_RENDITIONS", "720:2500k,480:1200k,360:600k").split(","):
+        height, _, bitrate = spec.strip().partition(":")
+        if height.isdigit() and bitrate:
+            ladder.append({"name": f"{height}p", "height": int(height), "bitrate": bitrate})
+    return sorted(ladder, key=lambda r: r["height"], reverse=True)
+
+
+def _kbps(bitrate: str) -> int:
+    value = bitrate.lower().rstrip("k")
+    return int(float(value[:-1]) * 1000) if value.endswith("m") else int(float(value))
+
+
+def hls_dir(news_id) -> Path:
+    return HLS_DIR / str(news_id)
+
+
+def _source_identity(source: Path) -> dict:
+    stat = source.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_hls_args(source, directory, ladder, info) -> list:
+    fps = round(info.fps) if info and info.fps else 25
+    gop = max(int(fps * getattr(settings, "HLS_SEGMENT_SECONDS", 4)), 1)
+    splits = "".join(f"[v{i}]" for i in range(len(ladder)))
+    scales = ";".join(f"[v{i}]scale=-2:{r['height']}[v{i}out]" for i, r in enumerate(ladder))
+    args = ["-i", source, "-filter_complex", f"[0:v]split={len(ladder)}{splits};{scales}"]
+    has_audio = bool(info and info.has_audio)
+    for i, rendition in enumerate(ladder):
+        kbps = _kbps(rendition["bitrate"])
+        args += ["-map", f"[v{i}out]"]
+        if has_audio:
+            args += ["-map", "0:a:0"]
+        args += [
+            f"-c:v:{i}", "libx264", f"-b:v:{i}", rendition["bitrate"],
+            f"-maxrate:v:{i}", f"{int(kbps * 1.07)}k", f"-bufsize:v:{i}", f"{int(kbps * 1.5)}k",
+        ]
+    args += [
+        "-preset", getattr(settings, "MEDIA_ENCODE_PRESET", "veryfast"),
+        "-pix_fmt", "yuv420p", "-threads", str(threads_per_job()),
+        # Fixed GOP, no scene-cut keyframes: every rendition has segment boundaries at the same times
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+    ]
+    if has_audio:
+        args += ["-c:a", "aac", "-b:a", getattr(settings, "HLS_AUDIO_BITRATE", "128k"), "-ac", "2"]
+    stream_map = " ".join(
+        f"v:{i},a:{i},name:{r['name']}" if has_audio else f"v:{i},name:{r['name']}" for i, r in enumerate(ladder)
+    )
+    args += [
+        "-f", "hls",
+        "-hls_time", str(getattr(settings, "HLS_SEGMENT_SECONDS", 4)),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_segment_filename", str(Path(directory) / "%v" / "seg_%05d.m4s"),
+        "-master_pl_name", MASTER,
+        "-var_stream_map", stream_map,
+        str(Path(directory) / "%v" / "index.m3u8"),
+    ]
+    return args
+
+
+def package_hls(news_id, source=None) -> dict:
+    """Build the HLS ladder for the article's video. Returns hls_status(); raises HLSError."""
+    source = Path(source or VIDEO_DIR / f"{news_id}.mp4")
+    info = probe(source)
+    if not info or not info.has_video:
+        raise HLSError(f"No video stream in {source}")
+    ladder = [r for r in renditions() if not info.height or r["height"] <= info.height]
+    if not ladder:
+        ladder = renditions()[-1:]  # source smaller than every rung: keep the lowest one
+    if not ladder:
+        raise HLSError("HLS_RENDITIONS is empty")
+
+    target = hls_dir(news_id)
+    HLS_DIR.mkdir(parents=True, exist_ok=True)
+    identity = _source_identity(source)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{news_id}.", dir=HLS_DIR))
+    try:
+        run = run_ffmpeg(build_hls_args(source, tmp, ladder, info), tmp / MASTER, label="hls:package")
+        if not run.ok:
+            raise HLSError(f"HLS packaging failed for {news_id}: {run.error}")
+        with open(tmp / SOURCE_MARKER, "w", encoding="utf-8") as f:
+            json.dump(dict(identity, renditions=[r["name"] for r in ladder]), f)
+        # Swap the new ladder in; the old one is removed only after the rename
+        old = None
+        if target.exists():
+            old = target.with_name(f".{news_id}.old-{tmp.name}")
+            target.rename(old)
+        tmp.rename(target)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+    logger.info("Packaged HLS for %s: %s", news_id, ", ".join(r["name"] for r in ladder))
+    return hls_status(news_id)
+
+
+def parse_master(text: str) -> List[dict]:
+    """Variant streams of a master playlist: name/uri, bandwidth and resolution."""
+    variants, pending = [], None
+    for line in text.splitlines():
+        line = line.strip()
+        match = _STREAM_INF_RE.match(line)
+        if match:
+            attributes = dict(re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', match.group(1)))
+            pending = {
+                "bandwidth": int(attributes.get("BANDWIDTH", 0) or 0),
+                "resolution": attributes.get("RESOLUTION", "").strip('"') or None,
+            }
+        elif pending is not None and line and not line.startswith("#"):
+            pending["uri"] = line
+            pending["name"] = line.split("/")[0] if "/" in line else line
+            variants.append(pending)
+            pending = None
+    return variants
+
+
+def hls_status(news_id, request=None) -> dict:
+    """Which HLS renditions exist for the article and whether they match the current mp4."""
+    directory = hls_dir(news_id)
+    master = directory / MASTER
+    if not master.exists():
+        return {"available": False, "renditions": []}
+    try:
+        variants = parse_master(master.read_text(encoding="utf-8"))
+    except OSError:
+        return {"available": False, "renditions": []}
+
+    stale = None
+    source = VIDEO_DIR / f"{news_id}.mp4"
+    try:
+        with open(directory / SOURCE_MARKER, encoding="utf-8") as f:
+            recorded = json.load(f)
+        identity = _source_identity(source)
+        stale = (recorded.get("size"), recorded.get("mtime_ns")) != (identity["size"], identity["mtime_ns"])
+    except (OSError, ValueError):
+        pass
+
+    url = reverse("serve_hls", args=[news_id, MASTER])
+    if request is not None:
+        try:
+            url = request.build_absolute_uri(url)
+        except Exception:
+            pass
+    return {
+        "available": bool(variants),
+        "master_url": url,
+        "stale": stale,
+        "renditions": [
+            {"name": v["name"], "bandwidth": v["bandwidth"], "resolution": v["resolution"]} for v in variants
+        ],
+    }
+
+
+def package_after_render(news_id, source) -> Optional[dict]:
+    """Best-effort HLS packaging at the end of the avatar pipeline (HLS_ENABLED)."""
+    if not getattr(settings, "HLS_ENABLED", True):
+        return None
+    try:
+        return package_hls(news_id, source)
+    except Exception as e:
+        logger.warning("HLS packaging for %s failed: %s; the mp4 is still served", news_id, e)
+        return None
+
+
+def link_ladder(from_id, news_id, source=None) -> Optional[dict]:
+    """
+    Give `news_id` the ladder of `from_id`, whose mp4 it reuses, as hard
+    links (copies across filesystems). Only an up-to-date ladder is linked.
+    Returns hls_status(), or None when there is nothing current to link.
+    """
+    ladder = hls_dir(from_id)
+    if hls_status(from_id).get("stale") is not False:
+        return None
+    source = Path(source or VIDEO_DIR / f"{news_id}.mp4")
+    target = hls_dir(news_id)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{news_id}.", dir=HLS_DIR))
+    try:
+        for path in ladder.rglob("*"):
+            dest = tmp / path.relative_to(ladder)
+            if path.is_dir():
+                dest.mkdir(parents=True, exist_ok=True)
+                continue
+            if path.name == SOURCE_MARKER:
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, dest)
+            except OSError:
+                shutil.copyfile(path, dest)
+        with open(ladder / SOURCE_MARKER, encoding="utf-8") as f:
+            marker = json.load(f)
+        # Same bytes as the canonical's mp4, but possibly a copy with its own mtime
+        with open(tmp / SOURCE_MARKER, "w", encoding="utf-8") as f:
+            json.dump(dict(marker, **_source_identity(source)), f)
+        old = None
+        if target.exists():
+            old = target.with_name(f".{news_id}.old-{tmp.name}")
+            target.rename(old)
+        tmp.rename(target)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not link the HLS ladder of %s for %s: %s", from_id, news_id, e)
+        return None
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+    return hls_status(news_id)
+
+
+def package_reused(news_id, canonical_id, source) -> Optional[dict]:
+    """HLS for a video reused from a near-duplicate: link the canonical's ladder, else package it."""
+    if not getattr(settings, "HLS_ENABLED", True):
+        return None
+    return link_ladder(canonical_id, news_id, source) or package_after_render(news_id, source)
+
+
+def content_type_for(name) -> Optional[str]:
+    return CONTENT_TYPES.get(Path(name).suffix.lower())
@@ -0,0 +1,168 @@
+"""
+Background ingest scheduling.
+
+Each NewsAPI category has an IngestSchedule row. The `run_ingest_daemon`
+management command polls for due schedules, claims them with a conditional
+UPDATE (so two processes never run the same category at once) and runs
+fetch_and_store_news for each. Failures back off exponentially; every delay
+gets random jitter so categories do not hit NewsAPI in lock-step.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IngestSchedule
+from .news_fetcher import NEWS_CATEGORIES, fetch_and_store_news
+
+logger = logging.getLogger(__name__)
+
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_schedules():
+    """Create missing schedule rows (due immediately) for every category."""
+    interval = getattr(settings, "NEWS_INGEST_INTERVAL", 900)
+    intervals = getattr(settings, "NEWS_INGEST_CATEGORY_INTERVALS", {})
+    existing = set(IngestSchedule.objects.values_list("category", flat=True))
+    IngestSchedule.objects.bulk_create(
+        [
+            IngestSchedule(category=c, interval_seconds=intervals.get(c, interval), next_run_at=timezone.now())
+            for c in NEWS_CATEGORIES if c not in existing
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def with_jitter(seconds: float) -> timedelta:
+    jitter = getattr(settings, "NEWS_INGEST_JITTER", 0.1)
+    return timedelta(seconds=seconds * (1 + random.uniform(-jitter, jitter)))
+
+
+def backoff_seconds(schedule: IngestSchedule) -> float:
+    base = getattr(settings, "NEWS_INGEST_BACKOFF_BASE", 60)
+    cap = getattr(settings, "NEWS_INGEST_BACKOFF_MAX", 3600)
+    return min(base * (2 ** max(schedule.consecutive_failures - 1, 0)), cap)
+
+
+def _schedules_for(category=None):
+    qs = IngestSchedule.objects.all()
+    if category != "all":
+        qs = qs.filter(category=category or "general")
+    return qs
+
+
+def request_ingest(category=None) -> int:
+    """
+    Mark one category (or every category for 'all') as due now.
+    Returns the number of schedules flagged.
+    """
+    ensure_schedules()
+    now = timezone.now()
+    return _schedules_for(category).update(requested_at=now, next_run_at=now)
+
+
+def due_schedules():
+    now = timezone.now()
+    return IngestSchedule.objects.filter(
+        Q(next_run_at__isnull=True) | Q(next_run_at__lte=now) | Q(requested_at__isnull=False)
+    ).order_by("next_run_at")
+
+
+def claim(schedule: IngestSchedule) -> bool:
+    """
+    Atomically take the run lock for a schedule. A lock older than
+    NEWS_INGEST_LOCK_TIMEOUT is treated as abandoned by a crashed process.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, "NEWS_INGEST_LOCK_TIMEOUT", 600))
+    claimed = IngestSchedule.objects.filter(
+        Q(running_since__isnull=True) | Q(running_since__lt=stale), pk=schedule.pk
+    ).update(running_since=now, running_owner=OWNER_ID, last_started_at=now, requested_at=None)
+    return claimed == 1
+
+
+def run_schedule(schedule: IngestSchedule):
+    """Run one claimed schedule and release its lock. Returns the fetch counts (or None)."""
+    counts = None
+    error = None
+    try:
+        counts = fetch_and_store_news(schedule.category)
+        if counts is None:
+            error = "fetch failed"
+        elif counts.get("errors") and counts["errors"] >= counts.get("requests", 0):
+            error = f"{counts['errors']} NewsAPI errors"
+    except Exception as e:
+        logger.exception("Ingest run failed for %s", schedule.category)
+        error = str(e)
+
+    now = timezone.now()
+    if error:
+        schedule.consecutive_failures += 1
+        delay = backoff_seconds(schedule)
+        logger.warning("Ingest %s failed (%s); retrying in %.0fs", schedule.category, error, delay)
+    else:
+        schedule.consecutive_failures = 0
+        delay = schedule.interval_seconds
+
+    IngestSchedule.objects.filter(pk=schedule.pk, running_owner=OWNER_ID).update(
+        running_since=None,
+        running_owner=None,
+        last_finished_at=now,
+        next_run_at=now + with_jitter(delay),
+        consecutive_failures=schedule.consecutive_failures,
+        last_error=error,
+    )
+    return counts
+
+
+def run_due_schedules(max_workers=None):
+    """
+    Claim and run every due schedule, up to max_workers categories at a time.
+    Returns {category: counts} for the schedules this process ran.
+    """
+    max_workers = max_workers or getattr(settings, "NEWS_INGEST_MAX_WORKERS", 2)
+    claimed = [s for s in due_schedules() if claim(s)]
+    if not claimed:
+        return {}
+
+    def run(schedule):
+        try:
+            return schedule.category, run_schedule(schedule)
+        finally:
+            # Worker threads get their own DB connection; don't leak it
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(run, claimed))
+
+
+def trigger_ingest(category=None) -> int:
+    """
+    Flag the category as due for the ingest daemon (NEWS_INGEST_TRIGGER =
+    'queue', the default). With 'thread', for setups without a daemon, the
+    requested categories only are also fetched in a background thread of
+    this process. Returns immediately with the number of schedules flagged.
+    """
+    flagged = request_ingest(category)
+    if flagged and getattr(settings, "NEWS_INGEST_TRIGGER", "queue") == "thread":
+        def run():
+            try:
+                for schedule in _schedules_for(category).filter(requested_at__isnull=False):
+                    if claim(schedule):
+                        run_schedule(schedule)
+            except Exception:
+                logger.exception("Background ingest trigger failed")
+            finally:
+                connection.close()
+
+        threading.Thread(target=run, name="ingest-trigger", daemon=True).start()
+    return flagged
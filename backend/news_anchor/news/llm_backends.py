@@ -0,0 +1,159 @@
+"""
+LLM backends used for anchoring-script generation.
+
+get_backend() returns a process-wide backend instance chosen by the
+LLM_BACKEND setting:
+- "gemini": Google Gemini through google-generativeai, configured once and
+  reusing one GenerativeModel per model name.
+- "stub": deterministic offline backend with configurable latency, for load
+  tests and benchmarks of the script pipeline.
+Failures raise LLMError subclasses instead of returning error text.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """Base class for LLM backend failures."""
+
+
+class LLMTimeoutError(LLMError):
+    """The request did not complete within the timeout."""
+
+
+class LLMRateLimitError(LLMError):
+    """The provider rejected the request because of quota/rate limits."""
+
+
+class LLMResponseError(LLMError):
+    """The provider answered, but without usable text (empty, blocked, ...)."""
+
+
+class LLMBackend:
+    name = "base"
+    model_name = ""
+
+    def generate(self, prompt: str, timeout: float = None) -> str:
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name=None, api_key=None):
+        import google.generativeai as genai
+
+        self.genai = genai
+        self.model_name = model_name or getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash")
+        self.genai.configure(api_key=api_key or settings.GEMINI_API_KEY)
+        self.model = self.genai.GenerativeModel(self.model_name)
+
+    def generate(self, prompt, timeout=None):
+        timeout = timeout or getattr(settings, "LLM_TIMEOUT", 60)
+        try:
+            response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        except Exception as e:
+            raise self._translate(e) from e
+
+        try:
+            text = response.text
+        except ValueError as e:
+            # Raised by the SDK when the candidate was blocked or has no text part
+            raise LLMResponseError(f"Gemini returned no text: {e}") from e
+        if not text or not text.strip():
+            raise LLMResponseError("Gemini returned an empty response")
+        return text
+
+    @staticmethod
+    def _translate(exc):
+        kind = type(exc).__name__
+        if kind in ("DeadlineExceeded", "Timeout", "ReadTimeout") or isinstance(exc, TimeoutError):
+            return LLMTimeoutError(f"Gemini request timed out: {exc}")
+        if kind in ("ResourceExhausted", "TooManyRequests"):
+            return LLMRateLimitError(f"Gemini rate limit: {exc}")
+        return LLMError(f"Gemini request failed: {exc}")
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend: the output depends only on the prompt, and each call
+    sleeps for `latency` seconds (± `jitter`) to mimic a remote model.
+    Batched prompts (see script_generation.BATCH_PROMPT_TEMPLATE) get a JSON
+    object keyed by article id, like the real model is asked to return.
+    """
+    name = "stub"
+
+    _WORDS = (
+        "today officials reported new developments as markets reacted across the region while "
+        "experts said the decision could shape policy for months ahead and citizens watched closely"
+    ).split()
+    _ARTICLES_RE = re.compile(r"Articles:\s*(\[.*\])\s*$", re.DOTALL)
+
+    def __init__(self, latency=None, jitter=None, failure_rate=None):
+        self.model_name = "stub-v1"
+        self.latency = latency if latency is not None else getattr(settings, "LLM_STUB_LATENCY", 1.0)
+        self.jitter = jitter if jitter is not None else getattr(settings, "LLM_STUB_JITTER", 0.2)
+        self.failure_rate = failure_rate if failure_rate is not None else getattr(settings, "LLM_STUB_FAILURE_RATE", 0.0)
+
+    def _script(self, seed_text, words=110):
+        rng = random.Random(hashlib.sha256(seed_text.encode("utf-8")).digest())
+        body = " ".join(rng.choice(self._WORDS) for _ in range(words))
+        return body[0].upper() + body[1:] + "."
+
+    def generate(self, prompt, timeout=None):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        delay = max(self.latency + rng.uniform(-self.jitter, self.jitter), 0)
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise LLMTimeoutError(f"stub latency {delay:.2f}s exceeded timeout {timeout}s")
+        time.sleep(delay)
+        if rng.random() < self.failure_rate:
+            raise LLMError("stub backend injected failure")
+
+        match = self._ARTICLES_RE.search(prompt)
+        if match:
+            try:
+                items = json.loads(match.group(1))
+                return json.dumps({str(i["id"]): self._script(i["title"] + i.get("description", "")) for i in items})
+            except (ValueError, KeyError, TypeError):
+                pass
+        return self._script(prompt)
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "stub": StubBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None) -> LLMBackend:
+    """Return the shared backend instance for `name` (default: settings.LLM_BACKEND)."""
+    name = name or getattr(settings, "LLM_BACKEND", "gemini")
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                if name not in BACKENDS:
+                    raise LLMError(f"Unknown LLM backend: {name}")
+                try:
+                    backend = BACKENDS[name]()
+                except LLMError:
+                    raise
+                except Exception as e:  # missing SDK, bad configuration, ...
+                    raise LLMError(f"LLM backend {name!r} could not be initialised: {e}") from e
+                _backends[name] = backend
+                logger.info("LLM backend ready: %s (%s)", name, backend.model_name)
+    return backend
@@ -0,0 +1,219 @@
+"""
+Content-addressed cache for LLM responses.
+
+Keys are a SHA-256 of (model name, prompt-template version, normalized prompt),
+so re-ingested or duplicated stories with the same text hit the cache, and a
+new template version misses it without any explicit invalidation.
+Two tiers: a per-process LRU and the LLMResponseCache table (TTL + byte quota).
+Memory hits refresh the row's last_accessed_at at most once per
+LLM_CACHE_TOUCH_INTERVAL seconds, so DB eviction still sees them as recent.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import LLMResponseCache
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WHITESPACE_RE.sub(" ", prompt or "").strip()
+
+
+def cache_key(prompt: str, model_name: str, template_version: str) -> str:
+    payload = "\x1f".join([model_name, template_version, normalize_prompt(prompt)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """Process-wide hit/miss counters."""
+
+    FIELDS = ("memory_hits", "db_hits", "misses", "stores", "evictions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            for field in self.FIELDS:
+                setattr(self, field, 0)
+
+    def incr(self, field, amount=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def as_dict(self):
+        with self.lock:
+            data = {field: getattr(self, field) for field in self.FIELDS}
+        lookups = data["memory_hits"] + data["db_hits"] + data["misses"]
+        data["hit_rate"] = round((data["memory_hits"] + data["db_hits"]) / lookups, 3) if lookups else 0.0
+        return data
+
+
+class MemoryLRU:
+    """
+    Bounded in-process LRU whose entries carry the DB row's creation time for
+    TTL checks and the last time the DB row's last_accessed_at was refreshed.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, fresh_after, touch_before=None):
+        """
+        Returns (value, touch): touch is True when the DB row was last
+        refreshed before `touch_before` (its timestamp is then reset).
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None, False
+            value, created_at, touched_at = entry
+            if created_at < fresh_after:
+                del self.data[key]
+                return None, False
+            touch = touch_before is not None and touched_at < touch_before
+            if touch:
+                self.data[key] = (value, created_at, time.monotonic())
+            self.data.move_to_end(key)
+            return value, touch
+
+    def set(self, key, value, created_at):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.data[key] = (value, created_at, time.monotonic())
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+
+stats = CacheStats()
+memory = MemoryLRU(getattr(settings, "LLM_CACHE_MEMORY_ENTRIES", 1000))
+_stores_since_eviction = 0
+_eviction_lock = threading.Lock()
+
+
+def _fresh_after():
+    return timezone.now() - timedelta(seconds=getattr(settings, "LLM_CACHE_TTL", 30 * 24 * 3600))
+
+
+def lookup_many(keys):
+    """
+    Look up several keys. Memory hits are served directly; the rest come from
+    the DB in one query. Returns {key: response} for hits only.
+    """
+    found = {}
+    remaining = []
+    touch = []
+    fresh_after = _fresh_after()
+    touch_before = time.monotonic() - getattr(settings, "LLM_CACHE_TOUCH_INTERVAL", 300)
+    for key in keys:
+        value, due = memory.get(key, fresh_after, touch_before)
+        if value is not None:
+            found[key] = value
+            stats.incr("memory_hits")
+            if due:
+                touch.append(key)
+        else:
+            remaining.append(key)
+
+    if touch:
+        # Memory hits never reach the DB; refresh last_accessed_at now and then
+        # so DB eviction (LRU by that column) does not drop the hottest entries.
+        LLMResponseCache.objects.filter(key__in=touch).update(last_accessed_at=timezone.now())
+
+    if remaining:
+        rows = {
+            key: (value, created_at)
+            for key, value, created_at in LLMResponseCache.objects
+            .filter(key__in=remaining, created_at__gte=fresh_after)
+            .values_list("key", "response", "created_at")
+        }
+        if rows:
+            LLMResponseCache.objects.filter(key__in=list(rows)).update(
+                hits=F("hits") + 1, last_accessed_at=timezone.now()
+            )
+        for key, (value, created_at) in rows.items():
+            memory.set(key, value, created_at)
+            found[key] = value
+        stats.incr("db_hits", len(rows))
+        stats.incr("misses", len(remaining) - len(rows))
+    return found
+
+
+def lookup(key):
+    return lookup_many([key]).get(key)
+
+
+def store_many(entries, model_name, template_version):
+    """Store {key: response} in both tiers."""
+    global _stores_since_eviction
+    if not entries:
+        return
+    now = timezone.now()
+    for key, value in entries.items():
+        memory.set(key, value, now)
+    # Replace stale/expired rows for the same keys
+    LLMResponseCache.objects.filter(key__in=list(entries)).delete()
+    LLMResponseCache.objects.bulk_create(
+        [
+            LLMResponseCache(
+                key=key, model_name=model_name, template_version=template_version, response=value,
+                size_bytes=len(value.encode("utf-8")), last_accessed_at=now,
+            )
+            for key, value in entries.items()
+        ],
+        ignore_conflicts=True,
+    )
+    stats.incr("stores", len(entries))
+
+    with _eviction_lock:
+        _stores_since_eviction += len(entries)
+        run_eviction = _stores_since_eviction >= getattr(settings, "LLM_CACHE_EVICT_EVERY", 50)
+        if run_eviction:
+            _stores_since_eviction = 0
+    if run_eviction:
+        evict()
+
+
+def store(key, value, model_name, template_version):
+    store_many({key: value}, model_name, template_version)
+
+
+def evict():
+    """Drop expired rows, then least-recently-used rows until under the byte quota."""
+    removed, _ = LLMResponseCache.objects.filter(created_at__lt=_fresh_after()).delete()
+
+    max_bytes = getattr(settings, "LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024)
+    total = LLMResponseCache.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+    if total > max_bytes:
+        excess = total - max_bytes
+        victims = []
+        for pk, size in LLMResponseCache.objects.order_by("last_accessed_at").values_list("pk", "size_bytes").iterator():
+            victims.append(pk)
+            excess -= size
+            if excess <= 0:
+                break
+        for start in range(0, len(victims), 500):
+            removed += LLMResponseCache.objects.filter(pk__in=victims[start:start + 500]).delete()[0]
+
+    if removed:
+        stats.incr("evictions", removed)
+        logger.info("LLM cache evicted %d entries", removed)
+    return removed
+
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from news.dedup import index_articles
+from news.models import NewsArticle, NearDuplicateBucket
+
+
+class Command(BaseCommand):
+    help = "Build the near-duplicate (SimHash/LSH) index for articles already in the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Drop existing hashes, buckets and canonical links first")
+        parser.add_argument("--max-hamming", type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            NearDuplicateBucket.objects.all().delete()
+            NewsArticle.objects.update(simhash=None, canonical=None)
+
+        # Oldest first so the first-published story of a cluster stays canonical
+        pending_ids = list(
+            NewsArticle.objects.filter(simhash__isnull=True).order_by("published_at", "id").values_list("id", flat=True)
+        )
+        batch_size = options["batch_size"]
+        duplicates = 0
+
+        for offset in range(0, len(pending_ids), batch_size):
+            ids = pending_ids[offset:offset + batch_size]
+            by_id = NewsArticle.objects.in_bulk(ids)
+            batch = [by_id[i] for i in ids if i in by_id]
+            duplicates += index_articles(batch, max_hamming=options["max_hamming"])
+            self.stdout.write(f"Indexed {offset + len(ids)}/{len(pending_ids)} articles ({duplicates} duplicates)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Near-duplicate backfill done: {len(pending_ids)} articles, {duplicates} linked to a canonical story."
+        ))
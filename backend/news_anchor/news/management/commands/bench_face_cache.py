@@ -0,0 +1,68 @@
+import shutil
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news import face_cache
+from news.avatar_pipeline import AVATAR_GENERATION_AVAILABLE
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark per-render face setup time: cold (preprocessing from scratch), warm disk "
+        "(memory-mapped template from face_cache/, as in a fresh worker process) and warm memory "
+        "(same process). Needs an avatar module that provides preprocess_face()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Timed runs per mode")
+
+    def handle(self, *args, **options):
+        module = face_cache.avatar_module() if AVATAR_GENERATION_AVAILABLE else None
+        if not face_cache.supports_templates(module):
+            raise CommandError(
+                "Face templates are not supported: the avatar module has no preprocess_face() "
+                "hook (or numpy is missing), so renders preprocess the face themselves."
+            )
+        face = face_cache.face_image_path(module)
+        if face is None:
+            raise CommandError("No face image: set AVATAR_FACE_PATH or DEFAULT_FACE_PATH in the avatar module")
+        directory = face_cache.CACHE_DIR / face_cache.cache_key(face, face_cache.model_version(module))
+        self.stdout.write(f"Face {face}, model {face_cache.model_version(module)}, cache {directory}")
+
+        def timed(prepare):
+            times = []
+            for _ in range(options["runs"]):
+                prepare()
+                started = time.monotonic()
+                template = face_cache.get_face_template(module)
+                if template is None:
+                    raise CommandError("Face template could not be built")
+                # Touch every array so the memory-mapped pages are actually read
+                for value in template.values():
+                    if hasattr(value, "sum"):
+                        value.sum()
+                times.append(time.monotonic() - started)
+            return times
+
+        def cold():
+            face_cache.clear_memory()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        results = {
+            "cold": timed(cold),
+            "warm disk": timed(face_cache.clear_memory),
+            "warm memory": timed(lambda: None),
+        }
+
+        self.stdout.write(f"{'mode':<12} {'runs':>5} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+        for mode, times in results.items():
+            self.stdout.write(
+                f"{mode:<12} {len(times):>5} {statistics.median(times) * 1000:>10.1f} "
+                f"{min(times) * 1000:>8.1f} {max(times) * 1000:>8.1f}"
+            )
+        cold_median = statistics.median(results["cold"])
+        warm_median = statistics.median(results["warm disk"])
+        if warm_median:
+            self.stdout.write(f"Warm-disk setup is {cold_median / warm_median:.1f}x faster than cold")
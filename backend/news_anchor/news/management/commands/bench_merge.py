@@ -0,0 +1,94 @@
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from news.avatar_pipeline import VIDEO_DIR
+from news.media_merge import encoder_settings, merge_audio_video, plan_strategies, run_ffmpeg
+from news.media_probe import probe
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark audio/video merge strategies (stream copy vs re-encode at several presets) "
+        "on the sample clips in news_videos/. Each clip is split into a silent video and an MP3 "
+        "track, which are then merged back; outputs go to a temp dir and are deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clips", type=int, default=5, help="Number of sample clips to use")
+        parser.add_argument("--dir", default=str(VIDEO_DIR), help="Directory with sample .mp4 clips")
+        parser.add_argument("--presets", default="ultrafast,veryfast,medium",
+                            help="Comma-separated libx264 presets to benchmark for re-encoding")
+
+    def handle(self, *args, **options):
+        clips = sorted(Path(options["dir"]).glob("*.mp4"))[:options["clips"]]
+        if not clips:
+            self.stderr.write(f"No .mp4 clips in {options['dir']}")
+            return
+
+        base = encoder_settings()
+        variants = [("copy", base), ("copy_video", base)] + [
+            (f"reencode/{preset}", dict(base, preset=preset))
+            for preset in options["presets"].split(",") if preset.strip()
+        ]
+        totals = defaultdict(lambda: {"clips": 0, "wall": 0.0, "cpu": 0.0, "bytes": 0, "media": 0.0})
+
+        self.stdout.write(
+            f"{'clip':<12} {'strategy':<20} {'wall s':>8} {'cpu s':>8} {'size MB':>8} {'x realtime':>11}"
+        )
+        with tempfile.TemporaryDirectory(prefix="bench_merge_") as tmp:
+            tmp = Path(tmp)
+            for clip in clips:
+                video = tmp / f"{clip.stem}.video.mp4"
+                audio = tmp / f"{clip.stem}.audio.mp3"
+                # Same shape as the pipeline's inputs: a silent render plus a TTS MP3
+                run_ffmpeg(["-i", clip, "-an", "-c:v", "copy", video], video, label="bench:prep")
+                run_ffmpeg(["-i", clip, "-vn", "-c:a", "libmp3lame", "-b:a", "128k", audio], audio,
+                           label="bench:prep")
+                video_info, audio_info = probe(video), probe(audio)
+                if not (video_info and video_info.has_video and audio_info and audio_info.has_audio):
+                    self.stderr.write(f"{clip.name}: needs both a video and an audio stream; skipped")
+                    continue
+                allowed = plan_strategies(video_info, audio_info, video)
+                media_seconds = min(video_info.duration, audio_info.duration)
+
+                for name, encoder in variants:
+                    strategy = name.split("/")[0]
+                    if strategy not in allowed:
+                        self.stdout.write(f"{clip.stem:<12} {name:<20} {'not possible for these codecs':>39}")
+                        continue
+                    output = tmp / f"{clip.stem}.{name.replace('/', '-')}.mp4"
+                    result = merge_audio_video(video, audio, output, strategies=[strategy], encoder=encoder)
+                    run = result.runs[-1]
+                    if not result.ok:
+                        self.stdout.write(f"{clip.stem:<12} {name:<20} failed: {run.error[:60]}")
+                        continue
+                    cpu = run.cpu_seconds or 0.0
+                    speed = media_seconds / run.wall_seconds if run.wall_seconds else 0.0
+                    self.stdout.write(
+                        f"{clip.stem:<12} {name:<20} {run.wall_seconds:>8.2f} {cpu:>8.2f} "
+                        f"{run.output_bytes / 1048576:>8.2f} {speed:>11.1f}"
+                    )
+                    total = totals[name]
+                    total["clips"] += 1
+                    total["wall"] += run.wall_seconds
+                    total["cpu"] += cpu
+                    total["bytes"] += run.output_bytes
+                    total["media"] += media_seconds
+                    output.unlink(missing_ok=True)
+
+        self.stdout.write("\nTotals")
+        self.stdout.write(
+            f"{'strategy':<20} {'clips':>6} {'wall s':>8} {'cpu s':>8} {'size MB':>8} {'x realtime':>11}"
+        )
+        for name, _ in variants:
+            total = totals.get(name)
+            if not total:
+                continue
+            speed = total["media"] / total["wall"] if total["wall"] else 0.0
+            self.stdout.write(
+                f"{name:<20} {total['clips']:>6} {total['wall']:>8.2f} {total['cpu']:>8.2f} "
+                f"{total['bytes'] / 1048576:>8.2f} {speed:>11.1f}"
+            )
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news.llm_backends import StubBackend, get_backend
+from news.models import NewsArticle
+from news.script_generation import TokenBucket, run_llm_generation
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark scripts per minute for single-article vs batched prompting. "
+        "Scripts are generated but not saved, and the LLM cache is bypassed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--articles", type=int, default=20, help="Number of stored articles to use")
+        parser.add_argument("--batch-sizes", default="1,4,8", help="Comma-separated K values to compare")
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--rpm", type=float, default=0,
+                            help="Requests per minute limit (0 = unlimited)")
+        parser.add_argument("--backend", default=None, help="LLM backend name (default: settings.LLM_BACKEND)")
+        parser.add_argument("--stub-latency", type=float, default=None,
+                            help="Use the offline stub backend with this per-call latency in seconds")
+
+    def handle(self, *args, **options):
+        articles = list(NewsArticle.objects.order_by("-published_at")[:options["articles"]])
+        if not articles:
+            self.stderr.write("No articles in the database to benchmark with.")
+            return
+
+        if options["stub_latency"] is not None:
+            backend = StubBackend(latency=options["stub_latency"])
+        else:
+            backend = get_backend(options["backend"])
+        self.stdout.write(f"Backend: {backend.name} ({backend.model_name}), workers={options['workers']}")
+
+        batch_sizes = [int(k) for k in options["batch_sizes"].split(",") if k.strip()]
+        self.stdout.write(f"{'K':>4} {'scripts':>8} {'failed':>7} {'calls':>6} {'seconds':>8} {'scripts/min':>12}")
+        for batch_size in batch_sizes:
+            limiter = TokenBucket(options["rpm"], burst=1) if options["rpm"] else None
+            started = time.monotonic()
+            scripts, latencies, failed = run_llm_generation(
+                articles, options["workers"], limiter, batch_size, backend=backend
+            )
+            elapsed = time.monotonic() - started
+            rate = len(scripts) / elapsed * 60 if elapsed else 0.0
+            self.stdout.write(
+                f"{batch_size:>4} {len(scripts):>8} {failed:>7} {len(latencies):>6} {elapsed:>8.2f} {rate:>12.1f}"
+            )
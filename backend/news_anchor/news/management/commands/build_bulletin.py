@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.bulletin import build_bulletin, select_articles
+from news.compositor import CompositorError, compose_bulletin
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the avatar videos for a bulletin: the latest N articles of a category go through "
+        "script -> TTS -> render as a pipeline, so LLM/TTS work for the next article overlaps "
+        "with rendering the current one. Prints per-stage throughput and utilization; --compose "
+        "joins the clips into one bulletin video and --podcast the MP3s into one episode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--category", default=None, help="Article category (default: all)")
+        parser.add_argument("--limit", type=int, default=10, help="Number of articles")
+        parser.add_argument("--script-workers", type=int, default=None,
+                            help="Concurrent script generations (default BULLETIN_SCRIPT_WORKERS)")
+        parser.add_argument("--tts-workers", type=int, default=None,
+                            help="Concurrent TTS syntheses (default BULLETIN_TTS_WORKERS)")
+        parser.add_argument("--render-workers", type=int, default=None,
+                            help="Concurrent avatar renders (default BULLETIN_RENDER_WORKERS / CPU slots)")
+        parser.add_argument("--rerender", action="store_true", help="Render again even if a video exists")
+        parser.add_argument("--compose", action="store_true",
+                            help="Join the rendered clips into one bulletin video (stream copy)")
+        parser.add_argument("--podcast", action="store_true", help="Also join the MP3s into a podcast episode")
+        parser.add_argument("--intro", default=None, help="Intro clip (default BULLETIN_INTRO_CLIP)")
+        parser.add_argument("--outro", default=None, help="Outro clip (default BULLETIN_OUTRO_CLIP)")
+        parser.add_argument("--transition", default=None,
+                            help="Clip placed between articles (default BULLETIN_TRANSITION_CLIP)")
+
+    def handle(self, *args, **options):
+        articles = select_articles(options["category"], options["limit"])
+        if not articles:
+            raise CommandError(f"No articles found for category {options['category'] or '(any)'}")
+        self.stdout.write(f"Building bulletin from {len(articles)} articles")
+
+        items, pipeline = build_bulletin(
+            articles,
+            script_workers=options["script_workers"],
+            tts_workers=options["tts_workers"],
+            render_workers=options["render_workers"],
+            rerender=options["rerender"],
+        )
+
+        for item in items:
+            timings = " ".join(f"{stage}={seconds:.1f}s" for stage, seconds in item.stage_seconds.items())
+            if item.ok:
+                self.stdout.write(f"  [{item.news_id}] ok     {timings}  {item.video_path}")
+            else:
+                self.stdout.write(f"  [{item.news_id}] FAILED at {item.failed_stage}: {item.error}  {timings}")
+
+        report = pipeline.report()
+        self.stdout.write(f"\nWall time: {pipeline.wall_seconds:.1f}s")
+        self.stdout.write(
+            f"{'stage':<8} {'workers':>7} {'done':>5} {'failed':>6} {'busy s':>8} "
+            f"{'items/min':>10} {'util %':>7} {'avg wait s':>11}"
+        )
+        for name, stats in report.items():
+            self.stdout.write(
+                f"{name:<8} {stats['workers']:>7} {stats['processed']:>5} {stats['failed']:>6} "
+                f"{stats['busy_seconds']:>8.1f} {stats['throughput_per_min']:>10.2f} "
+                f"{stats['utilization'] * 100:>7.1f} {stats['avg_queue_wait_seconds']:>11.2f}"
+            )
+        sequential = sum(stats["busy_seconds"] for stats in report.values())
+        if pipeline.wall_seconds:
+            self.stdout.write(
+                f"Stage work {sequential:.1f}s in {pipeline.wall_seconds:.1f}s wall "
+                f"({sequential / pipeline.wall_seconds:.2f}x overlap)"
+            )
+        failed = sum(1 for item in items if not item.ok)
+        if failed:
+            self.stderr.write(f"{failed} of {len(items)} articles failed")
+
+        done = [item for item in items if item.ok]
+        name = f"bulletin-{options['category']}" if options["category"] else "bulletin"
+        try:
+            if options["compose"] and done:
+                video = compose_bulletin(
+                    [item.video_path for item in done], "video",
+                    intro=options["intro"], outro=options["outro"], transition=options["transition"], name=name,
+                )
+                self.stdout.write(self._describe("Bulletin video", video))
+            if options["podcast"] and done:
+                podcast = compose_bulletin([item.audio_path for item in done], "audio", name=name)
+                self.stdout.write(self._describe("Podcast episode", podcast))
+        except CompositorError as e:
+            raise CommandError(str(e))
+
+    def _describe(self, label, result):
+        source = "cached, inputs unchanged" if result["cached"] else "assembled"
+        return (f"{label}: {result['path']} ({result['clips']} clips, {result['duration_seconds']}s, "
+                f"{result['size_mb']} MB, {source})")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from news.hls import VIDEO_DIR, HLSError, hls_status, package_hls
+
+
+class Command(BaseCommand):
+    help = (
+        "Package rendered videos (news_videos/<id>.mp4) as multi-bitrate HLS. Without ids, every "
+        "video whose HLS output is missing or older than the mp4 is packaged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("news_ids", nargs="*", type=int)
+        parser.add_argument("--force", action="store_true", help="Re-package even if HLS is up to date")
+
+    def handle(self, *args, **options):
+        news_ids = options["news_ids"] or sorted(
+            int(path.stem) for path in VIDEO_DIR.glob("*.mp4") if path.stem.isdigit()
+        )
+        packaged = failed = 0
+        for news_id in news_ids:
+            status = hls_status(news_id)
+            if status["available"] and status.get("stale") is False and not options["force"]:
+                continue
+            try:
+                status = package_hls(news_id)
+            except HLSError as e:
+                self.stderr.write(f"[{news_id}] {e}")
+                failed += 1
+                continue
+            packaged += 1
+            names = ", ".join(r["name"] for r in status["renditions"])
+            self.stdout.write(f"[{news_id}] {names}")
+        self.stdout.write(f"Packaged {packaged} video(s), {failed} failed")
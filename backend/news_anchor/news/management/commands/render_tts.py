@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from news.tts import render_missing_audio
+
+
+class Command(BaseCommand):
+    help = "Pre-render TTS audio for every anchoring script without an up-to-date MP3."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Concurrent TTS requests (default TTS_RENDER_WORKERS)")
+        parser.add_argument("--limit", type=int, default=None, help="Render at most this many scripts")
+        parser.add_argument("--force", action="store_true", help="Re-render even if the MP3 is up to date")
+
+    def handle(self, *args, **options):
+        report = render_missing_audio(workers=options["workers"], limit=options["limit"], force=options["force"])
+        for failure in report["failures"]:
+            self.stderr.write(f"news_id={failure['news_id']}: {failure['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {report['rendered']}/{report['pending']} scripts "
+            f"({report['up_to_date']} already up to date, {report['failed']} failed) "
+            f"in {report['elapsed_seconds']}s with {report['workers']} workers: "
+            f"{report['scripts_per_minute']} scripts/min, {report['bytes_per_second']} B/s"
+        ))
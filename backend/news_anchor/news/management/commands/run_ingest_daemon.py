@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from news.ingest_scheduler import ensure_schedules, run_due_schedules
+
+
+class Command(BaseCommand):
+    help = "Run the background NewsAPI ingest scheduler (per-category schedules with jitter and backoff)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tick", type=float, default=5.0,
+                            help="Seconds between checks for due or requested categories")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Categories fetched concurrently (default NEWS_INGEST_MAX_WORKERS)")
+        parser.add_argument("--once", action="store_true", help="Run due schedules once and exit")
+
+    def handle(self, *args, **options):
+        ensure_schedules()
+        workers = options["workers"] or getattr(settings, "NEWS_INGEST_MAX_WORKERS", 2)
+        self.stdout.write(f"Ingest daemon started (tick={options['tick']}s, workers={workers})")
+
+        try:
+            while True:
+                for category, counts in run_due_schedules(max_workers=workers).items():
+                    self.stdout.write(f"[{category}] {counts}")
+                if options["once"]:
+                    break
+                time.sleep(options["tick"])
+        except KeyboardInterrupt:
+            self.stdout.write("Ingest daemon stopped")
@@ -0,0 +1,75 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# news.render_queue is imported lazily: spawned pool processes import this
+# module (for _init_worker/_run_job) before Django is set up.
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _run_job(job_id):
+    from django.db import connection
+    from news.render_queue import run_job
+
+    try:
+        return job_id, run_job(job_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Run avatar render jobs from the DB-backed queue on a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=None,
+                            help="Jobs rendered concurrently (default RENDER_WORKER_PROCESSES)")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds between queue checks")
+        parser.add_argument("--once", action="store_true", help="Drain the currently queued jobs and exit")
+
+    def handle(self, *args, **options):
+        from news.render_queue import OWNER_ID, claim_next, requeue_stale
+
+        processes = max(options["processes"] or getattr(settings, "RENDER_WORKER_PROCESSES", 2), 1)
+        stale_check_every = max(getattr(settings, "RENDER_JOB_HEARTBEAT", 15), 1)
+        self.stdout.write(f"Render worker {OWNER_ID} started ({processes} processes)")
+
+        # spawn, not fork: children must not share this process's DB connection
+        context = multiprocessing.get_context("spawn")
+        running = {}
+        last_stale_check = 0.0
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker) as pool:
+            try:
+                while True:
+                    if time.monotonic() - last_stale_check >= stale_check_every:
+                        requeue_stale()  # also picks up jobs orphaned by a previous run of this worker
+                        last_stale_check = time.monotonic()
+
+                    for future in [f for f in running if f.done()]:
+                        job_id = running.pop(future)
+                        try:
+                            _, state = future.result()
+                            self.stdout.write(f"[job {job_id}] {state}")
+                        except BrokenProcessPool:
+                            # A render process died (e.g. OOM); its job is requeued once the heartbeat goes stale
+                            raise CommandError(f"Worker process died while running job {job_id}; restart the worker")
+                        except Exception as e:
+                            self.stderr.write(f"[job {job_id}] worker process failed: {e}")
+
+                    free = processes - len(running)
+                    claimed = claim_next(limit=free, worker=OWNER_ID) if free else []
+                    for job_id in claimed:
+                        running[pool.submit(_run_job, job_id)] = job_id
+
+                    if options["once"] and not running and not claimed:
+                        break
+                    time.sleep(options["poll"])
+            except KeyboardInterrupt:
+                self.stdout.write("Render worker stopping; running jobs will be requeued when their heartbeat expires")
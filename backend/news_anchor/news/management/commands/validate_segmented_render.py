@@ -0,0 +1,81 @@
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news.avatar_pipeline import AVATAR_GENERATION_AVAILABLE, VIDEO_DIR
+from news.segmented_render import (
+    SegmentedRenderError, _render_segment, render_segmented, segment_workers, validate_render,
+)
+from news.tts import tts_generate_for_article
+
+
+class Command(BaseCommand):
+    help = (
+        "Render articles both in a single pass and in segmented mode, then compare duration and "
+        "A/V sync of the two outputs and report the speed-up. Videos are written to a temp dir."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("news_ids", nargs="+", type=int)
+        parser.add_argument("--workers", type=int, default=None, help="Pool size (default AVATAR_SEGMENT_WORKERS)")
+        parser.add_argument("--segments", type=int, default=None, help="Number of segments (default = workers)")
+        parser.add_argument("--tolerance", type=float, default=None, help="Allowed difference in seconds")
+        parser.add_argument("--keep", action="store_true", help="Keep the rendered videos for inspection")
+
+    def handle(self, *args, **options):
+        if not AVATAR_GENERATION_AVAILABLE:
+            raise CommandError("Avatar generation module not available")
+        workers = options["workers"] or segment_workers()
+        failures = 0
+
+        directory = Path(tempfile.mkdtemp(prefix="segment_validation_", dir=VIDEO_DIR))
+        for news_id in options["news_ids"]:
+            audio_path, error = tts_generate_for_article(news_id)
+            if error:
+                self.stderr.write(f"[{news_id}] no audio: {error}")
+                failures += 1
+                continue
+
+            reference = directory / f"{news_id}.single.mp4"
+            started = time.monotonic()
+            produced, _ = _render_segment(audio_path, reference, news_id)
+            single_seconds = time.monotonic() - started
+            if not produced:
+                self.stderr.write(f"[{news_id}] single-pass render produced no video")
+                failures += 1
+                continue
+            if Path(produced) != reference:
+                Path(produced).replace(reference)
+
+            candidate = directory / f"{news_id}.segmented.mp4"
+            try:
+                segmented = render_segmented(audio_path, candidate, news_id, workers=workers,
+                                             segments=options["segments"])
+            except SegmentedRenderError as e:
+                self.stderr.write(f"[{news_id}] segmented render failed: {e}")
+                failures += 1
+                continue
+
+            report = validate_render(reference, candidate, options["tolerance"])
+            report.update({
+                "news_id": news_id,
+                "single_pass_seconds": round(single_seconds, 2),
+                "segmented_seconds": segmented["total_seconds"],
+                "speedup": round(single_seconds / segmented["total_seconds"], 2) if segmented["total_seconds"] else None,
+                "segments": segmented["segments"],
+                "workers": segmented["workers"],
+            })
+            failures += 0 if report["ok"] else 1
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options["keep"]:
+            self.stdout.write(f"Videos kept in {directory}")
+        else:
+            for path in directory.iterdir():
+                path.unlink()
+            directory.rmdir()
+        if failures:
+            raise CommandError(f"{failures} article(s) failed validation")
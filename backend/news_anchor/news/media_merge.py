@@ -0,0 +1,255 @@
+"""
+Audio/video merge engine.
+
+merge_audio_video() probes both inputs (cached, news/media_probe.py) and
+picks the cheapest strategy the codecs and the output container allow:
+
+- "copy":       both streams are copied (remux only, no decoding);
+- "copy_video": video is copied, audio re-encoded to AAC;
+- "reencode":   video re-encoded with libx264 using MEDIA_ENCODE_PRESET,
+                MEDIA_ENCODE_CRF and MEDIA_ENCODE_THREADS.
+
+Strategies are tried cheapest first and the next one is used if ffmpeg
+fails or the output is missing a stream. Every ffmpeg run is measured
+(wall time, CPU time of the ffmpeg process, output size) and the recent
+runs are kept for /api/check-ffmpeg/ and the bench_merge command.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+
+from .media_probe import MediaInfo, probe
+from .scheduler import threads_per_job
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ["copy", "copy_video", "reencode"]
+
+# Codecs that can be stream-copied into each output container
+CONTAINER_VIDEO_CODECS = {
+    ".mp4": {"h264", "hevc", "mpeg4", "av1"},
+    ".mov": {"h264", "hevc", "mpeg4", "prores"},
+    ".mkv": {"h264", "hevc", "mpeg4", "av1", "vp8", "vp9"},
+}
+CONTAINER_AUDIO_CODECS = {
+    ".mp4": {"aac", "mp3", "alac"},
+    ".mov": {"aac", "mp3", "alac", "pcm_s16le"},
+    ".mkv": {"aac", "mp3", "opus", "vorbis", "flac"},
+}
+# Pixel formats browsers can play; anything else is re-encoded to yuv420p
+PLAYABLE_PIX_FMTS = {"yuv420p", "yuvj420p"}
+
+
+@dataclass
+class FFmpegRun:
+    """Resource usage of one ffmpeg invocation."""
+    label: str
+    returncode: Optional[int]
+    wall_seconds: float
+    cpu_seconds: Optional[float]  # user + system time of ffmpeg; None where the OS can't report it
+    output_bytes: int
+    error: str = ""
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and self.output_bytes > 0
+
+    def to_dict(self):
+        data = asdict(self)
+        data["wall_seconds"] = round(self.wall_seconds, 3)
+        if self.cpu_seconds is not None:
+            data["cpu_seconds"] = round(self.cpu_seconds, 3)
+        return data
+
+
+@dataclass
+class MergeResult:
+    output_path: str
+    strategy: Optional[str] = None  # strategy that produced the output; None if every one failed
+    runs: List[FFmpegRun] = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return self.strategy is not None
+
+    def to_dict(self):
+        return {
+            "output_path": self.output_path,
+            "strategy": self.strategy,
+            "wall_seconds": round(sum(r.wall_seconds for r in self.runs), 3),
+            "runs": [r.to_dict() for r in self.runs],
+        }
+
+
+recent_runs = deque(maxlen=100)
+_recent_lock = threading.Lock()
+
+
+def encoder_settings() -> dict:
+    return {
+        "preset": getattr(settings, "MEDIA_ENCODE_PRESET", "veryfast"),
+        "crf": getattr(settings, "MEDIA_ENCODE_CRF", 23),
+        # 0 = this render's share of the cores (news/scheduler.py)
+        "threads": getattr(settings, "MEDIA_ENCODE_THREADS", 0) or threads_per_job(),
+        "audio_bitrate": getattr(settings, "MEDIA_AUDIO_BITRATE", "192k"),
+    }
+
+
+def run_ffmpeg(args, output_path, label="ffmpeg", timeout=None) -> FFmpegRun:
+    """
+    Run `ffmpeg <args>` and measure it. CPU time comes from wait4() on the
+    ffmpeg process itself, so concurrent renders don't pollute each other's
+    numbers (it is None on platforms without wait4, e.g. Windows).
+    """
+    timeout = timeout or getattr(settings, "MEDIA_FFMPEG_TIMEOUT", 600)
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "error", "-y"] + [str(a) for a in args]
+    logger.info("%s: %s", label, " ".join(cmd))
+    started = time.monotonic()
+    cpu_seconds = None
+    error = ""
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except OSError as e:
+        run = FFmpegRun(label, None, 0.0, None, 0, str(e))
+        _record(run)
+        return run
+
+    # Drain stderr in the background so a chatty ffmpeg never blocks on a full pipe
+    stderr_chunks = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        if hasattr(os, "wait4"):
+            deadline = started + timeout
+            while True:
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    cpu_seconds = usage.ru_utime + usage.ru_stime
+                    break
+                if time.monotonic() >= deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                time.sleep(0.02)
+        else:
+            proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        error = f"timed out after {timeout}s"
+    reader.join(timeout=5)
+    wall = time.monotonic() - started
+
+    if not error and proc.returncode != 0:
+        error = b"".join(c for c in stderr_chunks if c).decode("utf-8", "replace").strip()[-500:]
+    try:
+        output_bytes = os.path.getsize(output_path)
+    except OSError:
+        output_bytes = 0
+    run = FFmpegRun(label, proc.returncode, wall, cpu_seconds, output_bytes, error)
+    _record(run)
+    if run.ok:
+        logger.info("%s finished in %.2fs (cpu %s, %d bytes)", label, wall,
+                    f"{cpu_seconds:.2f}s" if cpu_seconds is not None else "n/a", output_bytes)
+    else:
+        logger.warning("%s failed (rc=%s): %s", label, proc.returncode, error)
+    return run
+
+
+def _record(run):
+    with _recent_lock:
+        recent_runs.append(run)
+
+
+def run_stats() -> dict:
+    """Summary of recent ffmpeg runs, per label."""
+    with _recent_lock:
+        runs = list(recent_runs)
+    summary = {}
+    for run in runs:
+        entry = summary.setdefault(run.label, {"runs": 0, "failures": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+        entry["runs"] += 1
+        entry["failures"] += 0 if run.ok else 1
+        entry["wall_seconds"] = round(entry["wall_seconds"] + run.wall_seconds, 3)
+        entry["cpu_seconds"] = round(entry["cpu_seconds"] + (run.cpu_seconds or 0.0), 3)
+    return summary
+
+
+def plan_strategies(video: Optional[MediaInfo], audio: Optional[MediaInfo], output_path) -> List[str]:
+    """Strategies that can work for these inputs, cheapest first."""
+    container = Path(output_path).suffix.lower()
+    plan = []
+    video_copyable = bool(
+        video and video.has_video
+        and video.video_codec in CONTAINER_VIDEO_CODECS.get(container, set())
+        and (not video.pix_fmt or video.pix_fmt in PLAYABLE_PIX_FMTS)
+    )
+    audio_copyable = bool(audio and audio.has_audio and audio.audio_codec in CONTAINER_AUDIO_CODECS.get(container, set()))
+    if video_copyable and audio_copyable:
+        plan.append("copy")
+    if video_copyable:
+        plan.append("copy_video")
+    plan.append("reencode")
+    return plan
+
+
+def build_merge_args(strategy, video_path, audio_path, output_path, duration=None, encoder=None) -> list:
+    encoder = encoder or encoder_settings()
+    args = ["-i", video_path, "-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+    if strategy in ("copy", "copy_video"):
+        args += ["-c:v", "copy"]
+    else:
+        args += [
+            "-c:v", "libx264", "-preset", encoder["preset"], "-crf", str(encoder["crf"]),
+            "-pix_fmt", "yuv420p", "-threads", str(encoder["threads"]),
+        ]
+    if strategy == "copy":
+        args += ["-c:a", "copy"]
+    else:
+        args += ["-c:a", "aac", "-b:a", encoder["audio_bitrate"]]
+    if duration:
+        args += ["-t", f"{duration:.3f}"]
+    args += ["-shortest", "-avoid_negative_ts", "make_zero"]
+    if Path(output_path).suffix.lower() in (".mp4", ".mov"):
+        args += ["-movflags", "+faststart"]  # moov atom first, so playback starts before the download ends
+    return args + [output_path]
+
+
+def merge_audio_video(video_path, audio_path, output_path, strategies=None, encoder=None) -> MergeResult:
+    """
+    Mux `audio_path` into `video_path`, trimming to the shorter of the two.
+    `strategies` forces a list of strategies (used by bench_merge); by
+    default they come from plan_strategies(). Check result.ok.
+    """
+    video_path, audio_path, output_path = str(video_path), str(audio_path), str(output_path)
+    result = MergeResult(output_path)
+    if not os.path.exists(video_path) or not os.path.exists(audio_path):
+        logger.error("Missing video or audio for merge: %s %s", video_path, audio_path)
+        return result
+
+    video_info = probe(video_path)
+    audio_info = probe(audio_path)
+    durations = [i.duration for i in (video_info, audio_info) if i and i.duration > 0]
+    duration = min(durations) if durations else None
+
+    for strategy in strategies or plan_strategies(video_info, audio_info, output_path):
+        args = build_merge_args(strategy, video_path, audio_path, output_path, duration, encoder)
+        run = run_ffmpeg(args, output_path, label=f"merge:{strategy}")
+        result.runs.append(run)
+        if run.ok:
+            merged = probe(output_path)
+            if merged and merged.has_audio and merged.has_video:
+                result.strategy = strategy
+                logger.info("Merged %s + %s with %s", video_path, audio_path, strategy)
+                return result
+            logger.warning("Merge with %s produced no audio/video stream; trying next strategy", strategy)
+        Path(output_path).unlink(missing_ok=True)
+    logger.error("All merge strategies failed for %s", video_path)
+    return result
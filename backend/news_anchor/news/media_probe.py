@@ -0,0 +1,187 @@
+"""
+Cached media probing.
+
+probe(path) runs `ffprobe -print_format json -show_format -show_streams`
+once per file version and returns a MediaInfo. Results are cached in
+memory and in the MediaProbe table keyed by (path, size, mtime), so a file
+is probed once no matter how many times the pipeline or status polls ask
+about it, and a rewritten file is re-probed automatically.
+"""
+import json
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from .models import MediaProbe
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MediaInfo:
+    path: str
+    size_bytes: int
+    duration: float = 0.0
+    format_name: str = ""
+    bit_rate: int = 0
+    has_audio: bool = False
+    has_video: bool = False
+    audio_codec: str = ""
+    sample_rate: int = 0
+    channels: int = 0
+    video_codec: str = ""
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    pix_fmt: str = ""
+    audio_duration: float = 0.0
+    video_duration: float = 0.0
+
+    @classmethod
+    def from_ffprobe(cls, path, size_bytes, data):
+        fmt = data.get("format") or {}
+        info = cls(
+            path=str(path),
+            size_bytes=size_bytes,
+            duration=_to_float(fmt.get("duration")),
+            format_name=fmt.get("format_name") or "",
+            bit_rate=int(_to_float(fmt.get("bit_rate"))),
+        )
+        for stream in data.get("streams") or []:
+            kind = stream.get("codec_type")
+            if kind == "audio" and not info.has_audio:
+                info.has_audio = True
+                info.audio_codec = stream.get("codec_name") or ""
+                info.sample_rate = int(_to_float(stream.get("sample_rate")))
+                info.channels = int(stream.get("channels") or 0)
+                info.audio_duration = _to_float(stream.get("duration"))
+            elif kind == "video" and not info.has_video and not (stream.get("disposition") or {}).get("attached_pic"):
+                # attached_pic = cover art embedded in an MP3, not a real video stream
+                info.has_video = True
+                info.video_codec = stream.get("codec_name") or ""
+                info.width = int(stream.get("width") or 0)
+                info.height = int(stream.get("height") or 0)
+                info.fps = _frame_rate(stream.get("avg_frame_rate") or stream.get("r_frame_rate"))
+                info.pix_fmt = stream.get("pix_fmt") or ""
+                info.video_duration = _to_float(stream.get("duration"))
+            if not info.duration:
+                info.duration = _to_float(stream.get("duration"))
+        return info
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _frame_rate(value) -> float:
+    if not value or value == "0/0":
+        return 0.0
+    num, _, den = str(value).partition("/")
+    return round(_to_float(num) / _to_float(den), 3) if den and _to_float(den) else _to_float(num)
+
+
+class ProbeStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.memory_hits = self.db_hits = self.probes = self.failures = 0
+
+    def incr(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "ffprobe_runs": self.probes,
+                "failures": self.failures,
+            }
+
+
+stats = ProbeStats()
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _remember(key, info):
+    with _memory_lock:
+        _memory[key] = info
+        _memory.move_to_end(key)
+        while len(_memory) > getattr(settings, "MEDIA_PROBE_MEMORY_ENTRIES", 512):
+            _memory.popitem(last=False)
+
+
+def run_ffprobe(path) -> Optional[dict]:
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path)],
+            capture_output=True, text=True, timeout=getattr(settings, "MEDIA_PROBE_TIMEOUT", 30),
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("ffprobe failed for %s: %s", path, e)
+        return None
+    if result.returncode != 0:
+        logger.warning("ffprobe failed for %s: %s", path, (result.stderr or "").strip()[:300])
+        return None
+    try:
+        return json.loads(result.stdout or "{}")
+    except ValueError:
+        logger.warning("ffprobe returned invalid JSON for %s", path)
+        return None
+
+
+def probe(path) -> Optional[MediaInfo]:
+    """
+    MediaInfo for `path`, or None if the file is missing or unreadable by
+    ffprobe. Cached per (path, size, mtime); failures are not cached.
+    """
+    path = Path(path).resolve()
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+
+    with _memory_lock:
+        info = _memory.get(key)
+        if info is not None:
+            _memory.move_to_end(key)
+    if info is not None:
+        stats.incr("memory_hits")
+        return info
+
+    row = MediaProbe.objects.filter(path=key[0]).first()
+    if row and row.size_bytes == stat.st_size and row.mtime_ns == stat.st_mtime_ns:
+        try:
+            info = MediaInfo(**row.info)
+        except TypeError:
+            info = None  # stored by an older MediaInfo layout; probe again
+        if info is not None:
+            stats.incr("db_hits")
+            _remember(key, info)
+            return info
+
+    data = run_ffprobe(path)
+    stats.incr("probes")
+    if data is None:
+        stats.incr("failures")
+        return None
+    info = MediaInfo.from_ffprobe(path, stat.st_size, data)
+    MediaProbe.objects.update_or_create(
+        path=key[0], defaults={"size_bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns, "info": info.to_dict()}
+    )
+    _remember(key, info)
+    return info
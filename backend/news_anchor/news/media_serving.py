@@ -0,0 +1,180 @@
+"""
+Serving rendered media (news_audios/, news_videos/) to clients.
+
+serve_file() streams from disk with FileResponse (the WSGI server can use
+sendfile), answers Range requests with 206 partial content so players can
+seek, and sends ETag/Last-Modified so repeat requests get a 304. With
+MEDIA_SENDFILE set, the transfer is handed off to the front proxy instead:
+"x-accel-redirect" (nginx) or "x-sendfile" (Apache/lighttpd).
+"""
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeFile:
+    """File wrapper that reads at most `length` bytes starting at `start`."""
+
+    def __init__(self, path, start, length, block_size=BLOCK_SIZE):
+        self.file = open(path, "rb")
+        self.file.seek(start)
+        self.remaining = length
+        self.block_size = block_size
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0:
+            size = self.block_size
+        data = self.file.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def resolve_media_path(root: Path, relative):
+    """
+    Path of `relative` (or an absolute path) inside `root`, or None if it
+    escapes root or is not a file.
+    """
+    root = Path(root).resolve()
+    path = (root / relative).resolve()
+    if root not in path.parents or not path.is_file():
+        return None
+    return path
+
+
+def file_etag(stat) -> str:
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, None when the header
+    should be ignored (missing or multi-range), or "invalid" for a 416.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if (not first and not last) or size == 0:
+        return "invalid"  # an empty file has no satisfiable range
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, end
+
+
+def is_not_modified(request, etag: str, mtime: float) -> bool:
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+    since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return since is not None and int(mtime) <= since
+
+
+def range_is_current(request, etag: str, mtime: float) -> bool:
+    """If-Range: only honour the Range header when the client's copy is still current."""
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def _offload_response(path: Path, root: Path):
+    mode = (getattr(settings, "MEDIA_SENDFILE", "") or "").lower()
+    if mode == "x-accel-redirect":
+        prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/").rstrip("/")
+        response = HttpResponse()
+        # The internal location is aliased to BASE_DIR, whichever media root the file is served from
+        base = Path(settings.BASE_DIR).resolve()
+        relative = path.relative_to(base) if base in path.parents else Path(root.name) / path.relative_to(root)
+        response["X-Accel-Redirect"] = f"{prefix}/{relative.as_posix()}"
+        return response
+    if mode == "x-sendfile":
+        response = HttpResponse()
+        response["X-Sendfile"] = str(path)
+        return response
+    return None
+
+
+def serve_file(request, path, root, content_type=None, filename=None, as_attachment=False):
+    """
+    Stream `path` (relative to `root`, or absolute but inside it) with
+    conditional-GET and Range support. `filename` is the name clients see;
+    returns a JSON 404 when the file is missing.
+    """
+    root = Path(root).resolve()
+    path = resolve_media_path(root, path)
+    if path is None:
+        return JsonResponse({"error": "File not found"}, status=404)
+
+    stat = path.stat()
+    etag = file_etag(stat)
+    content_type = content_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    cache_control = getattr(settings, "MEDIA_CACHE_CONTROL", "public, max-age=3600")
+    filename = filename or path.name
+
+    def finish(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Accept-Ranges"] = "bytes"
+        response["Cache-Control"] = cache_control
+        return response
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        return finish(HttpResponseNotModified())
+
+    offloaded = _offload_response(path, root)
+    if offloaded is not None:
+        # The proxy handles Range/conditional requests itself
+        offloaded["Content-Type"] = content_type
+        offloaded["Content-Disposition"] = content_disposition_header(as_attachment, filename)
+        return finish(offloaded)
+
+    size = stat.st_size
+    byte_range = None
+    if range_is_current(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.META.get("HTTP_RANGE", ""), size)
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return finish(response)
+
+    if byte_range is None:
+        response = FileResponse(
+            open(path, "rb"), content_type=content_type, as_attachment=as_attachment, filename=filename
+        )
+        return finish(response)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(
+        RangeFile(path, start, length), status=206, content_type=content_type,
+        as_attachment=as_attachment, filename=filename,
+    )
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return finish(response)
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_remove_newsarticle_anchoring_script_anchoringscript'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(blank=True, default='', max_length=50)),
+                ('endpoint', models.CharField(max_length=50)),
+                ('newest_published_at', models.DateTimeField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=64, null=True)),
+                ('payload_hash', models.CharField(blank=True, max_length=40, null=True)),
+                ('last_status', models.CharField(blank=True, max_length=20, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('category', 'endpoint')},
+            },
+        ),
+    ]
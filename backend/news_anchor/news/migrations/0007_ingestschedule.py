@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_near_duplicate_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=50, unique=True)),
+                ('interval_seconds', models.PositiveIntegerField(default=900)),
+                ('next_run_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_at', models.DateTimeField(blank=True, null=True)),
+                ('running_since', models.DateTimeField(blank=True, null=True)),
+                ('running_owner', models.CharField(blank=True, max_length=100, null=True)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('last_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0008_llmresponsecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('voice', models.CharField(max_length=100)),
+                ('model_name', models.CharField(max_length=100)),
+                ('speed', models.FloatField(default=1.0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArticleAudio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='articles', to='news.audioblob')),
+                ('news', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='audio', to='news.newsarticle')),
+            ],
+        ),
+    ]
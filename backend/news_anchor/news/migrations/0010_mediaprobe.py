@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0009_audio_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaProbe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('size_bytes', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('info', models.JSONField()),
+                ('probed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -9,6 +9,9 @@ class NewsArticle(models.Model):
     category = models.CharField(max_length=50, null=True, blank=True)
     published_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Near-duplicate detection (see news/dedup.py)
+    simhash = models.CharField(max_length=16, null=True, blank=True)
+    canonical = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates')
 
     def __str__(self):
         return self.title
@@ -20,4 +23,184 @@ class AnchoringScript(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Script for: {self.news.title}"
\ No newline at end of file
+        return f"Script for: {self.news.title}"
+
+
+class NearDuplicateBucket(models.Model):
+    """
+    LSH bucket membership: one row per (article, SimHash band).
+    """
+    article = models.ForeignKey(NewsArticle, on_delete=models.CASCADE, related_name='lsh_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['bucket', 'band'])]
+
+
+class FetchState(models.Model):
+    """
+    Incremental-ingest bookkeeping for one (category, endpoint) NewsAPI feed.
+    category is '' for the uncategorised feed.
+    """
+    category = models.CharField(max_length=50, blank=True, default='')
+    endpoint = models.CharField(max_length=50)
+    newest_published_at = models.DateTimeField(null=True, blank=True)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=64, null=True, blank=True)
+    payload_hash = models.CharField(max_length=40, null=True, blank=True)
+    last_status = models.CharField(max_length=20, null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('category', 'endpoint')
+
+    def __str__(self):
+        return f"{self.endpoint}/{self.category or 'general'}"
+
+
+class IngestSchedule(models.Model):
+    """
+    Per-category schedule for the background ingest daemon (see news/ingest_scheduler.py).
+    running_since doubles as a cross-process lock so a category never runs twice at once.
+    """
+    category = models.CharField(max_length=50, unique=True)
+    interval_seconds = models.PositiveIntegerField(default=900)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    requested_at = models.DateTimeField(null=True, blank=True)
+    running_since = models.DateTimeField(null=True, blank=True)
+    running_owner = models.CharField(max_length=100, null=True, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Ingest schedule: {self.category}"
+
+
+class LLMResponseCache(models.Model):
+    """
+    Persistent tier of the LLM response cache (see news/llm_cache.py), keyed by
+    a hash of the normalized prompt, model name and prompt-template version.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100)
+    template_version = models.CharField(max_length=50)
+    response = models.TextField()
+    size_bytes = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.model_name}/{self.template_version}: {self.key[:12]}"
+
+
+class AudioBlob(models.Model):
+    """
+    One synthesized MP3 in the content-addressed audio store (news/audio_store.py).
+    digest = sha256 of (script text, voice, model, speed).
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=500)
+    size_bytes = models.BigIntegerField(default=0)
+    voice = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100)
+    speed = models.FloatField(default=1.0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Audio blob {self.digest[:12]} ({self.size_bytes} bytes)"
+
+
+class ArticleAudio(models.Model):
+    """Index: which audio blob currently holds an article's narration."""
+    news = models.OneToOneField(NewsArticle, on_delete=models.CASCADE, related_name='audio')
+    blob = models.ForeignKey(AudioBlob, on_delete=models.CASCADE, related_name='articles')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Audio for: {self.news_id}"
+
+
+class MediaProbe(models.Model):
+    """
+    Cached ffprobe result for a media file (news/media_probe.py). Valid while
+    the file's size and mtime still match.
+    """
+    path = models.CharField(max_length=500, unique=True)
+    size_bytes = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    info = models.JSONField()
+    probed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Probe: {self.path}"
+
+
+class RenderJob(models.Model):
+    """
+    DB-backed queue entry for the avatar video pipeline (news/render_queue.py).
+    Workers claim queued jobs with a conditional UPDATE and refresh
+    heartbeat_at while running; jobs whose heartbeat went stale (worker
+    crashed/restarted) are requeued until max_attempts is reached.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATE_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    ACTIVE_STATES = (QUEUED, RUNNING)
+
+    news = models.ForeignKey(NewsArticle, on_delete=models.CASCADE, related_name='render_jobs')
+    kind = models.CharField(max_length=20, default='avatar')
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=QUEUED)
+    priority = models.IntegerField(default=0)
+    current_step = models.CharField(max_length=100, blank=True, default='')
+    steps = models.JSONField(default=dict, blank=True)
+    progress = models.FloatField(default=0.0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=255, blank=True, default='')
+    available_at = models.DateTimeField()
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'available_at']),
+            models.Index(fields=['news', 'state']),
+        ]
+
+    def __str__(self):
+        return f"RenderJob {self.pk} ({self.kind}, news {self.news_id}): {self.state}"
+
+
+class RenderLease(models.Model):
+    """
+    Cross-process single-flight lock (news/single_flight.py): one row per key
+    being rendered, e.g. "tts:<digest>" or "avatar:<news_id>". A lease past
+    expires_at is considered abandoned and can be taken over.
+    """
+    key = models.CharField(max_length=150, unique=True)
+    owner = models.CharField(max_length=255)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Lease {self.key} held by {self.owner}"
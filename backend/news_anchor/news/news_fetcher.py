@@ -1,80 +1,439 @@
-import requests
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from .models import NewsArticle
+from django.db import transaction
+from django.utils import timezone
+from .models import NewsArticle, FetchState
+from .dedup import index_articles
 
-def fetch_and_store_news(category=None):
+NEWS_API_ENDPOINTS = {
+    "top-headlines": "https://newsapi.org/v2/top-headlines",
+    "everything": "https://newsapi.org/v2/everything",
+}
+
+# Categories supported by the NewsAPI top-headlines endpoint
+NEWS_CATEGORIES = ["business", "entertainment", "general", "health", "science", "sports", "technology"]
+
+# Fields copied from a NewsAPI article onto NewsArticle; used to decide whether
+# an already-stored row needs an update.
+ARTICLE_UPDATE_FIELDS = ["title", "description", "source", "published_at"]
+
+FETCH_STATE_FIELDS = ["etag", "last_modified", "payload_hash", "newest_published_at", "last_run_at", "last_status"]
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def parse_article(article, category=None):
     """
-    Fetches news articles from NewsAPI and stores them in MySQL.
-    Tries top-headlines first; if no articles, falls back to everything endpoint.
+    Convert a raw NewsAPI article dict into NewsArticle field values.
+    Returns None for articles without a usable URL.
     """
-    # --- Step 1: Try top-headlines ---
-    url = "https://newsapi.org/v2/top-headlines"
-    params = {
-        "apiKey": settings.NEWS_API_KEY,
-        "country": "in",
+    url = article.get("url")
+    if not url:
+        return None
+
+    published_at = article.get("publishedAt")
+    # Convert string date to datetime
+    if published_at:
+        try:
+            published_at = datetime.fromisoformat(published_at.replace("Z", "+00:00"))
+        except Exception:
+            published_at = None
+
+    return {
+        "url": url[:500],
+        "title": (article.get("title") or "")[:500],
+        "description": article.get("description"),
+        "source": ((article.get("source") or {}).get("name") or None),
+        "category": category,
+        "published_at": published_at,
     }
-    if category:
-        params["category"] = category
 
+
+def bulk_store_articles(articles, category=None, batch_size=None):
+    """
+    Parse raw NewsAPI articles for one category and store them in bulk.
+    Returns a dict with created/updated/skipped counts.
+    """
+    rows = []
+    skipped = 0
+    for article in articles:
+        values = parse_article(article, category)
+        if values is None:
+            skipped += 1
+        else:
+            rows.append(values)
+
+    counts = bulk_store_rows(rows, batch_size=batch_size)
+    counts["skipped"] += skipped
+    return counts
+
+
+def bulk_store_rows(rows, batch_size=None):
+    """
+    Store parsed article rows (see parse_article) with a constant number of queries.
+
+    One query loads the rows we already have for the incoming URLs, changed rows
+    are written with bulk_update and new rows with bulk_create (ignoring
+    conflicts on the unique url column), all inside a single transaction.
+    Returns a dict with created/updated/skipped counts.
+    """
+    batch_size = batch_size or getattr(settings, "NEWS_BULK_BATCH_SIZE", 500)
+    counts = {"created": 0, "updated": 0, "skipped": 0}
+
+    # De-duplicate by URL (the same story can appear on several pages/categories);
+    # the first occurrence wins so a story keeps its first category.
+    parsed = {}
+    for values in rows:
+        if values["url"] in parsed:
+            counts["skipped"] += 1
+            continue
+        parsed[values["url"]] = values
+
+    if not parsed:
+        return counts
+
+    with transaction.atomic():
+        existing = {
+            obj.url: obj
+            for obj in NewsArticle.objects.filter(url__in=list(parsed)).only("id", "url", *ARTICLE_UPDATE_FIELDS)
+        }
+
+        to_create = []
+        to_update = []
+        for url, values in parsed.items():
+            obj = existing.get(url)
+            if obj is None:
+                to_create.append(NewsArticle(**values))
+                continue
+
+            changed = False
+            for field in ARTICLE_UPDATE_FIELDS:
+                new_value = values[field]
+                if new_value and getattr(obj, field) != new_value:
+                    setattr(obj, field, new_value)
+                    changed = True
+            if changed:
+                to_update.append(obj)
+            else:
+                counts["skipped"] += 1
+
+        if to_create:
+            NewsArticle.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+            # ignore_conflicts drops rows another writer inserted meanwhile without
+            # telling us; none of these URLs existed in our snapshot, so whatever is
+            # visible now is what this call inserted.
+            new_urls = [a.url for a in to_create]
+            counts["created"] = NewsArticle.objects.filter(url__in=new_urls).count()
+            counts["skipped"] += len(to_create) - counts["created"]
+            if getattr(settings, "NEWS_DEDUP_ENABLED", True):
+                # ignore_conflicts leaves pks unset, so reload the new rows once
+                created = NewsArticle.objects.filter(
+                    url__in=new_urls, simhash__isnull=True
+                ).order_by("published_at", "id")
+                counts["near_duplicates"] = index_articles(list(created))
+        if to_update:
+            NewsArticle.objects.bulk_update(to_update, ARTICLE_UPDATE_FIELDS, batch_size=batch_size)
+            counts["updated"] = len(to_update)
+
+    return counts
+
+
+# ---------------------------
+# Concurrent ingestion engine
+# ---------------------------
+def get_session():
+    """
+    Return the process-wide requests.Session used for NewsAPI calls.
+    Connections are kept alive and pooled so concurrent fetches reuse sockets.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = max(getattr(settings, "NEWS_FETCH_MAX_WORKERS", 8), 1)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def fetch_page(endpoint, params, timeout=None, headers=None):
+    """
+    Fetch one NewsAPI page.
+    Returns (articles, error_message, meta) where meta carries the response's
+    ETag/Last-Modified, whether it was a 304, and a digest of the payload.
+    """
+    timeout = timeout or getattr(settings, "NEWS_FETCH_TIMEOUT", 10)
+    url = NEWS_API_ENDPOINTS[endpoint]
+    meta = {"not_modified": False, "etag": None, "last_modified": None, "payload_hash": None}
     try:
-        response = requests.get(url, params=params)
+        response = get_session().get(
+            url, params={"apiKey": settings.NEWS_API_KEY, **params}, headers=headers or {}, timeout=timeout
+        )
+        meta["etag"] = response.headers.get("ETag")
+        meta["last_modified"] = response.headers.get("Last-Modified")
+        if response.status_code == 304:
+            meta["not_modified"] = True
+            return [], None, meta
         data = response.json()
+    except Exception as e:
+        return [], str(e), meta
 
-        if data.get("status") != "ok":
-            print("❌ Error fetching news:", data.get("message"))
-            return
-
-        articles = data.get("articles", [])
-        print(f"🔍 Top-headlines returned {len(articles)} articles.")
-
-        # --- Step 2: Fallback to everything if no articles ---
-        if len(articles) == 0:
-            url = "https://newsapi.org/v2/everything"
-            params = {
-                "apiKey": settings.NEWS_API_KEY,
-                "q": "India",
-                "language": "en",
-                "pageSize": 50,
-            }
-            response = requests.get(url, params=params)
-            data = response.json()
-            articles = data.get("articles", [])
-            print(f"🔍 Everything endpoint returned {len(articles)} articles.")
-
-        # --- Step 3: Save articles to database ---
-        saved_count = 0
-        for i, article in enumerate(articles, start=1):
-            title = article.get("title")
-            description = article.get("description")
-            url = article.get("url")
-            source = article.get("source", {}).get("name")
-            published_at = article.get("publishedAt")
-
-            # Convert string date to datetime
-            if published_at:
-                try:
-                    published_at = datetime.fromisoformat(published_at.replace("Z", "+00:00"))
-                except Exception:
-                    published_at = None
-
-            try:
-                obj, created = NewsArticle.objects.get_or_create(
-                    url=url,
-                    defaults={
-                        "title": title,
-                        "description": description,
-                        "source": source,
-                        "category": category,
-                        "published_at": published_at,
-                    }
-                )
-                if created:
-                    saved_count += 1
-            except Exception as e:
-                print(f"❌ Error saving article {i}: {e}")
-
-        print(f"✅ Stored {saved_count} new articles successfully.")
+    if data.get("status") != "ok":
+        return [], data.get("message") or f"HTTP {response.status_code}", meta
 
+    articles = data.get("articles", [])
+    meta["payload_hash"] = hashlib.sha1(
+        json.dumps(articles, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return articles, None, meta
+
+
+def fallback_task(categories):
+    """The (category, endpoint, params) chain for the 'everything' fallback feed."""
+    fallback_category = categories[0] if len(categories) == 1 else None
+    return (fallback_category, "everything", {"q": "India", "language": "en", "pageSize": 50})
+
+
+def build_fetch_tasks(categories, include_fallback=False):
+    """
+    Build (category, endpoint, params) tuples, one per paged request chain.
+    With include_fallback the 'everything' chain is issued speculatively,
+    alongside the headlines instead of after them.
+    """
+    page_size = getattr(settings, "NEWS_FETCH_PAGE_SIZE", 100)
+    tasks = []
+    for category in categories:
+        params = {"country": "in", "pageSize": page_size}
+        if category:
+            params["category"] = category
+        tasks.append((category, "top-headlines", params))
+
+    if include_fallback:
+        tasks.append(fallback_task(categories))
+    return tasks
+
+
+def fetch_chain(category, endpoint, params, pages, state, timeout=None):
+    """
+    Fetch up to `pages` pages for one (category, endpoint), incrementally.
+
+    `state` is a plain dict snapshot of the FetchState row (no DB access happens
+    here, so this is safe to run in worker threads). Page 1 is sent as a
+    conditional request; a 304 or an identical payload short-circuits the chain.
+    Paging stops as soon as a page reaches articles at or below the stored
+    high-water mark. Returns a dict describing what happened.
+    """
+    result = {
+        "rows": [], "raw_count": 0, "requests": 0, "error": None, "status": "ok",
+        "etag": state.get("etag"), "last_modified": state.get("last_modified"),
+        "payload_hash": state.get("payload_hash"), "newest_published_at": state.get("newest_published_at"),
+    }
+    high_water = state.get("newest_published_at")
+    page_size = params.get("pageSize", 100)
+
+    for page in range(1, pages + 1):
+        headers = {}
+        if page == 1:
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+
+        articles, error, meta = fetch_page(endpoint, {**params, "page": page}, timeout, headers)
+        result["requests"] += 1
+        if error:
+            result["error"] = error
+            result["status"] = "error"
+            break
+
+        if page == 1:
+            result["etag"] = meta["etag"] or result["etag"]
+            result["last_modified"] = meta["last_modified"] or result["last_modified"]
+            if meta["not_modified"]:
+                result["status"] = "not-modified"
+                break
+            if meta["payload_hash"] == state.get("payload_hash"):
+                result["status"] = "unchanged"
+                break
+            result["payload_hash"] = meta["payload_hash"]
+
+        result["raw_count"] += len(articles)
+        reached_seen = False
+        for article in articles:
+            values = parse_article(article, category)
+            if values is None:
+                continue
+            published_at = values["published_at"]
+            if high_water and published_at and published_at <= high_water:
+                reached_seen = True
+                continue
+            result["rows"].append(values)
+            if published_at and (result["newest_published_at"] is None or published_at > result["newest_published_at"]):
+                result["newest_published_at"] = published_at
+
+        if reached_seen or len(articles) < page_size:
+            break
+
+    return result
+
+
+def load_fetch_states(tasks):
+    """
+    Load (creating on first use) the FetchState rows for the given tasks in
+    one query. Returns {(category_key, endpoint): FetchState}.
+    """
+    keys = {(category or "", endpoint) for category, endpoint, _ in tasks}
+    states = {
+        (s.category, s.endpoint): s
+        for s in FetchState.objects.filter(category__in={k[0] for k in keys}, endpoint__in={k[1] for k in keys})
+    }
+    missing = [FetchState(category=c, endpoint=e) for c, e in keys if (c, e) not in states]
+    if missing:
+        FetchState.objects.bulk_create(missing, ignore_conflicts=True)
+        for s in FetchState.objects.filter(category__in={k[0] for k in keys}, endpoint__in={k[1] for k in keys}):
+            states[(s.category, s.endpoint)] = s
+    return states
+
+
+def fetch_all_news(categories=None, pages=None, max_workers=None, timeout=None):
+    """
+    Fetch several categories from NewsAPI concurrently over a pooled session,
+    then store everything with a single bulk write.
+
+    Each (category, endpoint) is fetched incrementally against its FetchState
+    (conditional requests, high-water mark, payload digest), so polls that find
+    nothing new make no article queries at all. The 'everything' endpoint is
+    requested (once per call) only when top-headlines returned nothing,
+    matching fetch_and_store_news; NEWS_FETCH_SPECULATIVE_FALLBACK requests it
+    in parallel instead, trading one extra call per run for latency.
+    Returns a dict with created/updated/skipped counts plus fetch stats.
+    """
+    categories = list(categories) if categories is not None else list(NEWS_CATEGORIES)
+    pages = pages or getattr(settings, "NEWS_FETCH_PAGES", 1)
+    max_workers = max_workers or getattr(settings, "NEWS_FETCH_MAX_WORKERS", 8)
+    speculative = getattr(settings, "NEWS_FETCH_SPECULATIVE_FALLBACK", False)
+
+    tasks = build_fetch_tasks(categories, include_fallback=speculative)
+    states = load_fetch_states(tasks + [fallback_task(categories)])
+    started = time.monotonic()
+
+    def snapshot(category, endpoint):
+        state = states[(category or "", endpoint)]
+        return {
+            "etag": state.etag, "last_modified": state.last_modified,
+            "payload_hash": state.payload_hash, "newest_published_at": state.newest_published_at,
+        }
+
+    results = [None] * len(tasks)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+        futures = {}
+        for index, (category, endpoint, params) in enumerate(tasks):
+            future = pool.submit(fetch_chain, category, endpoint, params, pages, snapshot(category, endpoint), timeout)
+            futures[future] = index
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    # A 304/unchanged payload means headlines exist, just nothing new.
+    headlines_available = any(
+        not result["error"] and (result["raw_count"] > 0 or result["status"] != "ok")
+        for (_, endpoint, _), result in zip(tasks, results) if endpoint == "top-headlines"
+    )
+    if not speculative and not headlines_available:
+        category, endpoint, params = fallback_task(categories)
+        tasks.append((category, endpoint, params))
+        results.append(fetch_chain(category, endpoint, params, pages, snapshot(category, endpoint), timeout))
+
+    # Merge in task order so a story seen in several categories keeps the same
+    # category from run to run, regardless of which response arrived first.
+    headline_rows = []
+    fallback_rows = []
+    errors = []
+    for (category, endpoint, _), result in zip(tasks, results):
+        if result["error"]:
+            errors.append(f"{endpoint}/{category or 'general'}: {result['error']}")
+            continue
+        if endpoint == "everything":
+            fallback_rows.extend(result["rows"])
+        else:
+            headline_rows.extend(result["rows"])
+
+    fetch_elapsed = time.monotonic() - started
+    print(
+        f"🔍 Fetched {len(headline_rows)} new headlines across {len(categories)} categories "
+        f"in {fetch_elapsed:.2f}s ({sum(r['requests'] for r in results)} requests, {len(errors)} errors)."
+    )
+    for error in errors:
+        print("❌ Error fetching news:", error)
+
+    rows = headline_rows
+    stored_endpoint = "top-headlines"
+    if not headlines_available:
+        if fallback_rows:
+            print(f"🔍 Everything endpoint returned {len(fallback_rows)} articles.")
+        rows = fallback_rows
+        stored_endpoint = "everything"
+
+    counts = bulk_store_rows(rows) if rows else {"created": 0, "updated": 0, "skipped": 0}
+
+    # Persist the new fetch state (one UPDATE per batch of states). Only feeds
+    # whose rows were stored advance: a discarded feed must not mark its
+    # articles as seen, or they are lost the next time it is actually needed.
+    now = timezone.now()
+    for (category, endpoint, _), result in zip(tasks, results):
+        state = states[(category or "", endpoint)]
+        state.last_run_at = now
+        if result["error"]:
+            state.last_status = result["status"]
+            continue
+        if endpoint != stored_endpoint:
+            state.last_status = "discarded"
+            continue
+        state.last_status = result["status"]
+        state.etag = result["etag"]
+        state.last_modified = result["last_modified"]
+        state.payload_hash = result["payload_hash"]
+        state.newest_published_at = result["newest_published_at"]
+    FetchState.objects.bulk_update(
+        [states[(category or "", endpoint)] for category, endpoint, _ in tasks], FETCH_STATE_FIELDS
+    )
+
+    counts.update({
+        "requests": sum(r["requests"] for r in results),
+        "not_modified": sum(1 for r in results if r["status"] in ("not-modified", "unchanged")),
+        "errors": len(errors),
+        "fetch_seconds": round(fetch_elapsed, 3),
+        "total_seconds": round(time.monotonic() - started, 3),
+    })
+    return counts
+
+
+def fetch_and_store_news(category=None):
+    """
+    Fetches news articles from NewsAPI and stores them in MySQL.
+    Tries top-headlines first; if no articles, falls back to everything endpoint
+    (see fetch_all_news).
+    Returns a dict with created/updated/skipped counts (None on errors).
+    """
+    try:
+        counts = fetch_all_news([category])
     except Exception as e:
         print("⚠️ Error while fetching news:", e)
+        return
+
+    print(
+        f"✅ Stored {counts['created']} new articles "
+        f"({counts['updated']} updated, {counts['skipped']} unchanged/skipped)."
+    )
+    return counts
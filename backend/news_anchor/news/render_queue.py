@@ -0,0 +1,336 @@
+"""
+DB-backed job queue for the avatar video pipeline.
+
+/api/avatar/<id>/ enqueues a RenderJob and returns immediately. Jobs are run
+either by the `run_render_worker` management command (a process pool that
+claims queued jobs) or, with RENDER_JOB_RUNNER = 'thread', by a dispatcher
+thread and a small thread pool inside the web process, started with the app. Claims use a conditional UPDATE so a job runs
+once; running jobs refresh a heartbeat, and jobs whose heartbeat went stale
+(worker crashed or restarted) are requeued until max_attempts is reached.
+"""
+import logging
+import os
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from .avatar_pipeline import JobCancelled, PipelineError, StepTracker, run_avatar_pipeline
+from .models import RenderJob
+
+logger = logging.getLogger(__name__)
+
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(news_id, kind="avatar", priority=0):
+    """
+    Queue a job for the article unless one is already queued/running.
+    Asking again for a queued article raises its priority, so the most
+    requested articles are rendered first. Returns (job, created).
+    """
+    active = (
+        RenderJob.objects.filter(news_id=news_id, kind=kind, state__in=RenderJob.ACTIVE_STATES)
+        .order_by("-created_at").first()
+    )
+    if active:
+        if active.state == RenderJob.QUEUED:
+            RenderJob.objects.filter(pk=active.pk, state=RenderJob.QUEUED).update(priority=F("priority") + 1)
+            active.refresh_from_db()
+        return active, False
+    job = RenderJob.objects.create(
+        news_id=news_id,
+        kind=kind,
+        priority=priority,
+        available_at=timezone.now(),
+        max_attempts=getattr(settings, "RENDER_JOB_MAX_ATTEMPTS", 3),
+    )
+    return job, True
+
+
+def claim(job_id, worker=None) -> bool:
+    """Atomically move a queued job to running. False if someone else got it first."""
+    now = timezone.now()
+    claimed = RenderJob.objects.filter(
+        pk=job_id, state=RenderJob.QUEUED, cancel_requested=False, available_at__lte=now
+    ).update(
+        state=RenderJob.RUNNING,
+        worker=worker or OWNER_ID,
+        attempts=F("attempts") + 1,
+        started_at=now,
+        heartbeat_at=now,
+    )
+    return claimed == 1
+
+
+def claim_next(limit=1, worker=None):
+    """Claim up to `limit` queued jobs, highest priority then oldest first. Returns their ids."""
+    candidates = RenderJob.objects.filter(
+        state=RenderJob.QUEUED, cancel_requested=False, available_at__lte=timezone.now()
+    ).order_by("-priority", "created_at").values_list("pk", flat=True)[:limit * 4]
+    claimed = []
+    for job_id in candidates:
+        if len(claimed) >= limit:
+            break
+        if claim(job_id, worker):
+            claimed.append(job_id)
+    return claimed
+
+
+def retry_delay(attempts) -> timedelta:
+    base = getattr(settings, "RENDER_JOB_RETRY_BASE", 30)
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), 3600))
+
+
+def requeue_stale() -> int:
+    """
+    Requeue running jobs whose heartbeat is older than RENDER_JOB_STALE_AFTER
+    (their worker died); jobs out of attempts are marked failed. Returns the
+    number of jobs touched.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=getattr(settings, "RENDER_JOB_STALE_AFTER", 120))
+    touched = 0
+    stale = RenderJob.objects.filter(state=RenderJob.RUNNING).filter(
+        Q(heartbeat_at__lt=stale_before) | Q(heartbeat_at__isnull=True)
+    )
+    for job in stale:
+        # Only act if the row is still in the state we read (another process may have handled it)
+        same = RenderJob.objects.filter(pk=job.pk, state=RenderJob.RUNNING, heartbeat_at=job.heartbeat_at)
+        if job.cancel_requested:
+            touched += same.update(state=RenderJob.CANCELLED, finished_at=now, error="Cancelled (worker lost)")
+        elif job.attempts < job.max_attempts:
+            touched += same.update(
+                state=RenderJob.QUEUED, worker="", heartbeat_at=None, available_at=now,
+                error=f"Worker {job.worker} stopped responding; requeued",
+            )
+        else:
+            touched += same.update(
+                state=RenderJob.FAILED, finished_at=now,
+                error=f"Worker {job.worker} stopped responding; no attempts left",
+            )
+    if touched:
+        logger.warning("Requeued/failed %d stale render jobs", touched)
+    return touched
+
+
+def request_cancel(job_id):
+    """
+    Cancel a job. Queued jobs are cancelled at once; running jobs stop before
+    their next pipeline step. Returns the job's state afterwards (None if unknown).
+    """
+    now = timezone.now()
+    RenderJob.objects.filter(pk=job_id, state=RenderJob.QUEUED).update(
+        state=RenderJob.CANCELLED, cancel_requested=True, finished_at=now
+    )
+    RenderJob.objects.filter(pk=job_id, state=RenderJob.RUNNING).update(cancel_requested=True)
+    return RenderJob.objects.filter(pk=job_id).values_list("state", flat=True).first()
+
+
+class JobStepTracker(StepTracker):
+    """Persists step timings/progress on the job and honours cancel requests."""
+
+    def __init__(self, job_id):
+        super().__init__()
+        self.job_id = job_id
+
+    def check_cancelled(self):
+        if RenderJob.objects.filter(pk=self.job_id, cancel_requested=True).exists():
+            raise JobCancelled(f"Job {self.job_id} cancelled")
+
+    def on_change(self):
+        RenderJob.objects.filter(pk=self.job_id).update(
+            current_step=self.current_step or "",
+            steps=self.steps,
+            progress=self.progress(),
+            heartbeat_at=timezone.now(),
+        )
+
+
+class Heartbeat:
+    """Refreshes heartbeat_at from a side thread while a long step (lip-sync) blocks."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"render-heartbeat-{job_id}", daemon=True)
+
+    def run(self):
+        interval = getattr(settings, "RENDER_JOB_HEARTBEAT", 15)
+        try:
+            while not self.stopped.wait(interval):
+                RenderJob.objects.filter(pk=self.job_id, state=RenderJob.RUNNING).update(
+                    heartbeat_at=timezone.now()
+                )
+        except Exception:
+            logger.exception("Heartbeat for render job %s failed", self.job_id)
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join(timeout=5)
+
+
+def finish(job_id, state, result=None, error=""):
+    fields = {"state": state, "result": result, "error": error, "finished_at": timezone.now()}
+    if state == RenderJob.SUCCEEDED:
+        fields["progress"] = 1.0
+    RenderJob.objects.filter(pk=job_id).update(**fields)
+    return state
+
+
+def fail_or_retry(job_id, error, retryable=True):
+    job = RenderJob.objects.get(pk=job_id)
+    if retryable and not job.cancel_requested and job.attempts < job.max_attempts:
+        delay = retry_delay(job.attempts)
+        RenderJob.objects.filter(pk=job_id, state=RenderJob.RUNNING).update(
+            state=RenderJob.QUEUED, worker="", heartbeat_at=None, error=error,
+            available_at=timezone.now() + delay,
+        )
+        logger.warning("Render job %s failed (%s); retry %d/%d in %.0fs",
+                       job_id, error, job.attempts + 1, job.max_attempts, delay.total_seconds())
+        return RenderJob.QUEUED
+    return finish(job_id, RenderJob.FAILED, error=error)
+
+
+def run_job(job_id):
+    """Run an already claimed job through the pipeline and record the outcome. Returns the new state."""
+    job = RenderJob.objects.get(pk=job_id)
+    logger.info("Render job %s started (news %s, attempt %d/%d)", job.pk, job.news_id, job.attempts, job.max_attempts)
+    try:
+        with Heartbeat(job.pk):
+            result = run_avatar_pipeline(job.news_id, JobStepTracker(job.pk))
+    except JobCancelled:
+        return finish(job.pk, RenderJob.CANCELLED, error="Cancelled")
+    except PipelineError as e:
+        return fail_or_retry(job.pk, str(e), e.retryable)
+    except Exception as e:
+        logger.exception("Render job %s crashed", job.pk)
+        return fail_or_retry(job.pk, str(e))
+    return finish(job.pk, RenderJob.SUCCEEDED, result=result)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_dispatcher_wake = threading.Event()
+_running_threads = 0
+
+
+def _run_in_thread(job_id):
+    """Pool task: run a job the dispatcher already claimed, then wake the dispatcher for the next one."""
+    global _running_threads
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("In-process render job %s failed", job_id)
+    finally:
+        connection.close()
+        with _dispatcher_lock:
+            _running_threads -= 1
+        _dispatcher_wake.set()
+
+
+def _dispatch_once(pool, threads) -> float:
+    """Claim as many jobs as there are idle threads; returns seconds to sleep before the next pass."""
+    global _running_threads
+    requeue_stale()
+    poll = getattr(settings, "RENDER_JOB_POLL_SECONDS", 10)
+    with _dispatcher_lock:
+        free = threads - _running_threads
+    # Claimed only when a thread is idle, so priority bumps made while jobs wait still count
+    for job_id in claim_next(limit=free) if free > 0 else []:
+        with _dispatcher_lock:
+            _running_threads += 1
+            free -= 1
+        pool.submit(_run_in_thread, job_id)
+    if free <= 0:
+        return poll  # a finishing job wakes the dispatcher
+    # Sleep until the next retry becomes available (available_at is in the future)
+    next_at = (
+        RenderJob.objects.filter(state=RenderJob.QUEUED, cancel_requested=False)
+        .aggregate(next_at=Min("available_at"))["next_at"]
+    )
+    if next_at is None:
+        return poll
+    return min(max((next_at - timezone.now()).total_seconds(), 1.0), poll)
+
+
+def _dispatch_loop():
+    threads = max(getattr(settings, "RENDER_JOB_THREADS", 1), 1)
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="render-job")
+    while True:
+        _dispatcher_wake.clear()
+        try:
+            timeout = _dispatch_once(pool, threads)
+        except Exception:
+            logger.exception("Render job dispatcher pass failed")
+            timeout = getattr(settings, "RENDER_JOB_POLL_SECONDS", 10)
+        finally:
+            connection.close()
+        _dispatcher_wake.wait(timeout)
+
+
+def dispatch_pending():
+    """
+    With RENDER_JOB_RUNNER = 'thread', make sure this process's dispatcher
+    thread is running and wake it. The dispatcher requeues jobs orphaned by a
+    restart, claims one queued job per idle RENDER_JOB_THREADS thread, and
+    polls available_at for jobs waiting on a retry. With 'worker' this is a
+    no-op: the run_render_worker command claims them.
+    """
+    global _dispatcher
+    if getattr(settings, "RENDER_JOB_RUNNER", "thread") != "thread":
+        return
+    with _dispatcher_lock:
+        # Not alive in a worker forked after the app was loaded (gunicorn --preload)
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = threading.Thread(target=_dispatch_loop, name="render-dispatcher", daemon=True)
+            _dispatcher.start()
+    _dispatcher_wake.set()
+
+
+def is_serving_process() -> bool:
+    """
+    False for management commands other than runserver (migrate, test,
+    run_render_worker, ...) and for the autoreloader's file-watching parent.
+    """
+    if Path(sys.argv[0]).name not in ("manage.py", "django-admin"):
+        return True  # gunicorn, uwsgi, daphne, ...
+    if sys.argv[1:2] != ["runserver"]:
+        return False
+    return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
+
+
+def job_payload(job: RenderJob) -> dict:
+    return {
+        "job_id": job.pk,
+        "news_id": job.news_id,
+        "kind": job.kind,
+        "state": job.state,
+        "progress": job.progress,
+        "current_step": job.current_step,
+        "steps": job.steps,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "cancel_requested": job.cancel_requested,
+        "error": job.error or None,
+        "result": job.result,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "priority": job.priority,
+        "status_url": f"/api/jobs/{job.pk}/",
+        "cancel_url": f"/api/jobs/{job.pk}/cancel/",
+    }
@@ -0,0 +1,235 @@
+"""
+CPU-aware admission control for avatar renders and ffmpeg encodes.
+
+Heavy work (lip-sync and the encodes around it) only runs while holding a
+CPU slot. There are RENDER_SLOTS slots (default: one per
+RENDER_THREADS_PER_JOB cores), implemented as RenderLease rows named
+"cpu-slot:<n>", so the limit holds across the web process, render workers
+and ?sync=1 requests alike. Each slot-holder's ffmpeg encodes get
+threads_per_job() threads, so a full machine is shared instead of
+oversubscribed.
+
+admit() is asked before a new job is queued: it answers 429 when the queue
+is full and 503 when the machine is already overloaded, with a Retry-After
+estimated from recent job run times. queue_stats() reports queue depth,
+slot usage and waiting times for /api/jobs/stats/.
+"""
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import single_flight
+from .models import RenderJob, RenderLease
+
+logger = logging.getLogger(__name__)
+
+SLOT_PREFIX = "cpu-slot:"
+# Held by the one multi-slot request that is collecting slots (see CPUSlots)
+RESERVATION_KEY = "cpu-slots-reserved"
+
+
+def cpu_count() -> int:
+    return os.cpu_count() or 1
+
+
+def slot_count() -> int:
+    slots = getattr(settings, "RENDER_SLOTS", 0)
+    if slots > 0:
+        return slots
+    return max(1, cpu_count() // max(getattr(settings, "RENDER_THREADS_PER_JOB", 2), 1))
+
+
+def threads_per_job() -> int:
+    """ffmpeg -threads for one slot-holder: the machine's cores split across the slots."""
+    return max(1, cpu_count() // slot_count())
+
+
+def load_ratio() -> float:
+    """1-minute load average per core (0.0 where the OS can't report it)."""
+    try:
+        return os.getloadavg()[0] / cpu_count()
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def slots_in_use() -> int:
+    return RenderLease.objects.filter(key__startswith=SLOT_PREFIX, expires_at__gte=timezone.now()).count()
+
+
+class CPUSlots:
+    """
+    Hold `count` CPU slots for the duration of a with-block, waiting until
+    they are free. check_cancelled() is called while waiting.
+
+    Slots are normally taken all-or-nothing, so two multi-slot holders can't
+    deadlock each other. A multi-slot request that has to wait takes the
+    single reservation lease instead: from then on it keeps every slot it
+    gets until it has enough, and nobody else takes new slots meanwhile, so
+    a stream of single-slot jobs can't starve it.
+    """
+
+    def __init__(self, count=1, timeout=None, check_cancelled=None):
+        self.count = max(1, min(count, slot_count()))
+        self.timeout = timeout if timeout is not None else getattr(settings, "RENDER_SLOT_WAIT_SECONDS", 3600)
+        self.check_cancelled = check_cancelled
+        self.held = []
+        self.renewers = []
+        self.reservation = None
+        self.wait_seconds = 0.0
+
+    def _hold(self, key, token):
+        renewer = single_flight.LeaseRenewer(key, token)
+        renewer.__enter__()
+        self.held.append((key, token))
+        self.renewers.append(renewer)
+
+    def _try_acquire(self) -> bool:
+        if self.reservation is None and single_flight.is_held(RESERVATION_KEY):
+            return False  # a waiting multi-slot job goes first
+        held_keys = {key for key, _ in self.held}
+        taken = []
+        for index in range(slot_count()):
+            if len(self.held) + len(taken) == self.count:
+                break
+            key = f"{SLOT_PREFIX}{index}"
+            if key in held_keys:
+                continue
+            token = single_flight.acquire(key)
+            if token:
+                taken.append((key, token))
+        if len(self.held) + len(taken) == self.count or self.reservation is not None:
+            for key, token in taken:
+                self._hold(key, token)
+            return len(self.held) == self.count
+        for key, token in taken:
+            single_flight.release(key, token)
+        return False
+
+    def _reserve(self):
+        token = single_flight.acquire(RESERVATION_KEY)
+        if token:
+            self.reservation = (token, single_flight.LeaseRenewer(RESERVATION_KEY, token).__enter__())
+
+    def _release_reservation(self):
+        if self.reservation is not None:
+            token, renewer = self.reservation
+            renewer.__exit__(None, None, None)
+            single_flight.release(RESERVATION_KEY, token)
+            self.reservation = None
+
+    def __enter__(self):
+        started = time.monotonic()
+        poll = getattr(settings, "SINGLE_FLIGHT_POLL_SECONDS", 0.5)
+        try:
+            while not self._try_acquire():
+                if self.count > 1 and self.reservation is None:
+                    self._reserve()
+                if time.monotonic() - started >= self.timeout:
+                    raise single_flight.SingleFlightTimeout(
+                        f"No CPU slot became free within {self.timeout}s"
+                    )
+                if self.check_cancelled:
+                    self.check_cancelled()
+                time.sleep(poll)
+        except BaseException:
+            self.__exit__()
+            raise
+        finally:
+            self._release_reservation()
+        self.wait_seconds = time.monotonic() - started
+        if self.wait_seconds >= 1:
+            logger.info("Waited %.1fs for %d CPU slot(s)", self.wait_seconds, self.count)
+        return self
+
+    def __exit__(self, *exc):
+        for renewer in self.renewers:
+            renewer.__exit__(*exc)
+        for key, token in self.held:
+            single_flight.release(key, token)
+        self.held, self.renewers = [], []
+
+
+def _recent_jobs():
+    return RenderJob.objects.filter(
+        state=RenderJob.SUCCEEDED, started_at__isnull=False, finished_at__isnull=False
+    ).order_by("-finished_at").values_list("created_at", "started_at", "finished_at")[:50]
+
+
+def _averages():
+    recent = list(_recent_jobs())
+    if not recent:
+        return None, None
+    run = sum((f - s).total_seconds() for _, s, f in recent) / len(recent)
+    wait = sum(max((s - c).total_seconds(), 0.0) for c, s, _ in recent) / len(recent)
+    return run, wait
+
+
+def estimated_wait(queued=None, avg_run=None) -> float:
+    """Seconds a newly queued job can expect to wait before it starts."""
+    if queued is None:
+        queued = RenderJob.objects.filter(state=RenderJob.QUEUED).count()
+    if avg_run is None:
+        avg_run, _ = _averages()
+    avg_run = avg_run or getattr(settings, "RENDER_DEFAULT_JOB_SECONDS", 120)
+    return math.ceil(queued / slot_count()) * avg_run
+
+
+def queue_position(job) -> Optional[int]:
+    """1-based position of a queued job in claim order (priority, then age)."""
+    if job.state != RenderJob.QUEUED:
+        return None
+    ahead = RenderJob.objects.filter(state=RenderJob.QUEUED).filter(
+        Q(priority__gt=job.priority) | Q(priority=job.priority, created_at__lt=job.created_at)
+    ).count()
+    return ahead + 1
+
+
+@dataclass
+class Admission:
+    admitted: bool
+    status: int = 202
+    reason: str = ""
+    retry_after: int = 0
+
+
+def admit() -> Admission:
+    """Decide whether a new render may be queued right now."""
+    overload = getattr(settings, "RENDER_OVERLOAD_LOAD", 2.0)
+    ratio = load_ratio()
+    if overload and ratio >= overload:
+        return Admission(False, 503, f"Server overloaded (load {ratio:.1f} per core)",
+                         getattr(settings, "RENDER_OVERLOAD_RETRY_AFTER", 30))
+    limit = getattr(settings, "RENDER_QUEUE_MAX", 20)
+    queued = RenderJob.objects.filter(state=RenderJob.QUEUED).count()
+    if limit and queued >= limit:
+        return Admission(False, 429, f"Render queue is full ({queued} jobs waiting)",
+                         max(int(estimated_wait(queued)), 1))
+    return Admission(True)
+
+
+def queue_stats() -> dict:
+    now = timezone.now()
+    queued = RenderJob.objects.filter(state=RenderJob.QUEUED)
+    oldest = queued.order_by("created_at").values_list("created_at", flat=True).first()
+    depth = queued.count()
+    avg_run, avg_wait = _averages()
+    return {
+        "queued": depth,
+        "running": RenderJob.objects.filter(state=RenderJob.RUNNING).count(),
+        "queue_limit": getattr(settings, "RENDER_QUEUE_MAX", 20),
+        "oldest_queued_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        "avg_queue_wait_seconds": round(avg_wait, 1) if avg_wait is not None else None,
+        "avg_run_seconds": round(avg_run, 1) if avg_run is not None else None,
+        "estimated_wait_seconds": round(estimated_wait(depth, avg_run), 1),
+        "slots": {"total": slot_count(), "in_use": slots_in_use()},
+        "cpu_count": cpu_count(),
+        "threads_per_job": threads_per_job(),
+        "load_per_core": round(load_ratio(), 2),
+    }
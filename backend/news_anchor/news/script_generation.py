@@ -0,0 +1,340 @@
+"""
+Anchoring-script generation helpers: the prompt templates and a bulk mode
+that runs LLM calls concurrently under a token-bucket rate limit, optionally
+packing several articles into one structured-output prompt.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from . import llm_cache
+from .ai_helper import get_ai_response, get_cached_ai_response
+from .dedup import get_canonical
+from .llm_backends import LLMError, LLMResponseError, get_backend
+from .models import AnchoringScript
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_PROMPT_TEMPLATE = (
+    "Write a professional TV news anchoring script for this article:\n\n"
+    "Title: {title}\n"
+    "Description: {description}\n\n"
+    "Keep it natural, engaging, and ready to speak without any labels or directions. "
+    "Make it approximately 100–120 words suitable for 20–25 seconds of speech."
+)
+
+BATCH_PROMPT_TEMPLATE = (
+    "You are writing professional TV news anchoring scripts.\n"
+    "For EACH article in the JSON array below, write a script that is natural, engaging, "
+    "and ready to speak without any labels or directions, approximately 100–120 words "
+    "suitable for 20–25 seconds of speech.\n\n"
+    "Respond with ONLY a JSON object mapping each article's \"id\" (as a string) to its "
+    "script text. Do not add any other keys or commentary.\n\n"
+    "Articles:\n{articles}"
+)
+
+# Part of the LLM cache key: editing either template changes the version, so
+# cached scripts produced by an older template are never served.
+SCRIPT_PROMPT_VERSION = "v1-" + hashlib.sha1(
+    (SCRIPT_PROMPT_TEMPLATE + BATCH_PROMPT_TEMPLATE).encode("utf-8")
+).hexdigest()[:10]
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+def get_existing_script_for_article(article) -> Optional[AnchoringScript]:
+    """
+    Safely returns the AnchoringScript object associated with an article, if present.
+    Works whether AnchoringScript uses OneToOneField (related_name='script') or FK.
+    """
+    # Try attribute access (common if OneToOneField with related_name='script')
+    try:
+        script_obj = getattr(article, "script", None)
+        if script_obj:
+            return script_obj
+    except Exception:
+        # attribute may raise if no relation; ignore and try query
+        pass
+
+    # Fallback: query AnchoringScript table
+    return AnchoringScript.objects.filter(news=article).first()
+
+
+def generate_or_get_script(article) -> Tuple[Optional[AnchoringScript], bool]:
+    """
+    Generate a script only if it doesn't exist. Returns (script_obj, created_flag).
+    created_flag == True means a new script was created.
+    """
+    try:
+        existing = get_existing_script_for_article(article)
+        if existing:
+            return existing, False
+
+        # Near-duplicate of another story: reuse the canonical article's script
+        canonical = get_canonical(article)
+        if canonical:
+            canonical_script, _ = generate_or_get_script(canonical)
+            if canonical_script:
+                logger.info("Reusing script of canonical article id=%s for id=%s", canonical.id, article.id)
+                new_script = AnchoringScript.objects.create(news=article, script=canonical_script.script)
+                return new_script, True
+
+        try:
+            script_text = get_cached_ai_response(build_script_prompt(article), SCRIPT_PROMPT_VERSION)
+        except LLMError as e:
+            logger.warning("AI script generation failed for article id=%s: %s", article.id, e)
+            return None, False
+
+        new_script = AnchoringScript.objects.create(news=article, script=script_text)
+        return new_script, True
+
+    except Exception as e:
+        logger.exception("generate_or_get_script failed for article id=%s", getattr(article, "id", None))
+        return None, False
+
+
+def build_script_prompt(article) -> str:
+    return SCRIPT_PROMPT_TEMPLATE.format(title=article.title, description=article.description)
+
+
+def build_batch_prompt(articles) -> str:
+    payload = [{"id": str(a.id), "title": a.title, "description": a.description or ""} for a in articles]
+    return BATCH_PROMPT_TEMPLATE.format(articles=json.dumps(payload, ensure_ascii=False, indent=1))
+
+
+def parse_batch_response(text, article_ids):
+    """
+    Split a batched response into {article_id: script}. Items that are
+    missing, empty or not strings are left out so the caller can retry them.
+    """
+    if not text:
+        return {}
+    cleaned = _JSON_FENCE_RE.sub("", text.strip())
+    try:
+        data = json.loads(cleaned)
+    except ValueError:
+        # Tolerate prose around the object
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        if start == -1 or end <= start:
+            return {}
+        try:
+            data = json.loads(cleaned[start:end + 1])
+        except ValueError:
+            return {}
+    if not isinstance(data, dict):
+        return {}
+
+    scripts = {}
+    for article_id in article_ids:
+        value = data.get(str(article_id))
+        if isinstance(value, str) and value.strip():
+            scripts[article_id] = value.strip()
+    return scripts
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per minute, up to `burst` saved up.
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def default_rate_limiter(backend=None):
+    rate = getattr(settings, "GEMINI_REQUESTS_PER_MINUTE", 0)
+    if not rate or (backend or get_backend()).name != "gemini":
+        return None
+    return TokenBucket(rate, getattr(settings, "GEMINI_BURST", 1))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+def run_llm_generation(articles, workers, limiter=None, batch_size=1, prompts=None, backend=None):
+    """
+    Generate scripts for the given articles without touching the database.
+
+    With batch_size > 1, each worker sends groups of batch_size articles in a
+    single structured-output prompt and falls back to single-article calls only
+    for items that failed to parse. Returns (scripts_by_id, latencies, failed).
+    """
+    prompts = prompts or {}
+    backend = backend or get_backend()
+
+    def call(prompt):
+        if limiter:
+            limiter.acquire()
+        t0 = time.monotonic()
+        try:
+            return get_ai_response(prompt, backend=backend), None, time.monotonic() - t0
+        except LLMError as e:
+            return None, e, time.monotonic() - t0
+
+    def run_single(article):
+        text, error, latency = call(prompts.get(article.id) or build_script_prompt(article))
+        if error:
+            logger.warning("No script for article id=%s: %s", article.id, error)
+            return {}, [latency]
+        return {article.id: text}, [latency]
+
+    def run_group(group):
+        if len(group) == 1:
+            return run_single(group[0])
+        text, error, latency = call(build_batch_prompt(group))
+        latencies = [latency]
+        if error and not isinstance(error, LLMResponseError):
+            # Timeouts/quota errors would only get worse with K extra calls
+            logger.warning("Batched prompt for %s failed: %s", [a.id for a in group], error)
+            return {}, latencies
+        scripts = parse_batch_response(text, [a.id for a in group])
+        retry = [a for a in group if a.id not in scripts]
+        if retry:
+            logger.info("Batched prompt returned %d/%d scripts; retrying the rest one by one",
+                        len(group) - len(retry), len(group))
+        for article in retry:
+            single, single_latency = run_single(article)
+            scripts.update(single)
+            latencies.extend(single_latency)
+        return scripts, latencies
+
+    batch_size = max(batch_size or 1, 1)
+    groups = [articles[i:i + batch_size] for i in range(0, len(articles), batch_size)]
+    scripts = {}
+    latencies = []
+    failed = 0
+    if not groups:
+        return scripts, latencies, failed
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(run_group, group): group for group in groups}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                group_scripts, group_latencies = future.result()
+            except Exception:
+                logger.exception("Script generation failed for articles %s", [a.id for a in group])
+                failed += len(group)
+                continue
+            scripts.update(group_scripts)
+            latencies.extend(group_latencies)
+            failed += len(group) - len(group_scripts)
+    return scripts, latencies, failed
+
+
+def generate_scripts_bulk(articles, workers=None, limiter=None, batch_size=None, backend=None):
+    """
+    Generate scripts for every article in the queryset that does not have one.
+
+    Pending articles are selected in one query. Near-duplicates whose canonical
+    story has (or is about to get) a script reuse its text, and prompts already
+    in the LLM cache are answered from it; everything else goes through
+    run_llm_generation (thread pool, token bucket, optional batching). Worker
+    threads only call the LLM; cache entries and scripts are written back in bulk.
+    Returns a dict with created/reused/skipped/failed counts and timing stats.
+    """
+    workers = workers or getattr(settings, "SCRIPT_GENERATION_WORKERS", 4)
+    batch_size = batch_size or getattr(settings, "SCRIPT_BATCH_SIZE", 1)
+    backend = backend or get_backend()
+    limiter = limiter or default_rate_limiter(backend)
+    started = time.monotonic()
+
+    total = articles.count()
+    pending = list(articles.filter(script__isnull=True).only("id", "title", "description", "canonical_id"))
+
+    pending_ids = {a.id for a in pending}
+    canonical_ids = {a.canonical_id for a in pending if a.canonical_id}
+    canonical_scripts = dict(
+        AnchoringScript.objects.filter(news_id__in=canonical_ids).values_list("news_id", "script")
+    )
+    llm_targets = []
+    duplicates = []
+    for article in pending:
+        cid = article.canonical_id
+        if cid and (cid in canonical_scripts or cid in pending_ids):
+            duplicates.append(article)
+        else:
+            llm_targets.append(article)
+
+    prompts = {article.id: build_script_prompt(article) for article in llm_targets}
+    keys = {aid: llm_cache.cache_key(prompt, backend.model_name, SCRIPT_PROMPT_VERSION) for aid, prompt in prompts.items()}
+    cached = llm_cache.lookup_many(list(set(keys.values())))
+    generated = {aid: cached[key] for aid, key in keys.items() if key in cached}
+
+    misses = [a for a in llm_targets if a.id not in generated]
+    new_scripts, latencies, failed = run_llm_generation(misses, workers, limiter, batch_size, prompts, backend)
+    generated.update(new_scripts)
+    llm_cache.store_many(
+        {keys[aid]: text for aid, text in new_scripts.items()}, backend.model_name, SCRIPT_PROMPT_VERSION
+    )
+
+    reused = {}
+    for article in duplicates:
+        text = generated.get(article.canonical_id) or canonical_scripts.get(article.canonical_id)
+        if text:
+            reused[article.id] = text
+        else:
+            failed += 1
+
+    new_scripts = [AnchoringScript(news_id=i, script=t) for i, t in {**generated, **reused}.items()]
+    ids = [script.news_id for script in new_scripts]
+    with transaction.atomic():
+        # ignore_conflicts silently drops articles that got a script from another
+        # writer meanwhile, so count what this call actually inserted.
+        before = set(AnchoringScript.objects.filter(news_id__in=ids).values_list("news_id", flat=True))
+        AnchoringScript.objects.bulk_create(
+            new_scripts, batch_size=getattr(settings, "NEWS_BULK_BATCH_SIZE", 500), ignore_conflicts=True
+        )
+        inserted = set(AnchoringScript.objects.filter(news_id__in=ids).values_list("news_id", flat=True)) - before
+    created = sum(1 for aid in generated if aid in inserted)
+    reused_count = sum(1 for aid in reused if aid in inserted)
+
+    elapsed = time.monotonic() - started
+    return {
+        "created": created,
+        "reused": reused_count,
+        "skipped": total - len(pending) + len(new_scripts) - len(inserted),
+        "failed": failed,
+        "total_processed": total,
+        "timing": {
+            "elapsed_seconds": round(elapsed, 3),
+            "llm_calls": len(latencies),
+            "cache_hits": len(llm_targets) - len(misses),
+            "llm_latency_avg": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "llm_latency_p95": round(_percentile(latencies, 0.95), 3),
+            "scripts_per_minute": round(len(new_scripts) / elapsed * 60, 2) if elapsed else 0.0,
+            "workers": workers,
+            "batch_size": batch_size,
+            "backend": backend.name,
+        },
+        "cache": llm_cache.stats.as_dict(),
+    }
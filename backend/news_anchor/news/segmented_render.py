@@ -0,0 +1,294 @@
+"""
+Segmented (multi-core) avatar rendering.
+
+The lip-sync generator renders a clip in one process on one core. In
+segmented mode the TTS audio is cut into N pieces at silence boundaries
+(ffmpeg silencedetect), each piece is rendered by the generator in a
+process pool, and the silent segment videos are joined with the concat
+demuxer (`-c copy`, no re-encode). The original, uncut audio track is then
+muxed back over the joined video, so cuts can never add audio gaps and A/V
+sync is that of a single-pass render.
+
+Cut points are snapped to video frame boundaries (AVATAR_SEGMENT_FPS) so
+per-segment rounding does not accumulate into drift. validate_render()
+compares a segmented render with a single-pass one; see the
+validate_segmented_render management command.
+"""
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+from .media_merge import merge_audio_video, run_ffmpeg
+from .media_probe import probe
+
+logger = logging.getLogger(__name__)
+
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+
+class SegmentedRenderError(Exception):
+    """A segmented render could not be completed; callers fall back to a single pass."""
+
+
+def segment_workers() -> int:
+    workers = getattr(settings, "AVATAR_SEGMENT_WORKERS", 0)
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def segmented_mode_enabled() -> bool:
+    return getattr(settings, "AVATAR_SEGMENTED", False) and segment_workers() > 1
+
+
+def find_silences(audio_path, noise_db=None, min_silence=None) -> List[Tuple[float, float]]:
+    """(start, end) of every silence in the audio, in seconds."""
+    noise_db = noise_db if noise_db is not None else getattr(settings, "AVATAR_SILENCE_NOISE_DB", -35)
+    min_silence = min_silence or getattr(settings, "AVATAR_SILENCE_MIN_SECONDS", 0.25)
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-nostdin", "-i", str(audio_path),
+             "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+            capture_output=True, text=True, timeout=getattr(settings, "MEDIA_FFMPEG_TIMEOUT", 600),
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("silencedetect failed for %s: %s", audio_path, e)
+        return []
+    silences, start = [], None
+    for kind, value in _SILENCE_RE.findall(result.stderr or ""):
+        if kind == "start":
+            start = max(float(value), 0.0)
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+
+def plan_segments(duration, silences, segments, min_seconds=None, fps=None) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into at most `segments` (start, end) ranges, cutting
+    at the middle of the silence closest to each evenly spaced target and
+    never producing a segment shorter than `min_seconds`. Cuts are rounded
+    to whole video frames. Falls back to the even split point when there is
+    no usable silence nearby.
+    """
+    min_seconds = min_seconds if min_seconds is not None else getattr(settings, "AVATAR_SEGMENT_MIN_SECONDS", 5.0)
+    fps = fps or getattr(settings, "AVATAR_SEGMENT_FPS", 25)
+    segments = max(1, min(segments, int(duration // max(min_seconds, 0.001)) or 1))
+    if segments == 1:
+        return [(0.0, duration)]
+
+    midpoints = [(start + end) / 2 for start, end in silences]
+    cuts = []
+    for i in range(1, segments):
+        target = duration * i / segments
+        previous = cuts[-1] if cuts else 0.0
+        usable = [m for m in midpoints if m - previous >= min_seconds and duration - m >= min_seconds]
+        cut = min(usable, key=lambda m: abs(m - target)) if usable else target
+        # Don't stray further than half a segment from the even split
+        if abs(cut - target) > duration / segments / 2:
+            cut = target
+        cut = round(cut * fps) / fps
+        if cut - previous >= min_seconds and duration - cut >= min_seconds:
+            cuts.append(cut)
+
+    bounds = [0.0] + cuts + [duration]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def split_audio(audio_path, ranges, directory) -> List[Path]:
+    """
+    Cut the audio into WAV pieces. Decoding to PCM gives sample-accurate cuts;
+    MP3 pieces would each carry encoder padding and drift out of sync.
+    """
+    pieces = []
+    for index, (start, end) in enumerate(ranges):
+        piece = Path(directory) / f"segment_{index:03d}.wav"
+        run = run_ffmpeg(
+            ["-i", audio_path, "-ss", f"{start:.3f}", "-to", f"{end:.3f}", "-c:a", "pcm_s16le", piece],
+            piece, label="segment:split",
+        )
+        if not run.ok:
+            raise SegmentedRenderError(f"Could not cut audio segment {index}: {run.error}")
+        pieces.append(piece)
+    return pieces
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _render_segment(audio_path, output_path, news_id):
+    """Runs in a pool process: lip-sync one audio piece. Returns the produced video path."""
+    from .avatar_pipeline import generate_lip_synced_video, generate_lip_synced_video_simple
+    from .face_cache import generator_kwargs
+
+    started = time.monotonic()
+    produced = None
+    for generator in (generate_lip_synced_video, generate_lip_synced_video_simple):
+        try:
+            # The face template is memory-mapped from face_cache/, shared by all pool processes
+            produced = generator(audio_path=str(audio_path), output_path=str(output_path), news_id=news_id,
+                                 **generator_kwargs(generator))
+        except Exception as e:
+            logger.warning("%s failed for segment %s: %s", generator.__name__, audio_path, e)
+            produced = None
+        if produced and os.path.exists(produced) and os.path.getsize(produced) > 0:
+            break
+        produced = None
+    return produced, time.monotonic() - started
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """
+    Long-lived spawn pool, so each process loads the lip-sync models once
+    rather than once per render.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def concat_videos(videos, output_path, directory) -> None:
+    """Join segment videos (video streams only) with the concat demuxer, without re-encoding."""
+    list_file = Path(directory) / "segments.txt"
+    with open(list_file, "w", encoding="utf-8") as f:
+        for video in videos:
+            escaped = str(Path(video).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    run = run_ffmpeg(
+        ["-f", "concat", "-safe", "0", "-i", list_file, "-map", "0:v:0", "-c", "copy", output_path],
+        output_path, label="segment:concat",
+    )
+    if not run.ok:
+        raise SegmentedRenderError(f"Concatenating segments failed: {run.error}")
+
+
+def render_segmented(audio_path, output_path, news_id, workers=None, segments=None,
+                     check_cancelled=None) -> dict:
+    """
+    Render the avatar video for `audio_path` into `output_path` using
+    `segments` pieces (default: one per worker). Returns timing/segment
+    metadata; raises SegmentedRenderError on failure.
+    """
+    from .avatar_pipeline import JobCancelled  # avatar_pipeline imports this module
+
+    workers = workers or segment_workers()
+    info = probe(audio_path)
+    if not info or info.duration <= 0:
+        raise SegmentedRenderError(f"Could not read duration of {audio_path}")
+    ranges = plan_segments(info.duration, find_silences(audio_path), segments or workers)
+    if len(ranges) < 2:
+        raise SegmentedRenderError(f"Audio too short to segment ({info.duration:.1f}s)")
+
+    started = time.monotonic()
+    output_path = Path(output_path)
+    with tempfile.TemporaryDirectory(prefix=".segments-", dir=output_path.parent) as directory:
+        pieces = split_audio(audio_path, ranges, directory)
+        if check_cancelled:
+            check_cancelled()
+
+        pool = _get_pool(min(workers, len(pieces)))
+        futures = [
+            pool.submit(_render_segment, piece, Path(directory) / f"segment_{i:03d}.mp4", news_id)
+            for i, piece in enumerate(pieces)
+        ]
+        videos, segment_seconds = [], []
+        try:
+            for index, future in enumerate(futures):
+                if check_cancelled:
+                    check_cancelled()
+                produced, seconds = future.result()
+                if not produced:
+                    raise SegmentedRenderError(f"Segment {index} produced no video")
+                videos.append(produced)
+                segment_seconds.append(round(seconds, 2))
+        except BrokenProcessPool as e:
+            _reset_pool()
+            raise SegmentedRenderError(f"Segment render process died: {e}")
+        except (SegmentedRenderError, JobCancelled):
+            raise
+        except Exception as e:
+            # Worker exceptions, pickling errors, ...: the caller falls back to a single pass
+            raise SegmentedRenderError(f"Segment {len(videos)} failed: {e!r}") from e
+        finally:
+            for future in futures:
+                future.cancel()
+        render_seconds = time.monotonic() - started
+
+        joined = Path(directory) / "joined.mp4"
+        concat_videos(videos, joined, directory)
+        merge = merge_audio_video(joined, audio_path, output_path, strategies=["copy_video", "reencode"])
+        if not merge.ok:
+            raise SegmentedRenderError("Muxing audio over the joined segments failed")
+
+    return {
+        "segments": [[round(a, 3), round(b, 3)] for a, b in ranges],
+        "workers": min(workers, len(ranges)),
+        "segment_render_seconds": segment_seconds,
+        "render_seconds": round(render_seconds, 2),
+        "total_seconds": round(time.monotonic() - started, 2),
+        "merge_strategy": merge.strategy,
+    }
+
+
+def av_sync_offset(info) -> Optional[float]:
+    """|video stream duration - audio stream duration| in seconds, if both are known."""
+    if not info or not info.audio_duration or not info.video_duration:
+        return None
+    return abs(info.video_duration - info.audio_duration)
+
+
+def validate_render(reference_path, candidate_path, tolerance=None) -> dict:
+    """
+    Compare a segmented render with a single-pass render of the same audio:
+    overall duration and A/V stream-length offset must match within
+    `tolerance` seconds (default: two frames).
+    """
+    tolerance = tolerance or 2 / getattr(settings, "AVATAR_SEGMENT_FPS", 25)
+    reference, candidate = probe(reference_path), probe(candidate_path)
+    if not reference or not candidate:
+        return {"ok": False, "error": "Could not probe one of the videos"}
+    ref_sync, cand_sync = av_sync_offset(reference), av_sync_offset(candidate)
+    duration_delta = abs(reference.duration - candidate.duration)
+    sync_ok = cand_sync is not None and cand_sync <= max(ref_sync or 0.0, 0.0) + tolerance
+    return {
+        "ok": duration_delta <= tolerance and sync_ok and candidate.has_audio and candidate.has_video,
+        "reference_duration": round(reference.duration, 3),
+        "candidate_duration": round(candidate.duration, 3),
+        "duration_delta": round(duration_delta, 3),
+        "reference_av_offset": round(ref_sync, 3) if ref_sync is not None else None,
+        "candidate_av_offset": round(cand_sync, 3) if cand_sync is not None else None,
+        "tolerance": round(tolerance, 3),
+        "resolution_match": (reference.width, reference.height) == (candidate.width, candidate.height),
+    }
@@ -1,31 +1,138 @@
 import requests
 import logging
 import base64
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from ..utils import atomic_output
 
 logger = logging.getLogger(__name__)
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+# Voice list cache shared by all service instances: {(base_url, api_key): (fetched_at, data)}
+_voices_cache = {}
+_voices_lock = threading.Lock()
+
+
+class ElevenLabsError(Exception):
+    """ElevenLabs request failed."""
+
+
+class ElevenLabsAuthError(ElevenLabsError):
+    """API key invalid or missing permissions (401/403)."""
+
+
+class ElevenLabsRateLimitError(ElevenLabsError):
+    """Still rate limited (429) after all retries."""
+
+
+def get_session():
+    """
+    Return the process-wide requests.Session for ElevenLabs calls, so
+    connections (and TLS handshakes) are reused across requests and threads.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = max(getattr(settings, "ELEVENLABS_POOL_SIZE", 8), 1)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
 class ElevenLabsService:
-    def __init__(self):
-        # Replace with your valid ElevenLabs API key
-        self.api_key = "sk_f9084572a8747e800a74f59c1f111d735fbab3dfc0d3b720"
-        self.base_url = "https://api.elevenlabs.io/v1"
+    def __init__(self, api_key=None, base_url=None, max_retries=None, session=None):
+        self.api_key = api_key or getattr(settings, "ELEVENLABS_API_KEY", "")
+        self.base_url = (base_url or getattr(settings, "ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")).rstrip("/")
         self.headers = {
             "xi-api-key": self.api_key,
             "Content-Type": "application/json"
         }
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, "ELEVENLABS_MAX_RETRIES", 3)
+        self.backoff_base = getattr(settings, "ELEVENLABS_BACKOFF_BASE", 0.5)
+        self.backoff_max = getattr(settings, "ELEVENLABS_BACKOFF_MAX", 30)
+        self.session = session or get_session()
 
-    def text_to_speech(self, text, voice_id=None, model_id="eleven_monolingual_v1"):
+    def _backoff(self, attempt, response=None):
+        delay = retry_after_seconds(response) if response is not None else None
+        if delay is None:
+            delay = self.backoff_base * (2 ** attempt) * random.uniform(0.8, 1.2)
+        return min(delay, self.backoff_max)
+
+    def _request(self, method, path, timeout, stream=False, **kwargs):
         """
-        Convert text to speech using ElevenLabs API
+        Send a request through the shared session, retrying connection errors,
+        429 and 5xx with exponential backoff (Retry-After wins when present).
         """
-        if not self.api_key or self.api_key == "YOUR_VALID_ELEVENLABS_API_KEY_HERE":
-            raise Exception("Please set a valid ElevenLabs API key")
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            try:
+                response = self.session.request(
+                    method, url, headers=self.headers, timeout=timeout, stream=stream, **kwargs
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_try:
+                    raise ElevenLabsError(f"ElevenLabs request failed: {e}") from e
+                delay = self._backoff(attempt)
+                logger.warning(f"ElevenLabs {method} {path} failed ({e}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
 
-        voice_id = voice_id or "21m00Tcm4TlvDq8ikWAM"
+            if response.status_code == 401:
+                response.close()
+                raise ElevenLabsAuthError("Invalid API key. Please check your ElevenLabs API key.")
+            if response.status_code == 403:
+                response.close()
+                raise ElevenLabsAuthError("API key missing permissions. Upgrade your ElevenLabs plan.")
+            if response.status_code in RETRY_STATUSES:
+                response.close()
+                if last_try:
+                    if response.status_code == 429:
+                        raise ElevenLabsRateLimitError("API rate limit exceeded. Please try again later.")
+                    raise ElevenLabsError(f"ElevenLabs returned HTTP {response.status_code}")
+                delay = self._backoff(attempt, response)
+                logger.warning(f"ElevenLabs {method} {path} returned {response.status_code}; retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
 
-        url = f"{self.base_url}/text-to-speech/{voice_id}"
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                response.close()
+                raise ElevenLabsError(f"Voice generation failed: {e}") from e
+            return response
 
-        data = {
+    def _speech_payload(self, text, model_id):
+        return {
             "text": text,
             "model_id": model_id,
             "voice_settings": {
@@ -36,48 +143,88 @@ class ElevenLabsService:
             }
         }
 
+    def stream_speech(self, text, voice_id=None, model_id="eleven_monolingual_v1", chunk_size=16 * 1024):
+        """
+        Yield MP3 bytes as they arrive from the API (no full-response buffering).
+        Retries only happen before the first byte is returned.
+        """
+        if not self.api_key or self.api_key == "YOUR_VALID_ELEVENLABS_API_KEY_HERE":
+            raise ElevenLabsAuthError("Please set a valid ElevenLabs API key")
+
+        voice_id = voice_id or "21m00Tcm4TlvDq8ikWAM"
+        timeout = getattr(settings, "ELEVENLABS_TIMEOUT", 30)
+        response = self._request(
+            "POST", f"/text-to-speech/{voice_id}", timeout, stream=True, json=self._speech_payload(text, model_id)
+        )
         try:
-            response = requests.post(url, json=data, headers=self.headers, timeout=30)
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            raise ElevenLabsError(f"Voice generation failed mid-stream: {e}") from e
+        finally:
+            response.close()
 
-            if response.status_code == 401:
-                raise Exception("Invalid API key. Please check your ElevenLabs API key.")
-            elif response.status_code == 403:
-                raise Exception("API key missing permissions. Upgrade your ElevenLabs plan.")
-            elif response.status_code == 429:
-                raise Exception("API rate limit exceeded. Please try again later.")
+    def text_to_speech_bytes(self, text, voice_id=None, model_id="eleven_monolingual_v1"):
+        return b"".join(self.stream_speech(text, voice_id, model_id))
 
-            response.raise_for_status()
+    def text_to_speech_file(self, text, path, voice_id=None, model_id="eleven_monolingual_v1"):
+        """
+        Stream the MP3 straight to `path` (written atomically: the file only
+        appears once the download completed). Returns the number of bytes written.
+        """
+        written = 0
+        with atomic_output(path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                for chunk in self.stream_speech(text, voice_id, model_id):
+                    f.write(chunk)
+                    written += len(chunk)
+        return written
 
-            audio_base64 = base64.b64encode(response.content).decode('utf-8')
+    def text_to_speech(self, text, voice_id=None, model_id="eleven_monolingual_v1"):
+        """
+        Convert text to speech using ElevenLabs API.
+        Returns the audio base64-encoded; prefer stream_speech/text_to_speech_file,
+        which avoid holding (and re-encoding) the whole MP3 in memory.
+        """
+        voice_id = voice_id or "21m00Tcm4TlvDq8ikWAM"
+        try:
+            audio = self.text_to_speech_bytes(text, voice_id, model_id)
+        except ElevenLabsError as e:
+            logger.error(f"ElevenLabs API error: {e}")
+            raise
 
-            return {
-                "audio_data": audio_base64,
-                "content_type": "audio/mpeg",
-                "voice_id": voice_id,
-                "text_length": len(text)
-            }
+        audio_base64 = base64.b64encode(audio).decode('utf-8')
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"ElevenLabs API error: {e}")
-            raise Exception(f"Voice generation failed: {str(e)}")
+        return {
+            "audio_data": audio_base64,
+            "content_type": "audio/mpeg",
+            "voice_id": voice_id,
+            "text_length": len(text)
+        }
 
     def get_available_voices(self):
-        """Get list of available voices"""
-        url = f"{self.base_url}/voices"
+        """Get list of available voices (cached for ELEVENLABS_VOICES_TTL seconds)"""
+        ttl = getattr(settings, "ELEVENLABS_VOICES_TTL", 3600)
+        cache_key = (self.base_url, self.api_key)
+        with _voices_lock:
+            cached = _voices_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
 
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-
-            if response.status_code == 401:
-                raise Exception("Invalid API key")
-            elif response.status_code == 403:
-                raise Exception("API key missing permissions")
-
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            response = self._request("GET", "/voices", timeout=10)
+            data = response.json()
+        except (ElevenLabsError, ValueError) as e:
             logger.error(f"Error fetching voices: {e}")
-            return self.get_default_voices()
+            if isinstance(e, ElevenLabsAuthError):
+                raise
+            # Serve a stale list over the hard-coded defaults if we ever had one
+            return cached[1] if cached else self.get_default_voices()
+
+        with _voices_lock:
+            _voices_cache[cache_key] = (time.monotonic(), data)
+        return data
 
     def get_default_voices(self):
         """Return default voices when API is unavailable"""
@@ -119,4 +266,4 @@ ELEVENLABS_VOICES = {
     "elli": "MF3mGyEYCl7XYWbV9V6O",
     "josh": "TxGEqnHWrfWFTfGW9XjX",
     "sam": "yoZ06aMxZJJ28mfd3POQ",
-}
\ No newline at end of file
+}
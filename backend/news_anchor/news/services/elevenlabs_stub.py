@@ -0,0 +1,156 @@
+"""
+Local stand-in for the ElevenLabs HTTP API, for tests and benchmarks.
+
+Serves POST /v1/text-to-speech/<voice_id> (a silent but valid MP3 whose
+length follows the text, sent in chunks with configurable latency) and
+GET /v1/voices. Every Nth request can be answered with 429 + Retry-After or
+a 503 to exercise the client's retry path. Standard library only, so it runs
+without Django:
+
+    python news/services/elevenlabs_stub.py --port 8765 --latency 0.3 --rate-limit-every 5
+
+and point the service at it with ELEVENLABS_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, ~26 ms of audio
+SILENT_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+FRAMES_PER_CHAR = 2  # ~15 chars/second of speech
+
+STUB_VOICES = {
+    "voices": [
+        {"voice_id": "21m00Tcm4TlvDq8ikWAM", "name": "Rachel", "category": "premade"},
+        {"voice_id": "ErXwobaYiN019PkySvjV", "name": "Antoni", "category": "premade"},
+    ]
+}
+
+
+class StubState:
+    def __init__(self, latency=0.0, chunk_delay=0.0, rate_limit_every=0, error_every=0, retry_after=1):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.rate_limit_every = rate_limit_every
+        self.error_every = error_every
+        self.retry_after = retry_after
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def next_request(self):
+        with self.lock:
+            self.requests += 1
+            return next(self.counter)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client's connection pool is exercised
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _injected_failure(self):
+        n = self.state.next_request()
+        if self.state.rate_limit_every and n % self.state.rate_limit_every == 0:
+            self._send_json(429, {"detail": "rate limited"}, {"Retry-After": str(self.state.retry_after)})
+            return True
+        if self.state.error_every and n % self.state.error_every == 0:
+            self._send_json(503, {"detail": "unavailable"})
+            return True
+        return False
+
+    def _authorized(self):
+        if self.headers.get("xi-api-key"):
+            return True
+        self._send_json(401, {"detail": "missing api key"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized() or self._injected_failure():
+            return
+        if self.path.rstrip("/") == "/v1/voices":
+            self._send_json(200, STUB_VOICES)
+        else:
+            self._send_json(404, {"detail": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if not self._authorized() or self._injected_failure():
+            return
+        if not self.path.startswith("/v1/text-to-speech/"):
+            self._send_json(404, {"detail": "not found"})
+            return
+        try:
+            text = json.loads(raw or b"{}").get("text") or ""
+        except ValueError:
+            self._send_json(400, {"detail": "invalid json"})
+            return
+
+        time.sleep(self.state.latency)
+        frames = max(len(text) * FRAMES_PER_CHAR, 1)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        frames_per_chunk = 32
+        for start in range(0, frames, frames_per_chunk):
+            chunk = SILENT_FRAME * min(frames_per_chunk, frames - start)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            if self.state.chunk_delay:
+                time.sleep(self.state.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_stub_server(host="127.0.0.1", port=0, **state_kwargs):
+    """
+    Start the stub in a daemon thread. Returns (server, base_url); call
+    server.shutdown() to stop it. port=0 picks a free port.
+    """
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(**state_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="elevenlabs-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local ElevenLabs API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first audio byte")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between audio chunks")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429")
+    parser.add_argument("--error-every", type=int, default=0, help="Answer every Nth request with 503")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        args.host, args.port, latency=args.latency, chunk_delay=args.chunk_delay,
+        rate_limit_every=args.rate_limit_every, error_every=args.error_every, retry_after=args.retry_after,
+    )
+    print(f"ElevenLabs stub listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Cross-process single-flight for expensive renders.
+
+Only one caller at a time (across threads and worker processes) may render
+a given key: the leader takes a RenderLease row. Everyone else waits until
+the lease is released and then reuses the leader's output instead of
+rendering it again. Leases are renewed while the leader works and expire
+after SINGLE_FLIGHT_LEASE_SECONDS if it dies, so a crashed render never
+blocks a key for good.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import RenderLease
+
+logger = logging.getLogger(__name__)
+
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SingleFlightTimeout(Exception):
+    """Waited longer than the allowed time for another render of the same key."""
+
+
+def _lease_seconds():
+    return getattr(settings, "SINGLE_FLIGHT_LEASE_SECONDS", 60)
+
+
+def acquire(key, lease_seconds=None):
+    """Try to take the lease for `key`. Returns an owner token, or None if it is held."""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=lease_seconds or _lease_seconds())
+    token = f"{OWNER_ID}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}"
+    try:
+        with transaction.atomic():
+            RenderLease.objects.create(key=key, owner=token, acquired_at=now, expires_at=expires_at)
+        return token
+    except IntegrityError:
+        pass
+    # Take over an abandoned (expired) lease
+    taken = RenderLease.objects.filter(key=key, expires_at__lt=now).update(
+        owner=token, acquired_at=now, expires_at=expires_at
+    )
+    return token if taken == 1 else None
+
+
+def release(key, token):
+    RenderLease.objects.filter(key=key, owner=token).delete()
+
+
+def renew(key, token, lease_seconds=None) -> bool:
+    expires_at = timezone.now() + timedelta(seconds=lease_seconds or _lease_seconds())
+    return RenderLease.objects.filter(key=key, owner=token).update(expires_at=expires_at) == 1
+
+
+def is_held(key) -> bool:
+    return RenderLease.objects.filter(key=key, expires_at__gte=timezone.now()).exists()
+
+
+def wait_for_release(key, timeout=None, poll=None):
+    """Block until nobody holds `key`. Raises SingleFlightTimeout after `timeout` seconds."""
+    timeout = timeout if timeout is not None else getattr(settings, "SINGLE_FLIGHT_WAIT_SECONDS", 900)
+    poll = poll or getattr(settings, "SINGLE_FLIGHT_POLL_SECONDS", 0.5)
+    deadline = time.monotonic() + timeout
+    while is_held(key):
+        if time.monotonic() >= deadline:
+            raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for render of {key}")
+        time.sleep(poll)
+
+
+class LeaseRenewer:
+    """Keeps a lease alive from a side thread while the leader renders."""
+
+    def __init__(self, key, token, lease_seconds=None):
+        self.key = key
+        self.token = token
+        self.lease_seconds = lease_seconds or _lease_seconds()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"lease-{key}", daemon=True)
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                if not renew(self.key, self.token, self.lease_seconds):
+                    logger.warning("Lost single-flight lease for %s", self.key)
+                    break
+        except Exception:
+            logger.exception("Renewing single-flight lease for %s failed", self.key)
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join(timeout=5)
+
+
+def run_single_flight(key, compute, reuse, lease_seconds=None, wait_timeout=None):
+    """
+    Run compute() for `key` unless another process/thread is already doing it.
+
+    reuse() must return the already produced result, or None if there is
+    none yet. Followers wait for the leader and return reuse(); if the leader
+    failed (reuse() is still None) one follower becomes the next leader.
+    Returns (result, led) where led is True when this call ran compute().
+    """
+    existing = reuse()
+    if existing is not None:
+        return existing, False
+
+    waited = False
+    while True:
+        token = acquire(key, lease_seconds)
+        if token:
+            try:
+                # The previous leader may have finished between our reuse() and acquire()
+                if waited:
+                    existing = reuse()
+                    if existing is not None:
+                        return existing, False
+                with LeaseRenewer(key, token, lease_seconds):
+                    return compute(), True
+            finally:
+                release(key, token)
+
+        logger.info("Render of %s already in progress elsewhere; waiting for it", key)
+        wait_for_release(key, wait_timeout)
+        waited = True
+        existing = reuse()
+        if existing is not None:
+            return existing, False
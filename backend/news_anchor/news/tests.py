@@ -1,3 +1,493 @@
-from django.test import TestCase
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from .dedup import BAND_BITS, LSH_BANDS, hamming, index_articles, lsh_bands, simhash
+from .media_serving import parse_range, serve_file
+from . import ingest_scheduler, llm_cache, scheduler, single_flight
+from .models import IngestSchedule, LLMResponseCache, NearDuplicateBucket, NewsArticle, RenderJob, RenderLease
+from .render_queue import claim, claim_next, enqueue, requeue_stale
+from .script_generation import TokenBucket, parse_batch_response
+from .services.elevenlabs_service import ElevenLabsService
+from .services.elevenlabs_stub import FRAMES_PER_CHAR, SILENT_FRAME, STUB_VOICES, start_stub_server
+from .tts import mp3_audio_frames, mp3_gapless_info, split_sentences
+
+
+class NearDuplicateTests(TestCase):
+    def article(self, n, title, description=""):
+        return NewsArticle.objects.create(title=title, description=description, url=f"https://example.com/{n}")
+
+    def test_bands_rebuild_the_hash(self):
+        value = simhash("central bank raises interest rates again")
+        bands = lsh_bands(value)
+        self.assertEqual(len(bands), LSH_BANDS)
+        self.assertEqual(sum(bucket << (band * BAND_BITS) for band, bucket in bands), value)
+
+    def test_close_hashes_share_a_band(self):
+        value = simhash("storm closes schools across the region")
+        # Fewer flipped bits than bands: at least one band is untouched
+        near = value ^ (1 << 0) ^ (1 << 20) ^ (1 << 40)
+        self.assertEqual(hamming(value, near), 3)
+        self.assertTrue(set(lsh_bands(value)) & set(lsh_bands(near)))
+
+    def test_duplicate_links_to_first_seen_article(self):
+        text = "Storm closes schools across the region as flooding spreads through low lying towns"
+        first = self.article(1, f"{text} - BBC News")
+        second = self.article(2, f"{text} - Reuters")
+        other = self.article(3, "Local team wins the championship after a dramatic overtime finish")
+
+        self.assertEqual(index_articles([first, second, other]), 1)
+        second.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(second.canonical_id, first.id)
+        self.assertIsNone(other.canonical_id)
+        self.assertEqual(NearDuplicateBucket.objects.filter(article=first).count(), LSH_BANDS)
+
+    def test_later_batch_finds_existing_canonical(self):
+        text = "Parliament passes the new budget after a long overnight session of debate"
+        first = self.article(1, text)
+        index_articles([first])
+        second = self.article(2, f"{text} - AP")
+
+        self.assertEqual(index_articles([second]), 1)
+        second.refresh_from_db()
+        self.assertEqual(second.canonical_id, first.id)
+
+
+class TokenBucketTests(TestCase):
+    def test_burst_is_immediate_then_paced(self):
+        bucket = TokenBucket(rate_per_minute=600, burst=2)  # one token per 100 ms
+        start = time.monotonic()
+        bucket.acquire()
+        bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+
+    def test_burst_below_one_still_allows_a_request(self):
+        bucket = TokenBucket(rate_per_minute=60, burst=0)
+        self.assertEqual(bucket.capacity, 1)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+
+# MPEG1 Layer III, 128 kbit/s, 44.1 kHz, no padding: 417-byte frames of 1152 samples
+MP3_HEADER = b"\xff\xfb\x90\x64"
+MP3_FRAME_LENGTH = 417
+
+
+def mp3_frame(fill: int) -> bytes:
+    return MP3_HEADER + bytes([fill]) * (MP3_FRAME_LENGTH - 4)
+
+
+def info_frame(delay: int, padding: int) -> bytes:
+    """Info header frame with a LAME extension carrying the gapless fields."""
+    body = b"\x00" * 32 + b"Info" + (0).to_bytes(4, "big") + b"LAME3.100" + b"\x00" * 12
+    body += bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8), padding & 0xFF])
+    return MP3_HEADER + body + b"\x00" * (MP3_FRAME_LENGTH - 4 - len(body))
+
+
+class MP3FrameTests(TestCase):
+    def test_gapless_info(self):
+        self.assertEqual(mp3_gapless_info(info_frame(576, 1800)), (576, 1800))
+        self.assertIsNone(mp3_gapless_info(mp3_frame(1)))
+
+    def test_strips_tags_and_info_frame(self):
+        audio = mp3_frame(1) + mp3_frame(2)
+        id3v2 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"x" * 5
+        id3v1 = b"TAG" + b"\x00" * 125
+        self.assertEqual(mp3_audio_frames(id3v2 + info_frame(0, 0) + audio + id3v1), audio)
+
+    def test_drops_whole_padding_frames(self):
+        audio = b"".join(mp3_frame(i) for i in range(1, 5))
+        # 529 samples of padding are decoder delay; the rest covers one full frame
+        trimmed = mp3_audio_frames(info_frame(576, 529 + 1152 + 100) + audio)
+        self.assertEqual(trimmed, audio[:3 * MP3_FRAME_LENGTH])
+
+    def test_keeps_frames_when_stream_is_truncated(self):
+        audio = b"".join(mp3_frame(i) for i in range(1, 4)) + b"\xff\xfb"
+        self.assertEqual(mp3_audio_frames(info_frame(576, 529 + 1152) + audio), audio)
+
+
+class SplitSentencesTests(TestCase):
+    def test_merges_short_sentences(self):
+        text = "One. Two words. Three is a bit longer now. Four is fine too."
+        # The first chunk only needs half of min_chars
+        self.assertEqual(split_sentences(text, min_chars=20, max_chars=100),
+                         ["One. Two words.", "Three is a bit longer now.", "Four is fine too."])
+
+    def test_respects_max_chars(self):
+        text = "Alpha beta gamma. Delta epsilon zeta. Eta theta iota kappa lambda mu."
+        chunks = split_sentences(text, min_chars=60, max_chars=40)
+        self.assertEqual(chunks, ["Alpha beta gamma. Delta epsilon zeta.", "Eta theta iota kappa lambda mu."])
+        self.assertEqual(" ".join(chunks), text)
+
+    def test_folds_a_short_tail_into_the_previous_chunk(self):
+        text = "This opening sentence is long enough. Ok."
+        self.assertEqual(split_sentences(text, min_chars=20, max_chars=100), [text])
+
+
+class RangeTests(TestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-5000", 1000), (0, 999))
+        self.assertEqual(parse_range("bytes=500-5000", 1000), (500, 999))
+
+    def test_parse_range_ignored_or_invalid(self):
+        self.assertIsNone(parse_range("", 1000))
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 1000))
+        self.assertEqual(parse_range("bytes=1000-", 1000), "invalid")
+        self.assertEqual(parse_range("bytes=-0", 1000), "invalid")
+        self.assertEqual(parse_range("bytes=20-10", 1000), "invalid")
+        self.assertEqual(parse_range("bytes=-5", 0), "invalid")
+
+    def test_serve_file_partial_and_unsatisfiable(self):
+        with tempfile.TemporaryDirectory() as root:
+            (Path(root) / "clip.mp3").write_bytes(bytes(range(100)))
+            factory = RequestFactory()
+
+            response = serve_file(factory.get("/", HTTP_RANGE="bytes=10-19"), "clip.mp3", root)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+            self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+
+            response = serve_file(factory.get("/", HTTP_RANGE="bytes=100-"), "clip.mp3", root)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */100")
+
+            response = serve_file(factory.get("/", HTTP_IF_NONE_MATCH=response["ETag"]), "clip.mp3", root)
+            self.assertEqual(response.status_code, 304)
+
+
+class MediaOffloadTests(TestCase):
+    def test_accel_redirect_paths_are_relative_to_base_dir(self):
+        with tempfile.TemporaryDirectory() as base:
+            videos = Path(base) / "news_videos"
+            ladder = videos / "hls" / "103"
+            ladder.mkdir(parents=True)
+            (videos / "103.mp4").write_bytes(b"mp4")
+            (ladder / "master.m3u8").write_text("#EXTM3U\n")
+            request = RequestFactory().get("/")
+
+            with override_settings(BASE_DIR=base, MEDIA_SENDFILE="x-accel-redirect",
+                                   MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/"):
+                mp4 = serve_file(request, "103.mp4", videos)
+                master = serve_file(request, "master.m3u8", ladder)
+
+            self.assertEqual(mp4["X-Accel-Redirect"], "/protected-media/news_videos/103.mp4")
+            self.assertEqual(master["X-Accel-Redirect"], "/protected-media/news_videos/hls/103/master.m3u8")
+
+
+class RenderQueueTests(TestCase):
+    def setUp(self):
+        self.articles = [
+            NewsArticle.objects.create(title=f"Story {n}", url=f"https://example.com/story-{n}") for n in range(4)
+        ]
+
+    def test_claim_is_exclusive(self):
+        job, created = enqueue(self.articles[0].id)
+        self.assertTrue(created)
+        self.assertTrue(claim(job.id, worker="a"))
+        self.assertFalse(claim(job.id, worker="b"))
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.worker, job.attempts), (RenderJob.RUNNING, "a", 1))
+
+    def test_enqueue_again_raises_priority(self):
+        job, _ = enqueue(self.articles[0].id)
+        again, created = enqueue(self.articles[0].id)
+        self.assertFalse(created)
+        self.assertEqual((again.pk, again.priority), (job.pk, 1))
+
+    def test_claim_next_order_and_eligibility(self):
+        low, _ = enqueue(self.articles[0].id)
+        high, _ = enqueue(self.articles[1].id, priority=5)
+        later, _ = enqueue(self.articles[2].id, priority=9)
+        cancelled, _ = enqueue(self.articles[3].id, priority=9)
+        RenderJob.objects.filter(pk=later.pk).update(available_at=timezone.now() + timedelta(minutes=5))
+        RenderJob.objects.filter(pk=cancelled.pk).update(cancel_requested=True)
+
+        self.assertEqual(claim_next(limit=1), [high.pk])
+        self.assertEqual(claim_next(limit=5), [low.pk])
+        self.assertEqual(claim_next(limit=5), [])
+
+    def test_requeue_stale(self):
+        job, _ = enqueue(self.articles[0].id)
+        claim(job.id)
+        RenderJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, RenderJob.QUEUED)
+
+        claim(job.id)
+        RenderJob.objects.filter(pk=job.pk).update(attempts=job.max_attempts, heartbeat_at=None)
+        self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, RenderJob.FAILED)
+
+
+class ElevenLabsStubTests(TestCase):
+    def service(self, **stub_kwargs):
+        server, base_url = start_stub_server(**stub_kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        session = requests.Session()
+        session.trust_env = False  # no proxies for the local stub
+        self.addCleanup(session.close)
+        return ElevenLabsService(api_key="test-key", base_url=base_url, session=session), server.RequestHandlerClass.state
+
+    def test_rate_limit_retry_honours_retry_after(self):
+        service, state = self.service(rate_limit_every=2, retry_after=1)
+        service.text_to_speech_bytes("first")
+        start = time.monotonic()
+        audio = service.text_to_speech_bytes("second")  # 429 once, then served
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+        self.assertEqual(state.requests, 3)
+        self.assertTrue(audio.startswith(SILENT_FRAME))
+
+    def test_text_to_speech_file_writes_the_stream(self):
+        service, _ = self.service()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "speech.mp3"
+            written = service.text_to_speech_file("hello", path)
+            self.assertEqual(path.read_bytes(), SILENT_FRAME * len("hello") * FRAMES_PER_CHAR)
+            self.assertEqual(written, path.stat().st_size)
+
+    def test_voices_are_cached(self):
+        service, state = self.service()
+        self.assertEqual(service.get_available_voices(), STUB_VOICES)
+        self.assertEqual(service.get_available_voices(), STUB_VOICES)
+        self.assertEqual(state.requests, 1)
+
+
+@override_settings(SINGLE_FLIGHT_POLL_SECONDS=0.05)
+class SingleFlightTests(TestCase):
+    def test_acquire_release_renew(self):
+        token = single_flight.acquire("tts:a")
+        self.assertIsNotNone(token)
+        self.assertIsNone(single_flight.acquire("tts:a"))
+        self.assertTrue(single_flight.is_held("tts:a"))
+
+        self.assertTrue(single_flight.renew("tts:a", token, lease_seconds=600))
+        self.assertFalse(single_flight.renew("tts:a", "someone-else"))
+        single_flight.release("tts:a", "someone-else")
+        self.assertTrue(single_flight.is_held("tts:a"))
+
+        single_flight.release("tts:a", token)
+        self.assertFalse(single_flight.is_held("tts:a"))
+        self.assertIsNotNone(single_flight.acquire("tts:a"))
+
+    def test_expired_lease_is_taken_over(self):
+        old = single_flight.acquire("avatar:1")
+        RenderLease.objects.filter(key="avatar:1").update(expires_at=timezone.now() - timedelta(seconds=1))
+        new = single_flight.acquire("avatar:1")
+        self.assertIsNotNone(new)
+        self.assertNotEqual(new, old)
+        # The crashed leader can no longer renew or release it
+        self.assertFalse(single_flight.renew("avatar:1", old))
+        single_flight.release("avatar:1", old)
+        self.assertTrue(single_flight.is_held("avatar:1"))
+
+    def test_leader_computes_and_releases(self):
+        result = single_flight.run_single_flight("tts:b", lambda: "rendered", lambda: None)
+        self.assertEqual(result, ("rendered", True))
+        self.assertFalse(RenderLease.objects.filter(key="tts:b").exists())
+
+    def test_existing_result_is_reused(self):
+        result = single_flight.run_single_flight("tts:c", self.fail, lambda: "stored")
+        self.assertEqual(result, ("stored", False))
+
+    def test_follower_reuses_the_leaders_result(self):
+        single_flight.acquire("tts:d")
+        RenderLease.objects.filter(key="tts:d").update(expires_at=timezone.now() + timedelta(milliseconds=200))
+        outcomes = iter([None, "stored"])  # nothing yet, then the leader's output
+        result = single_flight.run_single_flight("tts:d", self.fail, lambda: next(outcomes))
+        self.assertEqual(result, ("stored", False))
+
+    def test_follower_gives_up_after_wait_timeout(self):
+        single_flight.acquire("tts:e")
+        with self.assertRaises(single_flight.SingleFlightTimeout):
+            single_flight.run_single_flight("tts:e", self.fail, lambda: None, wait_timeout=0.1)
+
+
+@override_settings(RENDER_SLOTS=2, SINGLE_FLIGHT_POLL_SECONDS=0.05)
+class CPUSlotsTests(TestCase):
+    def test_count_is_clamped_to_the_slot_count(self):
+        slots = scheduler.CPUSlots(5)
+        self.assertEqual(slots.count, 2)
+        with slots:
+            self.assertEqual(scheduler.slots_in_use(), 2)
+        self.assertEqual(scheduler.slots_in_use(), 0)
+
+    def test_reservation_blocks_single_slot_jobs(self):
+        token = single_flight.acquire(scheduler.RESERVATION_KEY)
+        with self.assertRaises(single_flight.SingleFlightTimeout):
+            with scheduler.CPUSlots(1, timeout=0.1):
+                pass
+        self.assertEqual(scheduler.slots_in_use(), 0)
+
+        single_flight.release(scheduler.RESERVATION_KEY, token)
+        with scheduler.CPUSlots(1):
+            self.assertEqual(scheduler.slots_in_use(), 1)
+
+    def test_waiting_multi_slot_job_reserves_and_gives_up_cleanly(self):
+        with scheduler.CPUSlots(1):
+            with self.assertRaises(single_flight.SingleFlightTimeout):
+                with scheduler.CPUSlots(2, timeout=0.1):
+                    pass
+            # It kept no partial slots and dropped its reservation
+            self.assertEqual(scheduler.slots_in_use(), 1)
+            self.assertFalse(single_flight.is_held(scheduler.RESERVATION_KEY))
+
+
+@override_settings(RENDER_OVERLOAD_LOAD=2.0, RENDER_OVERLOAD_RETRY_AFTER=30, RENDER_QUEUE_MAX=2)
+class AdmissionTests(TestCase):
+    @mock.patch("news.scheduler.load_ratio", return_value=0.5)
+    def test_admits_when_idle(self, _):
+        self.assertTrue(scheduler.admit().admitted)
+
+    @mock.patch("news.scheduler.load_ratio", return_value=3.0)
+    def test_overloaded_machine_answers_503(self, _):
+        admission = scheduler.admit()
+        self.assertEqual((admission.admitted, admission.status, admission.retry_after), (False, 503, 30))
+
+    @mock.patch("news.scheduler.load_ratio", return_value=0.5)
+    def test_full_queue_answers_429(self, _):
+        for n in range(2):
+            article = NewsArticle.objects.create(title=f"Story {n}", url=f"https://example.com/queued-{n}")
+            enqueue(article.id)
+        admission = scheduler.admit()
+        self.assertEqual((admission.admitted, admission.status), (False, 429))
+        self.assertGreaterEqual(admission.retry_after, 1)
+
+
+@override_settings(NEWS_INGEST_LOCK_TIMEOUT=600, NEWS_INGEST_BACKOFF_BASE=60, NEWS_INGEST_BACKOFF_MAX=300)
+class IngestScheduleTests(TestCase):
+    def setUp(self):
+        self.schedule = IngestSchedule.objects.create(category="technology", next_run_at=timezone.now())
+
+    def test_claim_is_exclusive(self):
+        self.assertTrue(ingest_scheduler.claim(self.schedule))
+        self.assertFalse(ingest_scheduler.claim(self.schedule))
+
+    def test_stale_lock_is_taken_over(self):
+        IngestSchedule.objects.filter(pk=self.schedule.pk).update(
+            running_since=timezone.now() - timedelta(seconds=601), running_owner="crashed:1"
+        )
+        self.assertTrue(ingest_scheduler.claim(self.schedule))
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.running_owner, ingest_scheduler.OWNER_ID)
+
+    @mock.patch("news.ingest_scheduler.fetch_and_store_news", return_value={"requests": 1, "errors": 0})
+    def test_release_by_another_owner_is_ignored(self, _):
+        ingest_scheduler.claim(self.schedule)
+        # The lock went stale and another process took it over
+        IngestSchedule.objects.filter(pk=self.schedule.pk).update(running_owner="other:2")
+        ingest_scheduler.run_schedule(self.schedule)
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.running_owner, "other:2")
+        self.assertIsNotNone(self.schedule.running_since)
+
+    @mock.patch("news.ingest_scheduler.fetch_and_store_news", return_value=None)
+    def test_failed_run_backs_off(self, _):
+        ingest_scheduler.claim(self.schedule)
+        ingest_scheduler.run_schedule(self.schedule)
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.consecutive_failures, 1)
+        self.assertIsNone(self.schedule.running_since)
+        self.assertGreater(self.schedule.next_run_at, timezone.now() + timedelta(seconds=50))
+
+    def test_backoff_grows_and_is_capped(self):
+        delays = []
+        for failures in (1, 2, 3, 4, 10):
+            self.schedule.consecutive_failures = failures
+            delays.append(ingest_scheduler.backoff_seconds(self.schedule))
+        self.assertEqual(delays, [60, 120, 240, 300, 300])
+
+
+class MemoryLRUTests(TestCase):
+    def test_least_recently_used_entry_is_dropped(self):
+        lru = llm_cache.MemoryLRU(2)
+        now = timezone.now()
+        lru.set("a", "A", now)
+        lru.set("b", "B", now)
+        lru.get("a", now - timedelta(days=1))
+        lru.set("c", "C", now)
+        self.assertEqual(list(lru.data), ["a", "c"])
+
+    def test_expired_entry_is_a_miss(self):
+        lru = llm_cache.MemoryLRU(2)
+        lru.set("a", "A", timezone.now() - timedelta(days=2))
+        self.assertEqual(lru.get("a", timezone.now() - timedelta(days=1)), (None, False))
+        self.assertNotIn("a", lru.data)
+
+    def test_touch_is_due_once_per_interval(self):
+        lru = llm_cache.MemoryLRU(2)
+        now = timezone.now()
+        lru.set("a", "A", now)
+        self.assertEqual(lru.get("a", now - timedelta(days=1), time.monotonic() - 60), ("A", False))
+        self.assertEqual(lru.get("a", now - timedelta(days=1), time.monotonic() + 1), ("A", True))
+        self.assertEqual(lru.get("a", now - timedelta(days=1), time.monotonic() - 1), ("A", False))
+
+
+@override_settings(LLM_CACHE_EVICT_EVERY=1000)
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(llm_cache, "memory", llm_cache.MemoryLRU(100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        llm_cache.stats.reset()
+
+    def test_store_then_lookup_from_memory(self):
+        llm_cache.store_many({"k1": "one", "k2": "two"}, "model", "v1")
+        self.assertEqual(llm_cache.lookup_many(["k1", "k2", "k3"]), {"k1": "one", "k2": "two"})
+        stats = llm_cache.stats.as_dict()
+        self.assertEqual((stats["memory_hits"], stats["db_hits"], stats["misses"]), (2, 0, 1))
+
+    def test_db_hit_warms_memory(self):
+        llm_cache.store_many({"k1": "one"}, "model", "v1")
+        llm_cache.memory.data.clear()
+        self.assertEqual(llm_cache.lookup_many(["k1"]), {"k1": "one"})
+        self.assertEqual(LLMResponseCache.objects.get(key="k1").hits, 1)
+        self.assertIn("k1", llm_cache.memory.data)
+        self.assertEqual(llm_cache.stats.as_dict()["db_hits"], 1)
+
+    def test_expired_rows_are_misses(self):
+        llm_cache.store_many({"k1": "one"}, "model", "v1")
+        llm_cache.memory.data.clear()
+        LLMResponseCache.objects.update(created_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(llm_cache.lookup_many(["k1"]), {})
+
+    @override_settings(LLM_CACHE_TOUCH_INTERVAL=-1)
+    def test_memory_hit_refreshes_the_row_when_due(self):
+        llm_cache.store_many({"k1": "one"}, "model", "v1")
+        old = timezone.now() - timedelta(days=1)
+        LLMResponseCache.objects.update(last_accessed_at=old)
+        llm_cache.lookup_many(["k1"])
+        self.assertGreater(LLMResponseCache.objects.get(key="k1").last_accessed_at, old)
+
+
+class BatchResponseTests(TestCase):
+    def test_fenced_json(self):
+        text = '```json\n{"1": "Script one.", "2": "Script two."}\n```'
+        self.assertEqual(parse_batch_response(text, [1, 2]), {1: "Script one.", 2: "Script two."})
+
+    def test_prose_around_the_object(self):
+        text = 'Here are the scripts:\n{"7": "  Seven.  "}\nHope this helps!'
+        self.assertEqual(parse_batch_response(text, [7]), {7: "Seven."})
+
+    def test_partial_and_extra_ids(self):
+        text = '{"1": "One.", "2": "", "3": ["not", "a", "string"], "99": "Not asked for."}'
+        self.assertEqual(parse_batch_response(text, [1, 2, 3, 4]), {1: "One."})
+
+    def test_malformed(self):
+        for text in ("", "no json here", "{broken", '["1", "2"]', '{"1": "One."'):
+            self.assertEqual(parse_batch_response(text, [1]), {}, text)
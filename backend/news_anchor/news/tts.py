@@ -0,0 +1,612 @@
+"""
+Text-to-speech for anchoring scripts: per-article generation used by the
+views and a bulk rendering job that pre-renders every missing/stale MP3
+with a bounded worker pool. Audio lives in the content-addressed store
+(news/audio_store.py).
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from . import audio_store, single_flight
+from .models import AnchoringScript, NewsArticle
+from .script_generation import get_existing_script_for_article
+from .tts_router import get_router
+
+logger = logging.getLogger(__name__)
+
+AUDIO_DIR = Path(settings.BASE_DIR) / "news_audios"
+AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+
+TTS_MODEL = "tts-1"
+TTS_VOICE = "alloy"
+TTS_SPEED = 1.0
+TTS_MAX_CHARS = 4000  # be cautious of max token/char limits
+
+_client_local = threading.local()
+
+
+def ensure_a4f_client():
+    """
+    Lazily import and return an A4F client instance (one per thread).
+    This avoids import-time failure if the package isn't available.
+    """
+    client = getattr(_client_local, "client", None)
+    if client is not None:
+        return client
+    try:
+        from a4f_local import A4F
+        client = _client_local.client = A4F()
+        return client
+    except Exception:
+        logger.exception("A4F import/instantiation failed")
+        raise
+
+
+def synthesize_a4f(text: str) -> bytes:
+    """Render text to MP3 bytes with the A4F client."""
+    client = ensure_a4f_client()
+    # Some providers may require bytes; our client returns bytes
+    return client.audio.speech.create(
+        model=TTS_MODEL,
+        input=text[:TTS_MAX_CHARS],
+        voice=TTS_VOICE,
+        speed=TTS_SPEED
+    )
+
+
+def synthesize_speech(text: str, provider=None):
+    """
+    Render text to MP3 bytes through the provider router (hedged/failover
+    across TTS_PROVIDERS); `provider` pins the call to one provider.
+    Returns (audio_bytes, provider that answered).
+    """
+    router = get_router()
+    audio_bytes, name = router.synthesize(text[:TTS_MAX_CHARS], provider=provider)
+    return audio_bytes, router.provider(name)
+
+
+# ---------------------------
+# Sentence-chunked synthesis
+# ---------------------------
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?।])\s+")
+
+# MPEG audio bitrate (kbps) / sample-rate tables, indexed by header bits
+_MP3_BITRATES = {
+    (3, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG1 Layer III
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG2/2.5 Layer III
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+# Samples a decoder outputs late, on top of the encoder delay recorded in the LAME header
+_MP3_DECODER_DELAY = 529
+
+
+def split_sentences(text: str, min_chars=None, max_chars=None):
+    """
+    Split a script at sentence boundaries into chunks for parallel synthesis.
+    Short sentences are merged so each chunk has at least min_chars characters;
+    the first chunk only needs half of that so playback can start sooner.
+    """
+    min_chars = min_chars or getattr(settings, "TTS_CHUNK_MIN_CHARS", 80)
+    max_chars = max_chars or TTS_MAX_CHARS
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        if not sentence:
+            continue
+        candidate = f"{current} {sentence}".strip()
+        threshold = min_chars if chunks else min_chars // 2
+        if current and (len(current) >= threshold or len(candidate) > max_chars):
+            chunks.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        if chunks and len(current) < min_chars // 2:
+            chunks[-1] = f"{chunks[-1]} {current}"
+        else:
+            chunks.append(current)
+    return chunks
+
+
+def _mp3_frame_length(data: bytes, offset: int) -> int:
+    """Length of the MPEG Layer III frame starting at offset (0 if not a frame header)."""
+    if offset + 4 > len(data) or data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+        return 0
+    version = (data[offset + 1] >> 3) & 0x03
+    layer = (data[offset + 1] >> 1) & 0x03
+    bitrate_index = (data[offset + 2] >> 4) & 0x0F
+    rate_index = (data[offset + 2] >> 2) & 0x03
+    padding = (data[offset + 2] >> 1) & 0x01
+    if layer != 1 or version == 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+    bitrate = _MP3_BITRATES[(3 if version == 3 else 2, 3)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+
+def _mp3_samples_per_frame(data: bytes, offset: int) -> int:
+    # Layer III: 1152 samples per frame for MPEG1, 576 for MPEG2/2.5
+    return 1152 if (data[offset + 1] >> 3) & 0x03 == 3 else 576
+
+
+def mp3_gapless_info(frame: bytes) -> Optional[Tuple[int, int]]:
+    """
+    (encoder delay, end padding) in samples from the LAME extension of a
+    Xing/Info header frame (also written by ffmpeg), or None if absent.
+    """
+    for tag in (b"Xing", b"Info"):
+        pos = frame.find(tag)
+        if pos != -1:
+            break
+    else:
+        return None
+    if pos + 8 > len(frame):
+        return None
+    flags = int.from_bytes(frame[pos + 4:pos + 8], "big")
+    # Optional fields: frame count, byte count, 100-byte TOC, quality
+    lame = pos + 8 + sum(size for bit, size in ((1, 4), (2, 4), (4, 100), (8, 4)) if flags & bit)
+    if lame + 24 > len(frame) or frame[lame:lame + 4] not in (b"LAME", b"Lavc", b"Lavf"):
+        return None
+    raw = frame[lame + 21:lame + 24]
+    return (raw[0] << 4) | (raw[1] >> 4), ((raw[1] & 0x0F) << 8) | raw[2]
+
+
+def mp3_audio_frames(data: bytes) -> bytes:
+    """
+    Strip ID3v2/ID3v1 tags and the Xing/Info/VBRI header frame from an MP3 so
+    several encodes can be concatenated into one stream without bogus length
+    metadata in the middle of it.
+
+    When the header carries LAME gapless info, trailing frames that are pure
+    end padding are dropped too. The encoder delay at the start (about one
+    frame, 25-50 ms of silence) is kept: leading frames cannot be removed
+    without re-encoding, as the next frames borrow bits from them (bit
+    reservoir). Joined chunks therefore have a short pause, not a
+    sample-exact join, at every boundary.
+    """
+    start, end = 0, len(data)
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+
+    gapless = None
+    frame_length = _mp3_frame_length(data, start)
+    if frame_length and any(tag in data[start:start + frame_length] for tag in (b"Xing", b"Info", b"VBRI")):
+        gapless = mp3_gapless_info(data[start:start + frame_length])
+        start += frame_length
+
+    if gapless and gapless[1] > _MP3_DECODER_DELAY:
+        offsets = []
+        offset = start
+        while offset < end:
+            length = _mp3_frame_length(data, offset)
+            if not length:
+                break
+            offsets.append(offset)
+            offset += length
+        if offsets and offset == end:
+            trailing = (gapless[1] - _MP3_DECODER_DELAY) // _mp3_samples_per_frame(data, start)
+            if 0 < trailing < len(offsets):
+                end = offsets[-trailing]
+    return data[start:end]
+
+
+def synthesize_chunked(text: str, workers=None, provider=None):
+    """
+    Synthesize sentence chunks concurrently and yield their MP3 frames in
+    script order; the first chunk is yielded as soon as it is ready, while the
+    rest are still rendering. Concatenating the yielded parts gives one
+    playable MP3, with a short pause at each sentence join (see
+    mp3_audio_frames).
+    """
+    chunks = split_sentences(text[:TTS_MAX_CHARS])
+    workers = workers or getattr(settings, "TTS_CHUNK_WORKERS", 4)
+    # All chunks of a script come from one provider so the voice doesn't change mid-script
+    provider = provider or get_router().preferred()
+    pool = ThreadPoolExecutor(max_workers=max(min(workers, len(chunks)), 1))
+    try:
+        futures = [pool.submit(synthesize_speech, chunk, provider) for chunk in chunks]
+        for index, future in enumerate(futures):
+            audio_bytes, _ = future.result()
+            if not audio_bytes:
+                raise ValueError(f"TTS provider returned empty audio for chunk {index}")
+            yield mp3_audio_frames(audio_bytes)
+    finally:
+        # Stop pending work if the consumer went away (e.g. client disconnected)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def chunked_mode_enabled() -> bool:
+    return getattr(settings, "TTS_CHUNKED", False)
+
+
+def synthesis_model_key(chunked: bool, provider=None) -> str:
+    # Chunked output differs from a single-call render, so it gets its own store key
+    model = provider.model if provider is not None else TTS_MODEL
+    return f"{model}+chunked" if chunked else model
+
+
+def legacy_audio_path(news_id: int) -> Path:
+    """Pre-audio-store location of an article's MP3."""
+    return AUDIO_DIR / f"script_{news_id}.mp3"
+
+
+def legacy_audio_is_current(path: Path, script_obj) -> bool:
+    """True when the legacy MP3 exists and was written after the script was (re)created."""
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return False
+    created = getattr(script_obj, "created_at", None)
+    return created is None or mtime >= created.timestamp()
+
+
+def script_audio_digest(text: str, chunked=None, provider=None) -> str:
+    """
+    Store key of the script's audio in `provider`'s voice. Lookups use the
+    primary provider (first in TTS_PROVIDERS); audio that a failover or hedge
+    got from another provider is stored under that provider's own key.
+    """
+    chunked = chunked_mode_enabled() if chunked is None else chunked
+    provider = provider or get_router().primary()
+    return audio_store.audio_digest(
+        text[:TTS_MAX_CHARS], provider.voice, synthesis_model_key(chunked, provider), TTS_SPEED
+    )
+
+
+def legacy_audio_digest(text: str) -> str:
+    """Key of a pre-store script_<id>.mp3: A4F, default voice, single call."""
+    return audio_store.audio_digest(text[:TTS_MAX_CHARS], TTS_VOICE, TTS_MODEL, TTS_SPEED)
+
+
+def render_script_audio(text: str, chunked=None):
+    """
+    Full MP3 for a script, single-call or sentence-chunked (TTS_CHUNKED).
+    Returns (audio_bytes, provider that rendered it).
+    """
+    chunked = chunked_mode_enabled() if chunked is None else chunked
+    if chunked:
+        provider = get_router().preferred()
+        return b"".join(synthesize_chunked(text, provider=provider)), provider
+    return synthesize_speech(text)
+
+
+def save_script_audio(text: str, audio_bytes: bytes, provider, chunked=None):
+    """Store a render under the key of the provider that produced it. Returns the AudioBlob."""
+    chunked = chunked_mode_enabled() if chunked is None else chunked
+    digest = script_audio_digest(text, chunked, provider)
+    return audio_store.save(digest, audio_bytes, provider.voice, synthesis_model_key(chunked, provider), TTS_SPEED)
+
+
+def tts_generate_for_article(news_id: int) -> Tuple[Optional[Path], Optional[str]]:
+    """
+    Generate (or reuse existing) TTS MP3 for the article's anchoring script.
+    Audio is looked up in the content-addressed store first, so identical text
+    is only synthesized once and an edited script never serves stale audio.
+    Returns (audio_path (Path) or None, error_message or None).
+    """
+    try:
+        article = NewsArticle.objects.filter(id=news_id).first()
+        if not article:
+            return None, f"No news article found with ID {news_id}"
+
+        script_obj = get_existing_script_for_article(article)
+        if not script_obj:
+            return None, f"No anchoring script found for news ID {news_id}"
+
+        text = script_obj.script.strip() if script_obj.script else ""
+        if not text:
+            return None, "Script text is empty"
+
+        digest = script_audio_digest(text)
+
+        def render():
+            audio_store.stats.record_miss()
+            legacy = legacy_audio_path(news_id)
+            if legacy_audio_digest(text) == digest and legacy_audio_is_current(legacy, script_obj):
+                # Adopt a file rendered before the audio store existed
+                blob = audio_store.register_file(digest, legacy, TTS_VOICE, TTS_MODEL, TTS_SPEED)
+            else:
+                logger.info("Generating TTS for news_id %s ...", news_id)
+                audio_bytes, provider = render_script_audio(text)
+                if not audio_bytes:
+                    raise ValueError("TTS provider returned empty audio")
+                blob = save_script_audio(text, audio_bytes, provider)
+                if blob.digest != digest:
+                    logger.info("TTS for news_id %s came from %s; stored under its own voice key",
+                                news_id, provider.name)
+                logger.info("TTS saved: %s", blob.path)
+            audio_store.enforce_quota(keep={blob.digest})
+            return blob
+
+        # Concurrent requests for the same text (any process) wait for one render
+        blob, rendered = single_flight.run_single_flight(f"tts:{digest}", render, lambda: audio_store.lookup(digest))
+        if not rendered:
+            logger.info("Using stored audio %s for news_id %s", digest[:12], news_id)
+
+        audio_store.assign(news_id, blob)
+        return Path(blob.path), None
+
+    except Exception as e:
+        logger.exception("tts_generate_for_article failed for news_id=%s", news_id)
+        return None, str(e)
+
+
+class AudioRenderBusy(Exception):
+    """Another request is rendering this text; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LeasedStream:
+    """
+    Streaming body that holds the text's render lease: the lease is renewed
+    from the moment the stream is created and released by close(), which
+    the server calls when the response ends - also when the client went
+    away before the first chunk was ever requested.
+    """
+
+    def __init__(self, chunks, key, token):
+        self.chunks = chunks
+        self.key = key
+        self.token = token
+        self.renewer = single_flight.LeaseRenewer(key, token).__enter__()
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.chunks.close()
+        finally:
+            self.renewer.__exit__(None, None, None)
+            single_flight.release(self.key, self.token)
+
+
+def stream_article_audio(news_id: int):
+    """
+    Audio for the streaming endpoint. Returns (path, None, None) when the
+    chunked render is already stored, (None, LeasedStream, None) to stream a
+    fresh chunked render (stored once the last chunk arrives), or
+    (None, None, error). Raises AudioRenderBusy when another request is
+    rendering the same text and does not finish within TTS_STREAM_WAIT_SECONDS.
+    """
+    article = NewsArticle.objects.filter(id=news_id).first()
+    if not article:
+        return None, None, f"No news article found with ID {news_id}"
+    script_obj = get_existing_script_for_article(article)
+    text = (script_obj.script or "").strip() if script_obj else ""
+    if not text:
+        return None, None, f"No anchoring script found for news ID {news_id}"
+
+    digest = script_audio_digest(text, chunked=True)
+    key = f"tts:{digest}"
+    blob = audio_store.lookup(digest)
+    token = None if blob else single_flight.acquire(key)
+    if not blob and token is None:
+        # Someone else is rendering this text right now: serve their result if
+        # it is nearly done, otherwise tell the client to come back
+        retry_after = getattr(settings, "TTS_STREAM_RETRY_AFTER", 5)
+        try:
+            single_flight.wait_for_release(key, timeout=getattr(settings, "TTS_STREAM_WAIT_SECONDS", 2))
+        except single_flight.SingleFlightTimeout:
+            raise AudioRenderBusy("Audio is being rendered by another request", retry_after)
+        blob = audio_store.lookup(digest)
+        token = None if blob else single_flight.acquire(key)
+        if not blob and token is None:
+            raise AudioRenderBusy("Audio is being rendered by another request", retry_after)
+    if blob:
+        audio_store.assign(news_id, blob)
+        return Path(blob.path), None, None
+    audio_store.stats.record_miss()
+
+    def generate():
+        provider = get_router().preferred()
+        parts = []
+        for part in synthesize_chunked(text, provider=provider):
+            parts.append(part)
+            yield part
+        # Only a complete render is stored; a disconnect mid-stream stores nothing
+        blob = save_script_audio(text, b"".join(parts), provider, chunked=True)
+        if chunked_mode_enabled():
+            audio_store.assign(news_id, blob)
+        audio_store.enforce_quota(keep={blob.digest})
+
+    try:
+        return None, LeasedStream(generate(), key, token), None
+    except Exception:
+        single_flight.release(key, token)
+        raise
+
+
+# ---------------------------
+# Bulk rendering job
+# ---------------------------
+def render_missing_audio(workers=None, limit=None, force=False, news_ids=None):
+    """
+    Render every AnchoringScript whose audio is missing or out of date.
+
+    Scripts and the article->blob index are loaded in bulk; scripts with
+    identical text share one render, and text already in the audio store is
+    just re-linked. Worker threads hold the text's single-flight lease while
+    they call the TTS provider and write the file atomically (temp file +
+    rename); texts another request is already rendering are linked once it
+    finishes. Returns a report with counts, failures and throughput.
+    """
+    workers = workers or getattr(settings, "TTS_RENDER_WORKERS", 4)
+    started = time.monotonic()
+
+    scripts = AnchoringScript.objects.only("id", "news_id", "script", "created_at").order_by("-news_id")
+    if news_ids is not None:
+        scripts = scripts.filter(news_id__in=news_ids)
+    wanted = {}
+    for script_obj in scripts:
+        text = (script_obj.script or "").strip()
+        if text:
+            wanted[script_obj.news_id] = (script_audio_digest(text), text)
+
+    current = {} if force else audio_store.current_digests(wanted)
+    stale = {news_id: item for news_id, item in wanted.items() if current.get(news_id) != item[0]}
+    up_to_date = len(wanted) - len(stale)
+
+    # Group articles by digest: one render (or store hit) per distinct text
+    by_digest = {}
+    for news_id, (digest, text) in stale.items():
+        by_digest.setdefault(digest, (text, []))[1].append(news_id)
+    digests = list(by_digest)
+    if limit:
+        digests = digests[:limit]
+
+    linked = 0
+    to_render = []
+    for digest in digests:
+        blob = None if force else audio_store.lookup(digest)
+        if blob:
+            for news_id in by_digest[digest][1]:
+                audio_store.assign(news_id, blob)
+                linked += 1
+        else:
+            to_render.append(digest)
+
+    def render(digest):
+        # Returns None when another process/request is already rendering this
+        # text, and a size of None when it finished just before we got the lease
+        key = f"tts:{digest}"
+        token = single_flight.acquire(key)
+        if token is None:
+            return None
+        try:
+            blob = None if force else audio_store.lookup(digest)
+            if blob:
+                return blob, None, None
+            with single_flight.LeaseRenewer(key, token):
+                t0 = time.monotonic()
+                text = by_digest[digest][0]
+                audio_bytes, provider = render_script_audio(text)
+                if not audio_bytes:
+                    raise ValueError("TTS provider returned empty audio")
+                # A failover render is stored under its provider's key; the
+                # articles are linked to it and re-rendered by a later run
+                blob = save_script_audio(text, audio_bytes, provider)
+                return blob, len(audio_bytes), time.monotonic() - t0
+        finally:
+            single_flight.release(key, token)
+            connection.close()
+
+    rendered = 0
+    total_bytes = 0
+    latencies = []
+    failures = []
+    in_flight_elsewhere = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(render, digest): digest for digest in to_render}
+        for future in as_completed(futures):
+            digest = futures[future]
+            news_ids_for_digest = by_digest[digest][1]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                logger.warning("TTS render failed for news_ids=%s: %s", news_ids_for_digest, e)
+                failures.extend({"news_id": i, "error": str(e)} for i in news_ids_for_digest)
+                continue
+            if outcome is None:
+                in_flight_elsewhere.append(digest)
+                continue
+            blob, size, latency = outcome
+            if size is None:
+                for news_id in news_ids_for_digest:
+                    audio_store.assign(news_id, blob)
+                    linked += 1
+                continue
+            audio_store.stats.record_miss()
+            for news_id in news_ids_for_digest:
+                audio_store.assign(news_id, blob)
+            rendered += 1
+            total_bytes += size
+            latencies.append(latency)
+
+    # Link the texts another request was rendering once it is done
+    for digest in in_flight_elsewhere:
+        try:
+            single_flight.wait_for_release(f"tts:{digest}")
+        except single_flight.SingleFlightTimeout as e:
+            failures.extend({"news_id": i, "error": str(e)} for i in by_digest[digest][1])
+            continue
+        blob = audio_store.lookup(digest)
+        if blob is None:
+            failures.extend({"news_id": i, "error": "concurrent render failed"} for i in by_digest[digest][1])
+            continue
+        for news_id in by_digest[digest][1]:
+            audio_store.assign(news_id, blob)
+            linked += 1
+
+    audio_store.enforce_quota(keep=set(digests))
+    elapsed = time.monotonic() - started
+    return {
+        "pending": len(stale),
+        "rendered": rendered,
+        "linked_from_store": linked,
+        "up_to_date": up_to_date,
+        "failed": len(failures),
+        "failures": failures[:50],
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "scripts_per_minute": round(rendered / elapsed * 60, 2) if elapsed else 0.0,
+        "audio_bytes": total_bytes,
+        "bytes_per_second": round(total_bytes / elapsed) if elapsed else 0,
+        "avg_render_seconds": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "store": audio_store.stats.as_dict(),
+    }
+
+
+_render_state = {"running": False, "last_report": None, "started_at": None}
+_render_lock = threading.Lock()
+
+
+def render_missing_audio_async(**kwargs) -> bool:
+    """
+    Start render_missing_audio in a background thread.
+    Returns False if a render started by this process is still running.
+    """
+    with _render_lock:
+        if _render_state["running"]:
+            return False
+        _render_state["running"] = True
+        _render_state["started_at"] = time.time()
+
+    def run():
+        report = None
+        try:
+            report = render_missing_audio(**kwargs)
+        except Exception as e:
+            logger.exception("Background TTS render failed")
+            report = {"error": str(e)}
+        finally:
+            with _render_lock:
+                _render_state["running"] = False
+                _render_state["last_report"] = report
+            connection.close()
+
+    threading.Thread(target=run, name="tts-render", daemon=True).start()
+    return True
+
+
+def tts_render_status() -> dict:
+    with _render_lock:
+        return dict(_render_state)
@@ -0,0 +1,263 @@
+"""
+TTS provider routing.
+
+Every provider (A4F, ElevenLabs) implements TTSProvider.synthesize(text) ->
+MP3 bytes. TTSRouter keeps a sliding window of latencies and outcomes per
+provider and:
+- sends a request to the first healthy provider in TTS_PROVIDERS order;
+- if it has not answered within its observed p95 latency, fires a hedged
+  request at the next provider and returns whichever succeeds first;
+- fails over immediately when a provider errors;
+- opens a circuit breaker on a provider after TTS_CIRCUIT_FAILURES
+  consecutive failures, skipping it for TTS_CIRCUIT_COOLDOWN seconds before
+  letting a trial request through again.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .script_generation import _percentile
+
+logger = logging.getLogger(__name__)
+
+
+class TTSProviderError(Exception):
+    """Every provider tried for a request failed."""
+
+
+class TTSProvider:
+    """
+    `voice` and `model` identify what the audio sounds like; stored audio is
+    keyed by them, so output of different providers never shares a key.
+    """
+    name = "base"
+    voice = ""
+    model = ""
+
+    def synthesize(self, text: str) -> bytes:
+        raise NotImplementedError
+
+
+class A4FProvider(TTSProvider):
+    name = "a4f"
+
+    def __init__(self):
+        from .tts import TTS_MODEL, TTS_VOICE  # tts imports this module
+
+        self.voice = TTS_VOICE
+        self.model = TTS_MODEL
+
+    def synthesize(self, text):
+        from .tts import synthesize_a4f
+        return synthesize_a4f(text)
+
+
+class ElevenLabsProvider(TTSProvider):
+    name = "elevenlabs"
+
+    def __init__(self):
+        from .services.elevenlabs_service import ElevenLabsService
+
+        self.service = ElevenLabsService()
+        self.voice = self.voice_id = getattr(settings, "TTS_ELEVENLABS_VOICE", "21m00Tcm4TlvDq8ikWAM")
+        self.model = "eleven_monolingual_v1"
+
+    def synthesize(self, text):
+        return self.service.text_to_speech_bytes(text, voice_id=self.voice_id, model_id=self.model)
+
+
+PROVIDERS = {
+    "a4f": A4FProvider,
+    "elevenlabs": ElevenLabsProvider,
+}
+
+
+class ProviderStats:
+    """Sliding-window latency/outcome stats plus a consecutive-failure circuit breaker."""
+
+    def __init__(self, window, failure_threshold, cooldown):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.requests = self.failures = self.hedges_won = self.failovers_won = 0
+
+    def record(self, ok, latency):
+        with self.lock:
+            self.requests += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+            else:
+                self.failures += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failure_threshold:
+                    self.open_until = time.monotonic() + self.cooldown
+
+    def available(self):
+        # After the cooldown the circuit is half-open: requests go through and
+        # the next success closes it (another failure re-opens it)
+        with self.lock:
+            return time.monotonic() >= self.open_until
+
+    def p95(self):
+        with self.lock:
+            return _percentile(list(self.latencies), 0.95) if len(self.latencies) >= 5 else None
+
+    def as_dict(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            outcomes = list(self.outcomes)
+            open_for = max(self.open_until - time.monotonic(), 0.0)
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "hedges_won": self.hedges_won,
+                "failovers_won": self.failovers_won,
+                "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+                "latency_p50": round(_percentile(latencies, 0.5), 3),
+                "latency_p95": round(_percentile(latencies, 0.95), 3),
+                "latency_p99": round(_percentile(latencies, 0.99), 3),
+                "circuit_open": open_for > 0,
+                "circuit_open_seconds": round(open_for, 1),
+            }
+
+
+class TTSRouter:
+    def __init__(self, providers):
+        self.providers = providers
+        window = getattr(settings, "TTS_ROUTER_WINDOW", 200)
+        threshold = getattr(settings, "TTS_CIRCUIT_FAILURES", 5)
+        cooldown = getattr(settings, "TTS_CIRCUIT_COOLDOWN", 60)
+        self.stats = {p.name: ProviderStats(window, threshold, cooldown) for p in providers}
+        self.hedging = getattr(settings, "TTS_HEDGE_ENABLED", True)
+        self.pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, "TTS_ROUTER_WORKERS", 16), thread_name_prefix="tts-router"
+        )
+
+    def candidates(self):
+        """Providers in preference order, healthy ones first."""
+        healthy = [p for p in self.providers if self.stats[p.name].available()]
+        return healthy + [p for p in self.providers if p not in healthy]
+
+    def preferred(self) -> TTSProvider:
+        return self.candidates()[0]
+
+    def primary(self) -> TTSProvider:
+        """First provider in TTS_PROVIDERS order, whose voice stored audio is looked up under."""
+        return self.providers[0]
+
+    def provider(self, name) -> TTSProvider:
+        return next(p for p in self.providers if p.name == name)
+
+    def hedge_delay(self, provider):
+        p95 = self.stats[provider.name].p95()
+        if p95 is None:
+            return getattr(settings, "TTS_HEDGE_DEFAULT_DELAY", 4.0)
+        low = getattr(settings, "TTS_HEDGE_MIN_DELAY", 0.5)
+        high = getattr(settings, "TTS_HEDGE_MAX_DELAY", 15.0)
+        return min(max(p95, low), high)
+
+    def call(self, provider, text):
+        """Synthesize with one provider, recording latency/outcome."""
+        t0 = time.monotonic()
+        try:
+            audio = provider.synthesize(text)
+            if not audio:
+                raise TTSProviderError(f"{provider.name} returned empty audio")
+        except Exception:
+            self.stats[provider.name].record(False, time.monotonic() - t0)
+            raise
+        self.stats[provider.name].record(True, time.monotonic() - t0)
+        return audio
+
+    def synthesize(self, text: str, provider: TTSProvider = None):
+        """
+        Return (audio_bytes, provider_name). With `provider` the call is pinned
+        to it (no hedging/failover), e.g. so all chunks of one script share a voice.
+        """
+        if provider is not None:
+            return self.call(provider, text), provider.name
+
+        queue = self.candidates()
+        running = {}
+        hedged = set()  # launched because the request before it was slow, not because it failed
+        errors = []
+
+        def launch():
+            provider = queue.pop(0)
+            running[self.pool.submit(self.call, provider, text)] = provider
+            return provider
+
+        primary = launch()
+        timeout = self.hedge_delay(primary) if self.hedging and queue else None
+        while running:
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slower than its p95: hedge with the next provider
+                hedge = launch()
+                hedged.add(hedge)
+                logger.info("TTS hedge: no answer after %.2fs, also trying %s", timeout, hedge.name)
+                timeout = self.hedge_delay(hedge) if queue else None
+                continue
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    audio = future.result()
+                except Exception as e:
+                    logger.warning("TTS provider %s failed: %s", provider.name, e)
+                    errors.append(f"{provider.name}: {e}")
+                    continue
+                if provider is not primary:
+                    stats = self.stats[provider.name]
+                    with stats.lock:
+                        if provider in hedged:
+                            stats.hedges_won += 1
+                        else:
+                            stats.failovers_won += 1
+                # Losing requests finish in the background and only feed the stats
+                return audio, provider.name
+            if not running and queue:
+                failover = launch()
+                timeout = self.hedge_delay(failover) if self.hedging and queue else None
+        raise TTSProviderError("All TTS providers failed: " + "; ".join(errors))
+
+    def report(self):
+        return {
+            "order": [p.name for p in self.providers],
+            "hedging": self.hedging,
+            "providers": {name: stats.as_dict() for name, stats in self.stats.items()},
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> TTSRouter:
+    """Process-wide router over the providers named in TTS_PROVIDERS."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                providers = []
+                for name in getattr(settings, "TTS_PROVIDERS", ["a4f"]):
+                    if name not in PROVIDERS:
+                        raise ValueError(f"Unknown TTS provider: {name}")
+                    try:
+                        providers.append(PROVIDERS[name]())
+                    except Exception:
+                        logger.exception("TTS provider %s could not be initialised; skipping it", name)
+                if not providers:
+                    raise TTSProviderError("No TTS providers available")
+                _router = TTSRouter(providers)
+    return _router
@@ -10,13 +10,21 @@ urlpatterns = [
     path('show-news-script/', views.get_all_news_script, name='show-news-script'),
     path('ask-gemini/', views.ask_gemini, name='ask-gemini'),
     path('tts/<int:news_id>/', views.tts_news_by_id, name='tts-news'),
+    path('tts/<int:news_id>/stream/', views.tts_stream_by_id, name='tts-stream'),
+    path('tts/render-missing/', views.tts_render_missing, name='tts-render-missing'),
+    path('tts/cache-stats/', views.tts_cache_stats, name='tts-cache-stats'),
+    path('tts/providers/', views.tts_provider_stats, name='tts-provider-stats'),
     path('avatar/<int:news_id>/', views.generate_avatar_video, name='avatar-video'),
+    path('jobs/stats/', views.render_queue_stats, name='render-queue-stats'),
+    path('jobs/<int:job_id>/', views.render_job_status, name='render-job-status'),
+    path('jobs/<int:job_id>/cancel/', views.cancel_render_job, name='render-job-cancel'),
 
     # Utility and monitoring endpoints
     path('check-ffmpeg/', views.check_ffmpeg, name='check-ffmpeg'),
     path('video-status/<int:news_id>/', views.get_video_status, name='video-status'),
 
     path('check-video/<int:news_id>/', views.check_video_exists, name='check_video_exists'),
+    path('news_videos/hls/<int:news_id>/<path:name>', views.serve_hls, name='serve_hls'),
     path('news_videos/<str:filename>', views.serve_video, name='serve_video'),
 ]
 
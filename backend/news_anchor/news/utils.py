@@ -1,4 +1,61 @@
-from .news_fetcher import fetch_and_store_news
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from .news_fetcher import fetch_and_store_news, fetch_all_news
+
+logger = logging.getLogger(__name__)
+
 
 def update_news(category=None):
-    fetch_and_store_news(category)
+    # ?category=all refreshes every NewsAPI category concurrently
+    if category == "all":
+        return fetch_all_news()
+    return fetch_and_store_news(category)
+
+
+@contextmanager
+def atomic_output(target):
+    """
+    Yield a temporary path next to `target`; when the block succeeds it is
+    renamed over `target` in one step, so readers never see a partial file.
+    The temp file is removed if the block raises.
+    """
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{target.stem}.", suffix=f".tmp{target.suffix}", dir=target.parent)
+    os.close(fd)
+    tmp = Path(tmp)
+    try:
+        yield tmp
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def write_atomic(target, data: bytes):
+    with atomic_output(target) as tmp:
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+
+def link_or_copy(source, target) -> bool:
+    """
+    Hard-link source to target (copy if linking is not possible). Either way
+    the result is renamed into place, so target is never seen half-copied.
+    """
+    try:
+        with atomic_output(target) as tmp:
+            tmp.unlink()
+            try:
+                os.link(source, tmp)
+            except OSError:
+                shutil.copyfile(source, tmp)
+        return True
+    except Exception as e:
+        logger.warning("Could not reuse %s as %s: %s", source, target, e)
+        return False
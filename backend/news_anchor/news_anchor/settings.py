@@ -151,7 +151,198 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 
+# Rows per INSERT/UPDATE statement when bulk-storing fetched articles
+NEWS_BULK_BATCH_SIZE = int(os.getenv("NEWS_BULK_BATCH_SIZE", "500"))
+
+# Concurrent NewsAPI ingestion (news_fetcher.fetch_all_news).
+# NEWS_FETCH_PAGES is an upper bound: paging stops at already-seen articles.
+NEWS_FETCH_MAX_WORKERS = int(os.getenv("NEWS_FETCH_MAX_WORKERS", "8"))
+NEWS_FETCH_TIMEOUT = float(os.getenv("NEWS_FETCH_TIMEOUT", "10"))
+NEWS_FETCH_PAGES = int(os.getenv("NEWS_FETCH_PAGES", "1"))
+NEWS_FETCH_PAGE_SIZE = int(os.getenv("NEWS_FETCH_PAGE_SIZE", "100"))
+# NEWS_FETCH_SPECULATIVE_FALLBACK requests the 'everything' feed alongside the headlines
+# instead of only after they come back empty (one extra NewsAPI call per run).
+NEWS_FETCH_SPECULATIVE_FALLBACK = os.getenv("NEWS_FETCH_SPECULATIVE_FALLBACK", "0") == "1"
+
+# Near-duplicate detection at ingest (news/dedup.py); must stay below 4 (LSH bands)
+NEWS_DEDUP_ENABLED = os.getenv("NEWS_DEDUP_ENABLED", "1") == "1"
+NEWS_DEDUP_MAX_HAMMING = int(os.getenv("NEWS_DEDUP_MAX_HAMMING", "3"))
+
+# Background ingest scheduler (manage.py run_ingest_daemon).
+# NEWS_INGEST_TRIGGER: 'queue' only flags the requested category for the daemon;
+# 'thread' (no daemon running) also fetches just that category in a background thread.
+NEWS_INGEST_INTERVAL = int(os.getenv("NEWS_INGEST_INTERVAL", "900"))
+NEWS_INGEST_CATEGORY_INTERVALS = {}
+NEWS_INGEST_JITTER = float(os.getenv("NEWS_INGEST_JITTER", "0.1"))
+NEWS_INGEST_BACKOFF_BASE = int(os.getenv("NEWS_INGEST_BACKOFF_BASE", "60"))
+NEWS_INGEST_BACKOFF_MAX = int(os.getenv("NEWS_INGEST_BACKOFF_MAX", "3600"))
+NEWS_INGEST_LOCK_TIMEOUT = int(os.getenv("NEWS_INGEST_LOCK_TIMEOUT", "600"))
+NEWS_INGEST_MAX_WORKERS = int(os.getenv("NEWS_INGEST_MAX_WORKERS", "2"))
+NEWS_INGEST_TRIGGER = os.getenv("NEWS_INGEST_TRIGGER", "queue")
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# LLM backend for script generation (news/llm_backends.py): 'gemini' or the
+# offline 'stub' used for load tests and benchmarks.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "1.0"))
+LLM_STUB_JITTER = float(os.getenv("LLM_STUB_JITTER", "0.2"))
+LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+
+# Bulk script generation (news/script_generation.py). GEMINI_REQUESTS_PER_MINUTE
+# should match the Gemini quota; 0 disables the rate limiter.
+SCRIPT_GENERATION_WORKERS = int(os.getenv("SCRIPT_GENERATION_WORKERS", "4"))
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "10"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "2"))
+# Articles per structured-output prompt; 1 keeps one Gemini call per article
+SCRIPT_BATCH_SIZE = int(os.getenv("SCRIPT_BATCH_SIZE", "1"))
+
+# Content-addressed LLM response cache (news/llm_cache.py)
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "50"))
+LLM_CACHE_TOUCH_INTERVAL = int(os.getenv("LLM_CACHE_TOUCH_INTERVAL", "300"))
+
+# Bulk TTS pre-rendering (manage.py render_tts, /api/tts/render-missing/)
+TTS_RENDER_WORKERS = int(os.getenv("TTS_RENDER_WORKERS", "4"))
+# Byte quota for the content-addressed audio store (news_audios/blobs/), LRU-evicted
+TTS_AUDIO_CACHE_MAX_BYTES = int(os.getenv("TTS_AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Blobs saved/accessed this recently are never evicted (a concurrent render may not have linked them yet)
+TTS_AUDIO_EVICT_GRACE = int(os.getenv("TTS_AUDIO_EVICT_GRACE", "300"))
+# Sentence-chunked synthesis: used by /api/tts/<id>/stream/ and, with TTS_CHUNKED, for stored audio too
+TTS_CHUNKED = os.getenv("TTS_CHUNKED", "false").lower() in ("1", "true", "yes")
+TTS_CHUNK_WORKERS = int(os.getenv("TTS_CHUNK_WORKERS", "4"))
+TTS_CHUNK_MIN_CHARS = int(os.getenv("TTS_CHUNK_MIN_CHARS", "80"))
+
+# Media downloads (news/media_serving.py). MEDIA_SENDFILE hands the transfer to the front proxy:
+# "x-accel-redirect" (nginx: an `internal` location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to BASE_DIR)
+# or "x-sendfile" (Apache/lighttpd). Empty = Django streams the file itself.
+MEDIA_SENDFILE = os.getenv("MEDIA_SENDFILE", "")
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+MEDIA_CACHE_CONTROL = os.getenv("MEDIA_CACHE_CONTROL", "public, max-age=3600")
+
+# ElevenLabs (news/services/elevenlabs_service.py). Point ELEVENLABS_BASE_URL at
+# news/services/elevenlabs_stub.py (e.g. http://127.0.0.1:8765/v1) for tests and benchmarks.
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "")
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")
+ELEVENLABS_TIMEOUT = float(os.getenv("ELEVENLABS_TIMEOUT", "30"))
+ELEVENLABS_POOL_SIZE = int(os.getenv("ELEVENLABS_POOL_SIZE", "8"))
+ELEVENLABS_MAX_RETRIES = int(os.getenv("ELEVENLABS_MAX_RETRIES", "3"))
+ELEVENLABS_BACKOFF_BASE = float(os.getenv("ELEVENLABS_BACKOFF_BASE", "0.5"))
+ELEVENLABS_BACKOFF_MAX = float(os.getenv("ELEVENLABS_BACKOFF_MAX", "30"))
+ELEVENLABS_VOICES_TTL = int(os.getenv("ELEVENLABS_VOICES_TTL", "3600"))
+
+# TTS provider routing (news/tts_router.py): providers in preference order. A request that has
+# not answered within the provider's p95 latency is hedged to the next one; a provider is
+# skipped for TTS_CIRCUIT_COOLDOWN seconds after TTS_CIRCUIT_FAILURES consecutive failures.
+# ElevenLabs has its own voice, so by default it is only a fallback when ELEVENLABS_API_KEY is set.
+TTS_PROVIDERS = [
+    p.strip() for p in os.getenv("TTS_PROVIDERS", "a4f,elevenlabs" if ELEVENLABS_API_KEY else "a4f").split(",")
+    if p.strip()
+]
+TTS_ELEVENLABS_VOICE = os.getenv("TTS_ELEVENLABS_VOICE", "21m00Tcm4TlvDq8ikWAM")
+TTS_HEDGE_ENABLED = os.getenv("TTS_HEDGE_ENABLED", "1") == "1"
+TTS_HEDGE_DEFAULT_DELAY = float(os.getenv("TTS_HEDGE_DEFAULT_DELAY", "4"))  # until 5 latencies are known
+TTS_HEDGE_MIN_DELAY = float(os.getenv("TTS_HEDGE_MIN_DELAY", "0.5"))
+TTS_HEDGE_MAX_DELAY = float(os.getenv("TTS_HEDGE_MAX_DELAY", "15"))
+TTS_CIRCUIT_FAILURES = int(os.getenv("TTS_CIRCUIT_FAILURES", "5"))
+TTS_CIRCUIT_COOLDOWN = int(os.getenv("TTS_CIRCUIT_COOLDOWN", "60"))
+TTS_ROUTER_WINDOW = int(os.getenv("TTS_ROUTER_WINDOW", "200"))
+TTS_ROUTER_WORKERS = int(os.getenv("TTS_ROUTER_WORKERS", "16"))
+
+# Cached ffprobe results (news/media_probe.py; DB table + in-process LRU)
+MEDIA_PROBE_MEMORY_ENTRIES = int(os.getenv("MEDIA_PROBE_MEMORY_ENTRIES", "512"))
+MEDIA_PROBE_TIMEOUT = int(os.getenv("MEDIA_PROBE_TIMEOUT", "30"))
+
+# Avatar render job queue (news/render_queue.py).
+# RENDER_JOB_RUNNER: 'thread' runs queued jobs on RENDER_JOB_THREADS threads inside each web
+# process (a dispatcher started with the app polls the queue every RENDER_JOB_POLL_SECONDS
+# at most); 'worker' leaves them to `python manage.py run_render_worker`.
+RENDER_JOB_RUNNER = os.getenv("RENDER_JOB_RUNNER", "thread")
+RENDER_JOB_THREADS = int(os.getenv("RENDER_JOB_THREADS", "1"))
+RENDER_JOB_POLL_SECONDS = int(os.getenv("RENDER_JOB_POLL_SECONDS", "10"))
+RENDER_WORKER_PROCESSES = int(os.getenv("RENDER_WORKER_PROCESSES", "2"))
+RENDER_JOB_MAX_ATTEMPTS = int(os.getenv("RENDER_JOB_MAX_ATTEMPTS", "3"))
+RENDER_JOB_RETRY_BASE = int(os.getenv("RENDER_JOB_RETRY_BASE", "30"))
+RENDER_JOB_HEARTBEAT = int(os.getenv("RENDER_JOB_HEARTBEAT", "15"))
+RENDER_JOB_STALE_AFTER = int(os.getenv("RENDER_JOB_STALE_AFTER", "120"))
+
+# Single-flight leases (news/single_flight.py): one render per TTS text / article across processes.
+# Leases are renewed while the render runs and expire this long after a crashed leader.
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "60"))
+SINGLE_FLIGHT_WAIT_SECONDS = int(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", "900"))
+SINGLE_FLIGHT_POLL_SECONDS = float(os.getenv("SINGLE_FLIGHT_POLL_SECONDS", "0.5"))
+AVATAR_SINGLE_FLIGHT_WAIT = int(os.getenv("AVATAR_SINGLE_FLIGHT_WAIT", "1800"))
+# /api/tts/<id>/stream/ waits this briefly for a concurrent render of the same text,
+# then answers 503 with Retry-After instead of holding the request thread
+TTS_STREAM_WAIT_SECONDS = float(os.getenv("TTS_STREAM_WAIT_SECONDS", "2"))
+TTS_STREAM_RETRY_AFTER = int(os.getenv("TTS_STREAM_RETRY_AFTER", "5"))
+
+# Audio/video merge (news/media_merge.py): stream copy is used whenever the codecs allow it;
+# otherwise video is re-encoded with libx264 at this preset/CRF. MEDIA_ENCODE_THREADS 0 = the
+# render's share of the cores from the CPU scheduler (news/scheduler.py).
+MEDIA_ENCODE_PRESET = os.getenv("MEDIA_ENCODE_PRESET", "veryfast")
+MEDIA_ENCODE_CRF = int(os.getenv("MEDIA_ENCODE_CRF", "23"))
+MEDIA_ENCODE_THREADS = int(os.getenv("MEDIA_ENCODE_THREADS", "0"))
+MEDIA_AUDIO_BITRATE = os.getenv("MEDIA_AUDIO_BITRATE", "192k")
+MEDIA_FFMPEG_TIMEOUT = int(os.getenv("MEDIA_FFMPEG_TIMEOUT", "600"))
+
+# Segmented avatar rendering (news/segmented_render.py): the TTS audio is cut at silences into one
+# piece per worker (AVATAR_SEGMENT_WORKERS, 0 = CPU count), pieces are lip-synced in parallel
+# processes and joined without re-encoding. AVATAR_SEGMENT_FPS must match the generator's frame rate.
+AVATAR_SEGMENTED = os.getenv("AVATAR_SEGMENTED", "false").lower() in ("1", "true", "yes")
+AVATAR_SEGMENT_WORKERS = int(os.getenv("AVATAR_SEGMENT_WORKERS", "0"))
+AVATAR_SEGMENT_MIN_SECONDS = float(os.getenv("AVATAR_SEGMENT_MIN_SECONDS", "5"))
+AVATAR_SEGMENT_FPS = int(os.getenv("AVATAR_SEGMENT_FPS", "25"))
+AVATAR_SILENCE_NOISE_DB = int(os.getenv("AVATAR_SILENCE_NOISE_DB", "-35"))
+AVATAR_SILENCE_MIN_SECONDS = float(os.getenv("AVATAR_SILENCE_MIN_SECONDS", "0.25"))
+
+# CPU admission control (news/scheduler.py). Lip-sync/encode work needs one of RENDER_SLOTS CPU slots
+# (0 = CPU count / RENDER_THREADS_PER_JOB). New jobs get 429 once RENDER_QUEUE_MAX are waiting and
+# 503 while the 1-minute load average per core is above RENDER_OVERLOAD_LOAD (0 disables the check).
+RENDER_SLOTS = int(os.getenv("RENDER_SLOTS", "0"))
+RENDER_THREADS_PER_JOB = int(os.getenv("RENDER_THREADS_PER_JOB", "2"))
+RENDER_SLOT_WAIT_SECONDS = int(os.getenv("RENDER_SLOT_WAIT_SECONDS", "3600"))
+RENDER_QUEUE_MAX = int(os.getenv("RENDER_QUEUE_MAX", "20"))
+RENDER_OVERLOAD_LOAD = float(os.getenv("RENDER_OVERLOAD_LOAD", "2.0"))
+RENDER_OVERLOAD_RETRY_AFTER = int(os.getenv("RENDER_OVERLOAD_RETRY_AFTER", "30"))
+RENDER_DEFAULT_JOB_SECONDS = int(os.getenv("RENDER_DEFAULT_JOB_SECONDS", "120"))
+
+# Batch bulletin builder (manage.py build_bulletin, news/bulletin.py): workers per pipeline stage.
+# BULLETIN_RENDER_WORKERS 0 = one per CPU slot.
+BULLETIN_SCRIPT_WORKERS = int(os.getenv("BULLETIN_SCRIPT_WORKERS", "2"))
+BULLETIN_TTS_WORKERS = int(os.getenv("BULLETIN_TTS_WORKERS", "2"))
+BULLETIN_RENDER_WORKERS = int(os.getenv("BULLETIN_RENDER_WORKERS", "0"))
+
+# Bulletin compositor (news/compositor.py): clips are normalized once to this profile so the daily
+# bulletin is assembled with stream copy. BULLETIN_NORMALIZE_ON_RENDER does it right after each render.
+# Intro/outro/transition clips are optional file paths.
+BULLETIN_VIDEO_WIDTH = int(os.getenv("BULLETIN_VIDEO_WIDTH", "1280"))
+BULLETIN_VIDEO_HEIGHT = int(os.getenv("BULLETIN_VIDEO_HEIGHT", "720"))
+BULLETIN_VIDEO_FPS = int(os.getenv("BULLETIN_VIDEO_FPS", "25"))
+BULLETIN_AUDIO_SAMPLE_RATE = int(os.getenv("BULLETIN_AUDIO_SAMPLE_RATE", "48000"))
+BULLETIN_AUDIO_BITRATE = os.getenv("BULLETIN_AUDIO_BITRATE", "128k")
+BULLETIN_PODCAST_SAMPLE_RATE = int(os.getenv("BULLETIN_PODCAST_SAMPLE_RATE", "44100"))
+BULLETIN_PODCAST_BITRATE = os.getenv("BULLETIN_PODCAST_BITRATE", "128k")
+BULLETIN_NORMALIZE_ON_RENDER = os.getenv("BULLETIN_NORMALIZE_ON_RENDER", "true").lower() in ("1", "true", "yes")
+BULLETIN_INTRO_CLIP = os.getenv("BULLETIN_INTRO_CLIP", "")
+BULLETIN_OUTRO_CLIP = os.getenv("BULLETIN_OUTRO_CLIP", "")
+BULLETIN_TRANSITION_CLIP = os.getenv("BULLETIN_TRANSITION_CLIP", "")
+BULLETIN_KEEP = int(os.getenv("BULLETIN_KEEP", "10"))
+
+# Anchor face passed to the avatar generator ('' = the module's default face). Its preprocessing
+# (face detection, crops, landmarks) is cached per image hash + model version in face_cache/.
+AVATAR_FACE_PATH = os.getenv("AVATAR_FACE_PATH", "")
+
+# HLS output (news/hls.py): after each render the mp4 is also packaged as fMP4 HLS under
+# news_videos/hls/<id>/ with one rendition per "height:bitrate" entry (taller than the source = skipped).
+HLS_ENABLED = os.getenv("HLS_ENABLED", "true").lower() in ("1", "true", "yes")
+HLS_RENDITIONS = os.getenv("HLS_RENDITIONS", "720:2500k,480:1200k,360:600k")
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+HLS_AUDIO_BITRATE = os.getenv("HLS_AUDIO_BITRATE", "128k")
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
@@ -159,3 +350,4 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
+
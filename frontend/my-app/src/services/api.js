@@ -33,6 +33,9 @@ export const newsAPI = {
 
     /*** Get video URL for playing - FIXED*/
     getVideoUrl: (newsId) => `${API_BASE_URL}/news_videos/${newsId}.mp4`,
+
+    /*** HLS master playlist (adaptive bitrate); check-video reports whether it exists*/
+    getHlsUrl: (newsId) => `${API_BASE_URL}/news_videos/hls/${newsId}/master.m3u8`,
 };
 
 export default api;
\ No newline at end of file